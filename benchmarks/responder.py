@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+"""
+Loopback MTM/PIP stand-in
+
+Speaks enough of the MTM framing and PIP sign on, SQL and MRPC messages to
+drive fispip clients without a real GT.M/PIP server:
+
+* sign on always succeeds (token "BENCH")
+* OPEN CURSOR / FETCH return /ROWS= rows, `sql_size` bytes in total
+* other SQL statements (including CLOSE) succeed with no rows
+* MRPCs reply with `mrpc_size` bytes
+* grouped-record messages get one successful reply per record
+"""
+
+# used only to make sure this loads fispip module inside this project
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir))
+
+import re
+import socket
+import struct
+import threading
+
+from fispip import lv
+from fispip.mysix import makebytes
+
+
+_ROWS = re.compile(br'/ROWS=(\d+)')
+
+
+class LoopbackPIP(object):
+    def __init__(self, sql_size=1024, mrpc_size=16, host='127.0.0.1',
+                 port=0):
+        self.sql_size = sql_size
+        self.mrpc_size = mrpc_size
+        self._header = struct.Struct('!h')
+        self._listener = socket.socket()
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((host, port))
+        self._listener.listen(128)
+        self.host, self.port = self._listener.getsockname()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._accept)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._listener.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._listener.accept()
+            except (socket.error, OSError):
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            t = threading.Thread(target=self._serve, args=(conn,))
+            t.daemon = True
+            t.start()
+
+    def _serve(self, conn):
+        f = conn.makefile('rb')
+        try:
+            while True:
+                header = f.read(2)
+                if len(header) < 2:
+                    return
+                length = self._header.unpack(header)[0] - 2
+                frame = f.read(length)
+                reply = self.reply(frame)
+                conn.sendall(self._header.pack(len(reply) + 2) + reply)
+        except (socket.error, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def reply(self, frame):
+        # drop server type prefix
+        frame = frame[frame.find(b'\x1c') + 1:]
+        header, message = lv.unpack(frame)[:2]
+        header = [bytes(v) for v in lv.unpack(header)]
+        service_class, msgid, grp_recs = header[0], header[2], header[4]
+
+        if service_class == b'0':
+            data = bytes(lv.pack([b'BENCH']))
+        elif grp_recs:
+            data = bytes(lv.pack([
+                lv.pack([b'0', self._sql(bytes(record))])
+                for record in lv.unpack(message)
+            ]))
+        elif service_class == b'5':
+            data = self._sql(bytes(message))
+        else:
+            data = b'x' * self.mrpc_size
+
+        reply_header = lv.pack([service_class, b'BENCH', msgid, b'0', b''])
+        return b'0' + bytes(lv.pack([reply_header, lv.pack([b'0', data])]))
+
+    def _sql(self, message):
+        query, modifiers = [bytes(v) for v in lv.unpack(message)[:2]]
+        rows = []
+        if query.startswith(b'OPEN CURSOR') or query.startswith(b'FETCH'):
+            m = _ROWS.search(modifiers)
+            count = int(m.group(1)) if m else 30
+            rows = [b'r' * max(1, self.sql_size // count)] * count
+        return bytes(lv.pack([
+            b'', b'', makebytes(str(len(rows))), b'\r\n'.join(rows), b'', b'T'
+        ]))
+
+
+if __name__ == '__main__':
+    import time
+    server = LoopbackPIP(port=int(sys.argv[1]) if len(sys.argv) > 1 else 0)
+    server.start()
+    print('Listening on %s:%d' % (server.host, server.port))
+    while True:
+        time.sleep(3600)
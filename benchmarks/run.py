@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+
+"""
+fispip benchmarks
+
+Runs LV codec microbenchmarks and end-to-end SQL/MRPC benchmarks against
+the loopback responder (no PIP server or network access needed), prints a
+summary and optionally saves the results as JSON, to be compared with a
+previous run:
+
+    python benchmarks/run.py -o before.json
+    ... change things ...
+    python benchmarks/run.py -o after.json -c before.json
+"""
+
+# used only to make sure this loads fispip module inside this project
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir))
+
+import argparse
+import json
+import platform
+import threading
+import time
+import timeit
+
+import fispip
+from fispip import MTM, PIP
+from fispip.mysix import _monotonic
+
+from benchmarks.responder import LoopbackPIP
+
+
+# payloads have to fit in a reply frame, along with its headers and the
+# row separators
+MAX_SIZE = MTM.max_frame - 1024
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = int(round(pct / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def micro(number):
+    pip = PIP()
+    short_fields = ['x' * (i % 30) for i in range(100)]
+    long_fields = ['x' * (250 + i) for i in range(100)]
+    cases = [
+        ('pack_lv short x100', lambda: pip._pack_lv(short_fields)),
+        ('pack_lv long x100', lambda: pip._pack_lv(long_fields)),
+    ]
+    for name, fields in (('short', short_fields), ('long', long_fields)):
+        packed = pip._pack_lv(fields)
+        cases.append((
+            'unpack_lv %s x100' % name,
+            lambda packed=packed: pip._unpack_lv(packed)
+        ))
+    packed = pip._pack_lv(long_fields)
+    cases.append(('calc_size long', lambda: pip._calc_size(packed)))
+
+    results = []
+    for name, f in cases:
+        # best of 3, as timeit recommends
+        elapsed = min(timeit.repeat(f, number=number, repeat=3))
+        results.append({
+            'name': name,
+            'ops_per_sec': number / elapsed,
+            'usec_per_op': elapsed / number * 1e6,
+        })
+    return results
+
+
+def _worker(server, operation, count, latencies, errors):
+    try:
+        pip = PIP()
+        pip.connect(server.host, server.port, '1', 'XXX')
+        for _ in range(count):
+            start = _monotonic()
+            operation(pip)
+            latencies.append(_monotonic() - start)
+        pip.close()
+    except Exception as e:
+        errors.append(e)
+
+
+def end_to_end(sizes, concurrency_levels, count):
+    operations = [
+        ('mrpc', lambda pip: pip.executeMRPC('1', 'param')),
+        ('sql_select', lambda pip: pip.executeSQL('SELECT A FROM T')),
+        ('sql_update', lambda pip: pip.executeSQL(
+            'UPDATE T SET A = ? WHERE B = ?', 'x', 'y'
+        )),
+    ]
+
+    results = []
+    for size in sizes:
+        with LoopbackPIP(sql_size=size, mrpc_size=size) as server:
+            for name, operation in operations:
+                for concurrency in concurrency_levels:
+                    latencies = []
+                    errors = []
+                    threads = [
+                        threading.Thread(
+                            target=_worker,
+                            args=(server, operation, count, latencies, errors)
+                        )
+                        for _ in range(concurrency)
+                    ]
+                    start = _monotonic()
+                    for t in threads:
+                        t.start()
+                    for t in threads:
+                        t.join()
+                    elapsed = _monotonic() - start
+                    if errors:
+                        raise errors[0]
+
+                    latencies.sort()
+                    results.append({
+                        'name': name,
+                        'payload_size': size,
+                        'concurrency': concurrency,
+                        'ops': len(latencies),
+                        'ops_per_sec': len(latencies) / elapsed,
+                        'p50_ms': percentile(latencies, 50) * 1000,
+                        'p90_ms': percentile(latencies, 90) * 1000,
+                        'p99_ms': percentile(latencies, 99) * 1000,
+                        'max_ms': latencies[-1] * 1000,
+                    })
+    return results
+
+
+def _key(result):
+    return (
+        result['name'],
+        result.get('payload_size'),
+        result.get('concurrency')
+    )
+
+
+def compare(results, baseline):
+    """
+    Returns lines with the ops/sec ratio of each result to the baseline
+    """
+    lines = []
+    for section in ('micro', 'e2e'):
+        old = dict((_key(r), r) for r in baseline.get(section, []))
+        for r in results[section]:
+            b = old.get(_key(r))
+            if b is None:
+                continue
+            lines.append('%-45s %8.2fx' % (
+                ' '.join(str(k) for k in _key(r) if k is not None),
+                r['ops_per_sec'] / b['ops_per_sec']
+            ))
+    return lines
+
+
+def _sizes(value):
+    sizes = [int(x) for x in value.split(',')]
+    for size in sizes:
+        if not 0 < size <= MAX_SIZE:
+            raise argparse.ArgumentTypeError(
+                'sizes must be between 1 and %d' % MAX_SIZE
+            )
+    return sizes
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='fispip benchmarks')
+    parser.add_argument(
+        '-o', '--output',
+        dest='output', action='store',
+        metavar='FILE',
+        help='Save results as JSON'
+    )
+    parser.add_argument(
+        '-c', '--compare',
+        dest='compare', action='store',
+        metavar='FILE',
+        help='Compare with results previously saved'
+    )
+    parser.add_argument(
+        '-s', '--sizes',
+        dest='sizes', action='store', type=_sizes,
+        metavar='N,N...', default='16,1024,16384',
+        help='Payload sizes, in bytes, up to %d (default: 16,1024,16384)'
+             % MAX_SIZE
+    )
+    parser.add_argument(
+        '-j', '--concurrency',
+        dest='concurrency', action='store',
+        metavar='N,N...', default='1,4,16',
+        help='Concurrent sessions (default: 1,4,16)'
+    )
+    parser.add_argument(
+        '-n', '--count',
+        dest='count', action='store',
+        metavar='N', type=int, default=200,
+        help='Requests per session (default: 200)'
+    )
+    parser.add_argument(
+        '--micro-number',
+        dest='micro_number', action='store',
+        metavar='N', type=int, default=2000,
+        help='Iterations per microbenchmark (default: 2000)'
+    )
+    return parser
+
+
+def main(args=None):
+    parser = build_parser()
+    args = parser.parse_args(args)
+
+    results = {
+        'meta': {
+            'fispip': fispip.__version__,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'micro': micro(args.micro_number),
+        'e2e': end_to_end(
+            args.sizes,
+            [int(x) for x in args.concurrency.split(',')],
+            args.count
+        ),
+    }
+
+    for r in results['micro']:
+        print('%-25s %12.0f ops/s %10.2f us' % (
+            r['name'], r['ops_per_sec'], r['usec_per_op']
+        ))
+    for r in results['e2e']:
+        print(
+            '%-12s size=%-6d conc=%-3d %9.0f ops/s '
+            'p50=%.3fms p90=%.3fms p99=%.3fms' % (
+                r['name'], r['payload_size'], r['concurrency'],
+                r['ops_per_sec'], r['p50_ms'], r['p90_ms'], r['p99_ms']
+            )
+        )
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print('\nops/sec relative to %s:' % args.compare)
+        for line in compare(results, baseline):
+            print(line)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,25 @@
 import argparse
+import csv
+import json
+import os
+import shlex
+import signal
+import sys
 from . import __description__, __program__
 from . import PIP
+from . import parallel
+from . import timeouts
+from .agent import Agent, AgentClient
+from .mysix import _monotonic
+from .pool import PIPPool
+from .shell import Shell
 
 
-def build_parser():
-    parser = argparse.ArgumentParser(
-        prog=__program__,
-        description=__description__
-    )
+def _connection_parser():
+    """
+    Options shared by every command, to reach and sign on to PIP
+    """
+    parser = argparse.ArgumentParser(add_help=False)
     parser.add_argument(
         '-u', '--user',
         dest='user', action='store',
@@ -32,14 +44,38 @@ def build_parser():
         metavar='TYPE', default='SCA$IBS',
         help='PIP server type (default: SCA$IBS)'
     )
+    parser.add_argument(
+        '-A', '--agent',
+        dest='agent', action='store',
+        metavar='SOCKET', default=None,
+        help='Agent socket (default: $FISPIP_AGENT or a socket in a '
+             'private per-user directory)'
+    )
+    parser.add_argument(
+        'host', metavar='host',
+        help='Hostname to connect'
+    )
+    return parser
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog=__program__,
+        description=__description__,
+        epilog='Other commands: agent, batch, shell (see %s COMMAND -h)' % (
+            __program__
+        ),
+        parents=[_connection_parser()]
+    )
     parser.add_argument(
         '-s', '--sql',
         dest='sql', action='store_true',
         help='Execute SQL statement (default action is RPC)'
     )
     parser.add_argument(
-        'host', metavar='host',
-        help='Hostname to connect'
+        '-n', '--no-agent',
+        dest='no_agent', action='store_true',
+        help='Connect directly even if an agent is running'
     )
     parser.add_argument(
         'params', nargs='+',
@@ -52,12 +88,332 @@ def build_parser():
     return parser
 
 
+def build_agent_parser():
+    parser = argparse.ArgumentParser(
+        prog=__program__ + ' agent',
+        description='Keep signed-on sessions open for the CLI behind a '
+                    'UNIX socket, printing the shell commands to use it',
+        parents=[_connection_parser()]
+    )
+    parser.add_argument(
+        '-c', '--sessions',
+        dest='sessions', action='store',
+        metavar='N', type=int, default=4,
+        help='Maximum number of sessions (default: 4)'
+    )
+    parser.add_argument(
+        '-D', '--foreground',
+        dest='foreground', action='store_true',
+        help='Do not fork into the background'
+    )
+    return parser
+
+
+def build_batch_parser():
+    parser = argparse.ArgumentParser(
+        prog=__program__ + ' batch',
+        description='Run SQL statements, or MRPCs as ":mrpc ID [PARAM...]", '
+                    'one per line, streaming results with their timing. '
+                    'SELECTs return every row, fetched through a cursor',
+        parents=[_connection_parser()]
+    )
+    parser.add_argument(
+        '-f', '--file',
+        dest='file', action='store',
+        metavar='FILE', default='-',
+        help='Statements file (default: - for stdin)'
+    )
+    parser.add_argument(
+        '-o', '--format',
+        dest='format', action='store',
+        choices=('csv', 'jsonl'), default='jsonl',
+        help='Output format (default: jsonl)'
+    )
+    parser.add_argument(
+        '-c', '--concurrency',
+        dest='concurrency', action='store',
+        metavar='N', type=int, default=1,
+        help='Sessions to run statements over, results being written as '
+             'they complete (default: 1, in order)'
+    )
+    parser.add_argument(
+        '-t', '--timeout',
+        dest='timeout', action='store',
+        metavar='SECONDS', type=float, default=None,
+        help='Deadline for each statement'
+    )
+    parser.add_argument(
+        '-n', '--no-agent',
+        dest='no_agent', action='store_true',
+        help='Connect directly even if an agent is running'
+    )
+    return parser
+
+
+def build_shell_parser():
+    return argparse.ArgumentParser(
+        prog=__program__ + ' shell',
+        description='Interactive SQL/MRPC shell over a single session',
+        parents=[_connection_parser()]
+    )
+
+
+def connect(args, use_agent=True):
+    """
+    Session for the parsed connection options: the agent, if one is
+    running for the same host, port, user and server type, or a new one
+    """
+    if use_agent:
+        client = AgentClient.connect(
+            args.host, args.port, args.user, args.server, args.agent
+        )
+        if client is not None:
+            return client
+
+    pip = PIP(args.server)
+    pip.connect(args.host, args.port, args.user, args.password)
+    return pip
+
+
+def agent(args=None):
+    args = build_agent_parser().parse_args(args)
+
+    # sign on before forking, so that bad credentials are reported
+    pool = PIPPool(
+        args.host, args.port, args.user, args.password, args.server,
+        max_size=args.sessions
+    )
+    # bind before forking too, so that socket errors are reported
+    try:
+        server = Agent(pool, args.agent).bind()
+    except Exception:
+        pool.close()
+        raise
+
+    if not args.foreground:
+        sys.stdout.flush()
+        pid = os.fork()
+        if pid:
+            print('FISPIP_AGENT=%s; export FISPIP_AGENT;' % server.path)
+            print('FISPIP_AGENT_PID=%d; export FISPIP_AGENT_PID;' % pid)
+            # _exit does not flush, and sessions now belong to the child
+            sys.stdout.flush()
+            os._exit(0)
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+
+    server.start()
+    if args.foreground:
+        print('FISPIP_AGENT=%s; export FISPIP_AGENT;' % server.path)
+        sys.stdout.flush()
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        while True:
+            signal.pause()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.stop()
+
+
+def batch(args=None):
+    args = build_batch_parser().parse_args(args)
+
+    source = sys.stdin if args.file == '-' else open(args.file)
+    # position -> command line, until its result is written
+    lines = {}
+
+    def commands():
+        position = 0
+        for line in source:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            lines[position] = line
+            position += 1
+            yield _batch_call(line)
+
+    if args.format == 'csv':
+        output = _CSVOutput(sys.stdout)
+    else:
+        output = _JSONLOutput(sys.stdout)
+
+    pool = None
+    if args.concurrency > 1:
+        pool = PIPPool(
+            args.host, args.port, args.user, args.password, args.server,
+            max_size=args.concurrency
+        )
+        results = parallel.imap_unordered(
+            pool, commands(), args.concurrency, args.timeout
+        )
+    else:
+        results = _run_serial(
+            lambda: connect(args, not args.no_agent), commands(), args.timeout
+        )
+
+    try:
+        for i, result, seconds in results:
+            output.write(i + 1, lines.pop(i), result, seconds)
+    finally:
+        results.close()
+        if pool is not None:
+            pool.close()
+        if source is not sys.stdin:
+            source.close()
+
+
+def shell(args=None):
+    args = build_shell_parser().parse_args(args)
+    # cursors and max_rows need a session of our own, not the agent's
+    pip = connect(args, use_agent=False)
+    try:
+        Shell(pip).run()
+    finally:
+        pip.close()
+
+
+def _batch_call(line):
+    if line.startswith(':mrpc'):
+        return ('executeMRPC', tuple(shlex.split(line[5:])))
+    if line[:6].lower() == 'select':
+        return (_select, (line,))
+    return ('executeSQL', (line,))
+
+
+def _select(pip, query):
+    """
+    Every row of a SELECT, in the (rows, types) of executeSQL which stops
+    at max_rows
+    """
+    if isinstance(pip, AgentClient):
+        return pip.select(query)
+    cursor = pip.cursor(query)
+    return cursor.fetchall(), cursor.types
+
+
+def _run_serial(connect, calls, timeout):
+    """
+    Same results as parallel.imap_unordered, over a single session from
+    connect(), replaced by a new one when it breaks (or a call times out)
+    """
+    pip = connect()
+    try:
+        for i, (method, args) in enumerate(calls):
+            start = _monotonic()
+            try:
+                if pip is None:
+                    pip = connect()
+                with timeouts.deadline(timeout):
+                    if callable(method):
+                        result = method(pip, *args)
+                    else:
+                        result = getattr(pip, method)(*args)
+            except Exception as e:
+                result = e
+                if pip is not None and _is_broken(e):
+                    _close(pip)
+                    pip = None
+            yield i, result, _monotonic() - start
+    finally:
+        if pip is not None:
+            pip.close()
+
+
+def _is_broken(exc):
+    if isinstance(exc, EnvironmentError):
+        return True
+    return bool(exc.args) and exc.args[0] in (
+        PIPPool.broken_errors + ('AGENT_ERROR',)
+    )
+
+
+def _close(pip):
+    try:
+        pip.close()
+    except Exception:
+        pass
+
+
+class _JSONLOutput(object):
+    """
+    One object per command, with either rows and types (SQL), result (MRPC)
+    or error
+    """
+    def __init__(self, out):
+        self._out = out
+
+    def write(self, seq, command, result, seconds):
+        record = {
+            'seq': seq,
+            'command': command,
+            'elapsed_ms': round(seconds * 1000, 3),
+        }
+        if isinstance(result, Exception):
+            record['error'] = [str(a) for a in result.args]
+        elif isinstance(result, tuple):
+            record['rows'] = [row.split('\t') for row in _rows(result)]
+            record['types'] = result[1]
+        else:
+            record['result'] = result
+        self._out.write(json.dumps(record) + '\n')
+        self._out.flush()
+
+
+class _CSVOutput(object):
+    """
+    One record per result row (or per command, for MRPCs, errors and SQL
+    without rows): seq, elapsed_ms, status (ok or the error code) and the
+    values
+    """
+    def __init__(self, out):
+        self._out = out
+        self._writer = csv.writer(out)
+        self._writer.writerow(['seq', 'elapsed_ms', 'status', 'values'])
+
+    def write(self, seq, command, result, seconds):
+        prefix = [seq, '%.3f' % (seconds * 1000)]
+        if isinstance(result, Exception):
+            self._writer.writerow(prefix + [str(a) for a in result.args])
+        elif isinstance(result, tuple):
+            rows = _rows(result)
+            for row in rows:
+                self._writer.writerow(prefix + ['ok'] + row.split('\t'))
+            if not rows:
+                self._writer.writerow(prefix + ['ok'])
+        else:
+            self._writer.writerow(prefix + ['ok', result])
+        self._out.flush()
+
+
+def _rows(sql_result):
+    rows = sql_result[0]
+    # executeSQL returns a single empty row for no rows
+    if rows == ['']:
+        return []
+    return rows
+
+
+COMMANDS = {
+    'agent': agent,
+    'batch': batch,
+    'shell': shell,
+}
+
+
 def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    if args and args[0] in COMMANDS:
+        return COMMANDS[args[0]](args[1:])
+
     parser = build_parser()
     args = parser.parse_args(args)
 
-    pip = PIP(args.server)
-    pip.connect(args.host, args.port, args.user, args.password)
+    pip = connect(args, not args.no_agent)
 
     if args.sql:
         rows, _ = pip.executeSQL(' '.join(args.params))
@@ -0,0 +1,278 @@
+"""
+Agent keeping signed-on sessions warm behind a UNIX domain socket, so that
+short-lived processes (CLI calls from scripts) skip connect and sign on
+
+    $ eval $(python -m fispip agent -u 1 -p XXX localhost)
+    $ python -m fispip localhost -s 'SELECT TJD FROM CUVAR'
+
+The CLI uses the agent at $FISPIP_AGENT (or default_path()) when it serves
+the same host, port, user and server type, and connects directly otherwise.
+Requests and replies are JSON lines:
+
+    {"target": [host, port, user, server_type], "sql": [query, args...]}
+    {"target": [host, port, user, server_type], "select": [query, args...]}
+    {"target": [host, port, user, server_type], "mrpc": [id, args...]}
+    {"target": [host, port, user, server_type], "ping": true}
+    {"result": ...} or {"error": [code, message]}
+"""
+import json
+import os
+import socket
+import stat
+import tempfile
+import threading
+from . import timeouts
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+
+def default_path():
+    """
+    $FISPIP_AGENT, or a socket in a directory private to the current user:
+    $XDG_RUNTIME_DIR or a per-user directory in the temporary directory
+    """
+    path = os.environ.get('FISPIP_AGENT')
+    if path:
+        return path
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime:
+        return os.path.join(runtime, 'fispip-agent.sock')
+    uid = os.getuid() if hasattr(os, 'getuid') else 0
+    return os.path.join(
+        tempfile.gettempdir(), 'fispip-agent-%d' % uid, 'agent.sock'
+    )
+
+
+class Agent(object):
+    """
+    Serve requests over a UNIX socket with sessions from `pool`
+    """
+    def __init__(self, pool, path=None):
+        self.pool = pool
+        self.path = path or default_path()
+        host, port, user, _ = pool._connect_args
+        self.target = [host, port, user, pool._server_type]
+        self._server = None
+        self._thread = None
+
+    def bind(self):
+        """
+        Bind the socket (readable by the current user only), raising
+        AGENT_ERROR if it cannot be used. See start()
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        if not _private(directory):
+            raise Exception(
+                'AGENT_ERROR', '%s is writable by other users' % directory
+            )
+        if os.path.exists(self.path):
+            if _alive(self.path):
+                raise Exception(
+                    'AGENT_ERROR', 'Agent already running at %s' % self.path
+                )
+            os.unlink(self.path)
+
+        agent = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    reply = agent.handle(json.loads(line.decode('utf-8')))
+                    self.wfile.write(
+                        (json.dumps(reply) + '\n').encode('utf-8')
+                    )
+                    self.wfile.flush()
+
+        old_umask = os.umask(0o177)
+        try:
+            self._server = _Server(self.path, Handler)
+        finally:
+            os.umask(old_umask)
+        return self
+
+    def start(self):
+        """
+        Serve from a background thread, binding the socket first if bind()
+        was not called (a process can bind, then fork and serve from the
+        child)
+        """
+        if self._server is None:
+            self.bind()
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            if self._thread is not None:
+                self._server.shutdown()
+                self._thread = None
+            self._server.server_close()
+            self._server = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        self.pool.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def handle(self, request):
+        """
+        Returns the reply to one decoded request
+        """
+        if request.get('target') != self.target:
+            return {'error': ['AGENT_MISMATCH', 'Agent serves %s' % (
+                ':'.join(str(t) for t in self.target)
+            )]}
+        if 'ping' in request:
+            return {'result': True}
+        try:
+            with self.pool.connection() as pip:
+                if 'sql' in request:
+                    result = pip.executeSQL(*request['sql'])
+                elif 'select' in request:
+                    # every row, not just max_rows
+                    cursor = pip.cursor(*request['select'])
+                    result = (cursor.fetchall(), cursor.types)
+                else:
+                    result = pip.executeMRPC(*request['mrpc'])
+        except Exception as e:
+            return {'error': [str(a) for a in e.args]}
+        return {'result': result}
+
+
+class AgentClient(object):
+    """
+    executeSQL/executeMRPC through a running agent, see connect()
+    """
+    def __init__(self, sock, target):
+        self._socket = sock
+        self._file = sock.makefile('rwb')
+        self._target = target
+
+    @classmethod
+    def connect(cls, host, port, user, server_type='SCA$IBS', path=None):
+        """
+        Returns a client if an agent is listening at path (default_path())
+        for the same target, None otherwise.
+        Sockets that other users could have bound (not owned by the current
+        user, or in a directory they can write to) are not used
+        """
+        path = path or default_path()
+        if not _trusted(path):
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except socket.error:
+            sock.close()
+            return None
+
+        client = cls(sock, [host, port, user, server_type])
+        try:
+            client._request({'ping': True})
+        except Exception:
+            client.close()
+            return None
+        return client
+
+    def executeSQL(self, query, *args):
+        return tuple(self._request({'sql': [query] + list(args)}))
+
+    def executeMRPC(self, mrpc_id, *args):
+        return self._request({'mrpc': [mrpc_id] + list(args)})
+
+    def select(self, query, *args):
+        """
+        (rows, types) of a SELECT as executeSQL, but with every row
+        (fetched through a cursor by the agent)
+        """
+        return tuple(self._request({'select': [query] + list(args)}))
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def _request(self, request):
+        request['target'] = self._target
+        # same deadlines as direct sessions (see timeouts)
+        timeout = timeouts.remaining()
+        if timeout is not None and timeout <= 0:
+            self._timed_out()
+        self._socket.settimeout(timeout)
+        try:
+            self._file.write((json.dumps(request) + '\n').encode('utf-8'))
+            self._file.flush()
+            line = self._file.readline()
+        except socket.timeout:
+            self._timed_out()
+        if not line:
+            raise Exception('AGENT_ERROR', 'Agent closed the connection')
+        reply = json.loads(line.decode('utf-8'))
+        if 'error' in reply:
+            raise Exception(*reply['error'])
+        return reply['result']
+
+    def _timed_out(self):
+        # a late reply would be taken for the next one
+        self.close()
+        raise timeouts.MTMTimeout('MTM_TIMEOUT', 'Deadline expired (agent)')
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _private(directory):
+    """
+    Whether directory belongs to the current user and no one else can
+    create or replace files in it
+    """
+    if not hasattr(os, 'getuid'):
+        return True
+    try:
+        st = os.stat(directory)
+    except OSError:
+        return False
+    return (
+        st.st_uid == os.getuid() and
+        not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+    )
+
+
+def _trusted(path):
+    """
+    Whether the socket at path was bound by the current user, in a private
+    directory
+    """
+    if not hasattr(os, 'getuid'):
+        return True
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return st.st_uid == os.getuid() and _private(
+        os.path.dirname(os.path.abspath(path))
+    )
+
+
+def _alive(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except socket.error:
+        return False
+    finally:
+        sock.close()
@@ -0,0 +1,202 @@
+"""
+asyncio MTM/PIP clients (python 3.5+ only)
+
+Same interface as MTM and PIP, with every network operation being a coroutine:
+
+    pip = AsyncPIP()
+    await pip.connect('localhost', 61315, '1', 'XXX')
+    rows, col_types = await pip.executeSQL('SELECT TJD FROM CUVAR')
+    await pip.close()
+"""
+import asyncio
+from . import metrics
+from .mtm import MTM
+from .timeouts import MTMTimeout
+from .mysix import makestring, makebytes, _monotonic
+from .pip import (
+    PIPProtocol, SERV_CLASS_SIGNON, SERV_CLASS_SQL, SERV_CLASS_MRPC
+)
+
+
+class AsyncMTM(object):
+    def __init__(self, server_type=None):
+        self._reader = None
+        self._writer = None
+        self._lock = None
+        self._server_type = server_type
+        if server_type:
+            self._prefix = makebytes(server_type) + b'\x1c'
+        else:
+            self._prefix = b''
+        self._unsigned = False
+        # set after a timeout or cancellation, the connection is out of sync
+        self._unusable = None
+        self.set_endianess('!')
+
+    max_frame = MTM.max_frame
+    # seconds each connect or message exchange may take (None for no limit),
+    # enforced with asyncio.wait_for (timeouts.deadline does not apply)
+    timeout = None
+    set_endianess = MTM.set_endianess
+    set_unsigned = MTM.set_unsigned
+
+    async def connect(self, host, port):
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port), self.timeout
+            )
+        except asyncio.TimeoutError:
+            raise MTMTimeout('MTM_TIMEOUT', 'Deadline expired (connect)')
+        # created here to be bound to the running loop
+        self._lock = asyncio.Lock()
+
+    async def close(self):
+        self._writer.close()
+        if hasattr(self._writer, 'wait_closed'):
+            await self._writer.wait_closed()
+
+    async def exchange_message(self, message, raw=False):
+        async with self._lock:
+            return await self._exchange(message, raw)
+
+    async def _exchange(self, message, raw=False):
+        """
+        Exchange without locking, callers must hold self._lock.
+        A timeout or cancellation leaves the session unusable
+        """
+        if self._unusable:
+            raise Exception(
+                'MTM_ERROR', 'Session unusable after %s' % self._unusable
+            )
+        try:
+            if self.timeout is None:
+                await self.send_message(message)
+                return await self.read_message(raw)
+            return await asyncio.wait_for(
+                self._send_and_read(message, raw), self.timeout
+            )
+        except asyncio.TimeoutError:
+            self._unusable = 'timeout'
+            raise MTMTimeout('MTM_TIMEOUT', 'Deadline expired (exchange)')
+        except asyncio.CancelledError:
+            self._unusable = 'cancellation'
+            raise
+
+    async def _send_and_read(self, message, raw):
+        await self.send_message(message)
+        return await self.read_message(raw)
+
+    async def send_message(self, message):
+        message = makebytes(message)
+        size = len(self._prefix) + len(message) + 2
+        if size > self.max_frame:
+            raise Exception(
+                'MTM_ERROR',
+                'Frame of %d bytes exceeds max_frame (%d)' % (
+                    size, self.max_frame
+                )
+            )
+        header = self._header_struct.pack(size)
+        self._writer.writelines([header, self._prefix, message])
+        await self._writer.drain()
+
+        registry = metrics.registry
+        if registry is not None:
+            registry.sent(size)
+
+    async def read_message(self, raw=False):
+        try:
+            header = await self._reader.readexactly(2)
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                return None
+            raise Exception('MTM_ERROR', 'Connection closed in frame header')
+
+        length = self._header_struct.unpack(header)[0] - 2
+        if length < 0:
+            raise Exception('MTM_ERROR', 'Invalid frame length %d' % length)
+
+        try:
+            message = await self._reader.readexactly(length)
+        except asyncio.IncompleteReadError:
+            raise Exception('MTM_ERROR', 'Connection closed in frame payload')
+
+        registry = metrics.registry
+        if registry is not None:
+            registry.received(length + 2)
+
+        if raw:
+            return message
+        return makestring(message)
+
+
+class AsyncPIP(PIPProtocol, AsyncMTM):
+    async def connect(self, host, port, user, password):
+        await super(AsyncPIP, self).connect(host, port)
+
+        result = await self.exchange_message(
+            SERV_CLASS_SIGNON,
+            self._signon_message(user, password)
+        )
+        self._signon_reply(result)
+        self._session_opened()
+
+    async def close(self):
+        await super(AsyncPIP, self).close()
+        self._session_closed()
+
+    async def executeSQL(self, query, *args, **kwargs):
+        decode = kwargs.get('decode', False)
+        message, cursor_id = self._sql_message(query, args)
+
+        result = self._sql_reply(
+            await self.exchange_message(SERV_CLASS_SQL, message),
+            decode
+        )
+
+        if cursor_id > 0:
+            # ignored
+            await self.exchange_message(
+                SERV_CLASS_SQL,
+                self._close_message(cursor_id)
+            )
+
+        return result
+
+    async def executeMRPC(self, mrpc_id, *args, **kwargs):
+        version = kwargs.get('version', '1')
+        success_unpack = kwargs.get('success_unpack', False)
+
+        registry = metrics.registry
+        if registry is not None:
+            start = _monotonic()
+
+        result = await self.exchange_message(
+            SERV_CLASS_MRPC,
+            self._mrpc_message(mrpc_id, args, version)
+        )
+
+        if registry is not None:
+            registry.mrpc(mrpc_id, _monotonic() - start)
+        return self._mrpc_reply(result, success_unpack)
+
+    async def exchange_message(self, service_class, message):
+        registry = metrics.registry
+        if registry is None:
+            return await self._exchange_framed(service_class, message)
+
+        start = _monotonic()
+        try:
+            return await self._exchange_framed(service_class, message)
+        except Exception as e:
+            registry.error(metrics.error_code(e))
+            raise
+        finally:
+            registry.request(service_class, _monotonic() - start)
+
+    async def _exchange_framed(self, service_class, message):
+        # frame while holding the lock, so message ids hit the wire in order
+        async with self._lock:
+            return await self._exchange(
+                self._frame(service_class, message), self.binary
+            )
@@ -0,0 +1,221 @@
+"""
+Caches shared by fispip modules
+"""
+import collections
+import threading
+from .mysix import _monotonic, makestring
+
+
+class LRUCache(object):
+    """
+    Thread-safe mapping keeping the `maxsize` most recently used entries
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            # re-insert as most recently used
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+
+class TTLCache(LRUCache):
+    """
+    LRUCache whose entries also expire `ttl` seconds after being stored.
+    get_or_load() merges concurrent misses for the same key into a single
+    load
+    """
+    def __init__(self, maxsize=128, ttl=60):
+        super(TTLCache, self).__init__(maxsize)
+        self.ttl = ttl
+        # misses served by a load already in progress
+        self.coalesced = 0
+        # key -> _Pending, for loads in progress
+        self._pending = {}
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._get(key, default)
+
+    def put(self, key, value, ttl=None):
+        with self._lock:
+            self._put(key, value, ttl)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        if entry is None or entry[0] <= _monotonic():
+            return default
+        return entry[1]
+
+    def get_or_load(self, key, load, ttl=None):
+        """
+        Cached value for key or, on a miss, the value returned by load()
+        (which is cached). Concurrent callers missing the same key wait for
+        the first one's load instead of calling their own
+        """
+        with self._lock:
+            value = self._get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = _Pending()
+                loading = True
+            else:
+                self.coalesced += 1
+                loading = False
+        if not loading:
+            return pending.wait()
+
+        try:
+            value = load()
+        except Exception as e:
+            with self._lock:
+                del self._pending[key]
+            pending.set(error=e)
+            raise
+        with self._lock:
+            del self._pending[key]
+            self._put(key, value, ttl)
+        pending.set(value)
+        return value
+
+    def invalidate(self, predicate=None):
+        """
+        Drop every entry whose key matches predicate (all if None)
+        """
+        with self._lock:
+            if predicate is None:
+                self._data.clear()
+                return
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def __contains__(self, key):
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > _monotonic()
+
+    def _get(self, key, default):
+        """
+        get() without locking, callers must hold self._lock
+        """
+        try:
+            expires, value = self._data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        if expires <= _monotonic():
+            self.misses += 1
+            return default
+        # re-insert as most recently used
+        self._data[key] = (expires, value)
+        self.hits += 1
+        return value
+
+    def _put(self, key, value, ttl):
+        if ttl is None:
+            ttl = self.ttl
+        self._data.pop(key, None)
+        self._data[key] = (_monotonic() + ttl, value)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+class MRPCCache(TTLCache):
+    """
+    Results of read-only MRPCs, enabled per MRPC id through `ttls`
+    (seconds, MRPCs not listed use default_ttl, 0 meaning not cached):
+
+        PIP.mrpc_cache = MRPCCache({'155': 300})
+
+    Entries are keyed by (mrpc_id, version, args, success_unpack, binary),
+    sessions in binary mode (see PIPProtocol) getting results of their own
+    """
+    def __init__(self, ttls=None, default_ttl=0, maxsize=1024):
+        super(MRPCCache, self).__init__(maxsize, default_ttl)
+        self.ttls = dict((key_id(k), v) for k, v in (ttls or {}).items())
+
+    def ttl_for(self, mrpc_id):
+        return self.ttls.get(key_id(mrpc_id), self.ttl)
+
+    def invalidate(self, mrpc_id=None, version=None, args=None, binary=None):
+        """
+        Drop cached results of mrpc_id (all if None), optionally only
+        those of a version, arguments tuple and/or session mode
+        """
+        if mrpc_id is None and binary is None:
+            return super(MRPCCache, self).invalidate()
+        if mrpc_id is not None:
+            mrpc_id = key_id(mrpc_id)
+        if args is not None:
+            args = tuple(args)
+        super(MRPCCache, self).invalidate(lambda key: (
+            (mrpc_id is None or key[0] == mrpc_id) and
+            (version is None or key[1] == version) and
+            (args is None or key[2] == args) and
+            (binary is None or key[4] == binary)
+        ))
+
+
+def key_id(mrpc_id):
+    """
+    MRPC id as used in cache keys ('155' for 155, '155' or b'155')
+    """
+    return str(makestring(mrpc_id))
+
+
+class _Pending(object):
+    """
+    Result of a load in progress, for the callers waiting on it
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._value = None
+        self._error = None
+
+    def set(self, value=None, error=None):
+        self._value = value
+        self._error = error
+        self._event.set()
+
+    def wait(self):
+        self._event.wait()
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+_MISSING = object()
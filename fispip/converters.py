@@ -0,0 +1,78 @@
+"""
+Conversion of SQL result values to python, by PIP column type
+"""
+import datetime
+from decimal import Decimal
+
+
+# $H day 0
+JULIAN_EPOCH = datetime.date(1840, 12, 31)
+
+
+def _text(value):
+    return value
+
+
+def to_date(value):
+    if not value:
+        return None
+    return JULIAN_EPOCH + datetime.timedelta(days=int(value))
+
+
+def to_time(value):
+    if not value:
+        return None
+    seconds = int(value)
+    return datetime.time(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def to_number(value):
+    if not value:
+        return None
+    if '.' in value or 'E' in value:
+        return Decimal(value)
+    return int(value)
+
+
+def to_decimal(value):
+    if not value:
+        return None
+    return Decimal(value)
+
+
+def to_bool(value):
+    return value not in ('', '0')
+
+
+# any type not listed here (T, U, F, M, B...) is kept as str
+CONVERTERS = {
+    'D': to_date,
+    'C': to_time,
+    'N': to_number,
+    '$': to_decimal,
+    'L': to_bool,
+}
+
+
+def row_decoder(types, delimiter='\t'):
+    """
+    Returns a function decoding a result row (str) into a tuple of python
+    values, with converters resolved once for the given column types
+    """
+    converters = [CONVERTERS.get(t, _text) for t in types]
+
+    if all(c is _text for c in converters):
+        def decode(row):
+            return tuple(row.split(delimiter))
+    else:
+        def decode(row):
+            return tuple([
+                c(v) for c, v in zip(converters, row.split(delimiter))
+            ])
+
+    return decode
+
+
+def decode_rows(rows, types, delimiter='\t'):
+    decode = row_decoder(types, delimiter)
+    return [decode(row) for row in rows]
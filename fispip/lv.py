@@ -0,0 +1,207 @@
+"""
+LV (length-value) encoding, as done by V2LV^MSG and LV2V^MSG
+
+Every value is prefixed with its length + 1 in a single byte or, for values
+of 255 bytes or more, with a NUL byte, the number k of length bytes and then
+the length + k in k big-endian bytes.
+
+Functions work on bytes-like objects (decoding into memoryview slices, not
+copies) and on latin-1 str (for PIP text API).
+"""
+import struct
+from .mysix import (
+    PY3, makestring, makebytes, int_to_bytes, int_from_bytes
+)
+
+
+# short prefixes, indexed by value length
+_PREFIX = [int_to_bytes(n + 1, 1) for n in range(255)]
+_STR_PREFIX = [chr(n + 1) for n in range(255)]
+# most common long prefix, for values up to 64K
+_LONG2 = struct.Struct('!BBH')
+
+
+def _long_prefix(n):
+    if n < 0xfffe:
+        return _LONG2.pack(0, 2, n + 2)
+    k = 3
+    while n + k >= 256 ** k:
+        k += 1
+    return b'\x00' + int_to_bytes(k, 1) + int_to_bytes(n + k, k)
+
+
+def packed_size(n):
+    """
+    Size of a value of n bytes once packed
+    """
+    if n < 255:
+        return n + 1
+    return n + len(_long_prefix(n))
+
+
+def pack(items, out=None):
+    """
+    Encode items (bytes-like or latin-1 str) into a bytearray,
+    appending to `out` when one is given
+    """
+    buf = bytearray() if out is None else out
+    prefix = _PREFIX
+    for item in items:
+        if isinstance(item, str):
+            item = makebytes(item)
+        n = len(item)
+        buf += prefix[n] if n < 255 else _long_prefix(n)
+        buf += item
+    return buf
+
+
+def pack_str(items):
+    """
+    Encode str items into a str
+    """
+    prefix = _STR_PREFIX
+    parts = [None, None] * len(items)
+    parts[::2] = [
+        prefix[len(s)] if len(s) < 255 else makestring(_long_prefix(len(s)))
+        for s in items
+    ]
+    parts[1::2] = items
+    return ''.join(parts)
+
+
+def calc_size(buf, start=0):
+    """
+    Returns (value length, prefix length) for the value starting at
+    buf[start]
+    """
+    n = buf[start]
+    if not isinstance(n, int):
+        n = ord(n)
+    if n:
+        return (n - 1, 1)
+
+    k = buf[start + 1]
+    if not isinstance(k, int):
+        k = ord(k)
+    total = int_from_bytes(makebytes(buf[start + 2:start + 2 + k]))
+    return (total - k, 2 + k)
+
+
+def unpack(buf):
+    """
+    Decode an LV buffer into a list of values: str slices for a str,
+    memoryview slices (python 3) for anything else
+    """
+    if isinstance(buf, str) or not PY3:
+        return _unpack_str(makestring(buf))
+
+    view = memoryview(buf)
+    ret = []
+    i = 0
+    end = len(view)
+    while i < end:
+        n = view[i]
+        if n:
+            i += 1
+            n -= 1
+        else:
+            k = view[i + 1]
+            if k == 2:
+                n = view[i + 2] * 256 + view[i + 3] - 2
+            else:
+                n = int_from_bytes(view[i + 2:i + 2 + k]) - k
+            i += 2 + k
+        ret.append(view[i:i + n])
+        i += n
+    return ret
+
+
+def _unpack_str(buf):
+    ret = []
+    i = 0
+    end = len(buf)
+    while i < end:
+        n = ord(buf[i])
+        if n:
+            i += 1
+            n -= 1
+        else:
+            k = ord(buf[i + 1])
+            if k == 2:
+                n = ord(buf[i + 2]) * 256 + ord(buf[i + 3]) - 2
+            else:
+                n = int_from_bytes(makebytes(buf[i + 2:i + 2 + k])) - k
+            i += 2 + k
+        ret.append(buf[i:i + n])
+        i += n
+    return ret
+
+
+class LVView(object):
+    """
+    Lazy, indexable view over the values packed in buf[start:end].
+
+    Values are only located as far as the highest index requested and only
+    the requested ones are sliced out (memoryview slices for bytes-like
+    buffers). nested(i) returns a view of value i without copying it.
+    """
+    def __init__(self, buf, start=0, end=None):
+        if isinstance(buf, str) or not PY3:
+            buf = makestring(buf)
+            self._slicer = buf
+        else:
+            self._slicer = memoryview(buf)
+        self._buf = buf
+        self._end = len(buf) if end is None else end
+        self._pos = start
+        # (start, end) of the values located so far
+        self._spans = []
+
+    def _scan(self, index):
+        """
+        Locate values up to index (all of them if index is negative)
+        """
+        spans = self._spans
+        while (index < 0 or len(spans) <= index) and self._pos < self._end:
+            n, o = calc_size(self._buf, self._pos)
+            start = self._pos + o
+            self._pos = start + n
+            spans.append((start, self._pos))
+
+    def _locate(self, index):
+        self._scan(index)
+        try:
+            return self._spans[index]
+        except IndexError:
+            raise IndexError('LV index out of range')
+
+    def span(self, index):
+        """
+        (start, end) of value index in the underlying buffer
+        """
+        return self._locate(index)
+
+    def nested(self, index):
+        """
+        View of the LV values packed inside value index
+        """
+        start, end = self._locate(index)
+        return LVView(self._buf, start, end)
+
+    def __getitem__(self, index):
+        start, end = self._locate(index)
+        return self._slicer[start:end]
+
+    def __iter__(self):
+        i = 0
+        while True:
+            self._scan(i)
+            if i >= len(self._spans):
+                return
+            start, end = self._spans[i]
+            yield self._slicer[start:end]
+            i += 1
+
+    def __len__(self):
+        self._scan(-1)
+        return len(self._spans)
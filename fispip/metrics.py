@@ -0,0 +1,263 @@
+"""
+Optional metrics for MTM/PIP calls
+
+Disabled by default, when the only cost is checking `metrics.registry`.
+Enable it and export with a callback or a Prometheus text endpoint:
+
+    from fispip import metrics
+    registry = metrics.enable()
+    metrics.serve(registry, 9102)
+    # or
+    metrics.CallbackExporter(registry, print, interval=60).start()
+
+Recorded:
+
+* fispip_requests_total / fispip_request_seconds, by service class
+* fispip_mrpc_requests_total / fispip_mrpc_seconds, by MRPC id
+* fispip_bytes_sent_total / fispip_bytes_received_total
+* fispip_errors_total, by error code (first exception argument)
+* fispip_open_sessions
+"""
+import bisect
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+
+# seconds
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+
+SERVICE_NAMES = {
+    '0': 'SIGNON',
+    '3': 'MRPC',
+    '5': 'SQL',
+}
+
+# active Registry, None when disabled
+registry = None
+
+
+def enable(buckets=DEFAULT_BUCKETS):
+    global registry
+    registry = Registry(buckets)
+    return registry
+
+
+def disable():
+    global registry
+    registry = None
+
+
+def error_code(exc):
+    """
+    PIP error code of exc (first argument), its class name if it has none
+    """
+    if exc.args and isinstance(exc.args[0], str):
+        return exc.args[0]
+    return type(exc).__name__
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # non-cumulative, last one for values above every bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        [(upper bound, count of values <= bound)], ending with '+Inf'
+        """
+        total = 0
+        ret = []
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            ret.append((bound, total))
+        return ret
+
+
+class Registry(object):
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # (name, labels) -> value, labels being a tuple of (key, value)
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def add(self, name, value, labels=()):
+        key = (name, labels)
+        with self._lock:
+            self.gauges[key] = self.gauges.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        key = (name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def value(self, name, labels=()):
+        """
+        Current value of a counter or gauge (0 if never set)
+        """
+        key = (name, labels)
+        with self._lock:
+            return self.counters.get(key, self.gauges.get(key, 0))
+
+    # hooks called by MTM/PIP
+
+    def request(self, service_class, seconds):
+        service = SERVICE_NAMES.get(service_class, service_class)
+        labels = (('service', service),)
+        self.inc('fispip_requests_total', labels)
+        self.observe('fispip_request_seconds', seconds, labels)
+
+    def mrpc(self, mrpc_id, seconds):
+        labels = (('mrpc', str(mrpc_id)),)
+        self.inc('fispip_mrpc_requests_total', labels)
+        self.observe('fispip_mrpc_seconds', seconds, labels)
+
+    def sent(self, size):
+        self.inc('fispip_bytes_sent_total', value=size)
+
+    def received(self, size):
+        self.inc('fispip_bytes_received_total', value=size)
+
+    def error(self, code):
+        self.inc('fispip_errors_total', (('code', code),))
+
+    def session(self, delta):
+        self.add('fispip_open_sessions', delta)
+
+    # export
+
+    def snapshot(self):
+        """
+        Plain dict copy of every metric, for callbacks
+        """
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'histograms': dict(
+                    (key, {
+                        'count': h.count,
+                        'sum': h.sum,
+                        'buckets': h.cumulative(),
+                    })
+                    for key, h in self.histograms.items()
+                ),
+            }
+
+    def prometheus(self):
+        """
+        Metrics in Prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for kind, metrics in (
+            ('counter', snapshot['counters']),
+            ('gauge', snapshot['gauges']),
+        ):
+            for name in sorted(set(k[0] for k in metrics)):
+                lines.append('# TYPE %s %s' % (name, kind))
+                for key in sorted(k for k in metrics if k[0] == name):
+                    lines.append('%s%s %s' % (
+                        name, _labels(key[1]), metrics[key]
+                    ))
+
+        histograms = snapshot['histograms']
+        for name in sorted(set(k[0] for k in histograms)):
+            lines.append('# TYPE %s histogram' % name)
+            for key in sorted(k for k in histograms if k[0] == name):
+                h = histograms[key]
+                for bound, count in h['buckets']:
+                    lines.append('%s_bucket%s %d' % (
+                        name, _labels(key[1] + (('le', str(bound)),)), count
+                    ))
+                lines.append('%s_sum%s %s' % (name, _labels(key[1]), h['sum']))
+                lines.append('%s_count%s %d' % (
+                    name, _labels(key[1]), h['count']
+                ))
+
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (
+            k,
+            v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        )
+        for k, v in labels
+    )
+
+
+class CallbackExporter(object):
+    """
+    Call callback(registry.snapshot()) every `interval` seconds,
+    from a background thread
+    """
+    def __init__(self, registry, callback, interval=60):
+        self._registry = registry
+        self._callback = callback
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._callback(self._registry.snapshot())
+
+
+def serve(registry, port, host=''):
+    """
+    Serve registry.prometheus() over HTTP (any path) from a background
+    thread, returns the server (shutdown() to stop it)
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
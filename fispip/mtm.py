@@ -1,13 +1,34 @@
 import socket
 import struct
+from . import metrics
+from . import timeouts
 from .mysix import makestring, makebytes
 
 
 class MTM(object):
+    # vectored I/O, to send frame header and payload in a single syscall
+    # without joining them first (not available in py2 and Windows)
+    _use_sendmsg = hasattr(socket.socket, 'sendmsg')
+    # largest frame (including length header) the header can announce,
+    # see set_unsigned
+    max_frame = 0x7fff
+    # seconds each connect or message exchange may take (None for no limit),
+    # shortened by any enclosing timeouts.deadline
+    timeout = None
+
     def __init__(self, server_type=None):
         self._socket = socket.socket()
         self._server_type = server_type
-        self._endianess = '!h'
+        if server_type:
+            self._prefix = makebytes(server_type) + b'\x1c'
+        else:
+            self._prefix = b''
+        self._unsigned = False
+        # timeout currently set on the socket
+        self._socket_timeout = None
+        # set after a timeout or cancel, the connection is out of sync
+        self._unusable = None
+        self.set_endianess('!')
 
     '''
     From struct documentation:
@@ -20,43 +41,164 @@ class MTM(object):
 
     '''
     def set_endianess(self, struct_signal):
+        length_format = 'H' if self._unsigned else 'h'
         if struct_signal in '<>':
-            self._endianess = struct_signal + 'h'
+            self._endianess = struct_signal + length_format
         else:
-            self._endianess = '!h'
+            self._endianess = '!' + length_format
+        self._header_struct = struct.Struct(self._endianess)
+
+    def set_unsigned(self, unsigned=True):
+        """
+        Frame lengths as unsigned shorts, doubling max_frame to 64KB.
+        Only for servers that read them as such
+        """
+        self._unsigned = unsigned
+        self.max_frame = 0xffff if unsigned else 0x7fff
+        self.set_endianess(self._endianess[0])
 
     def connect(self, host, port):
-        self._socket.connect((host, port))
+        with timeouts.deadline(self.timeout):
+            self._apply_deadline()
+            try:
+                self._socket.connect((host, port))
+            except socket.timeout:
+                self._timed_out('connect')
 
     def close(self):
         self._socket.close()
 
-    def exchange_message(self, message):
-        self.send_message(message)
-        return self.read_message()
+    def cancel(self):
+        """
+        Abort a call blocked in another thread, leaving the session unusable
+        """
+        self._unusable = 'cancellation'
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+    def exchange_message(self, message, raw=False):
+        if self.timeout is None:
+            self.send_message(message)
+            return self.read_message(raw)
+
+        with timeouts.deadline(self.timeout):
+            self.send_message(message)
+            return self.read_message(raw)
 
     def send_message(self, message):
+        if self._unusable:
+            raise Exception(
+                'MTM_ERROR', 'Session unusable after %s' % self._unusable
+            )
         message = makebytes(message)
-        if self._server_type:
-            message = makebytes(self._server_type) + b'\x1c' + message
+        size = len(self._prefix) + len(message) + 2
+        if size > self.max_frame:
+            raise Exception(
+                'MTM_ERROR',
+                'Frame of %d bytes exceeds max_frame (%d)' % (
+                    size, self.max_frame
+                )
+            )
+        header = self._header_struct.pack(size)
+        try:
+            self._send_buffers([header, self._prefix, message])
+        except socket.timeout:
+            self._timed_out('send')
+
+        registry = metrics.registry
+        if registry is not None:
+            registry.sent(size)
 
-        header = struct.pack(self._endianess, len(message) + 2)
-        message_to_send = header + message
-        self._socket.send(message_to_send)
+    def read_message(self, raw=False):
+        """
+        Read one length-prefixed frame directly into a buffer of the size
+        announced in its header.
+        Returns None if the connection was closed before a new frame started,
+        the payload as bytes if `raw` is set, or as a (latin-1) string.
+        """
+        if self._unusable:
+            raise Exception(
+                'MTM_ERROR', 'Session unusable after %s' % self._unusable
+            )
 
-    def read_message(self):
-        len_str = self._socket.recv(2)
-        if not len_str:
+        header = bytearray(2)
+        read_count = self._recv_into(memoryview(header))
+        if not read_count:
+            if self._unusable:
+                raise Exception('MTM_ERROR', 'Call cancelled')
             return None
-        length = struct.unpack(self._endianess, len_str)[0]
-        length -= 2
-        message = ''
+        if read_count < 2:
+            raise Exception('MTM_ERROR', 'Connection closed in frame header')
+
+        length = self._header_struct.unpack_from(header)[0] - 2
+        if length < 0:
+            raise Exception('MTM_ERROR', 'Invalid frame length %d' % length)
+
+        message = bytearray(length)
+        if self._recv_into(memoryview(message)) < length:
+            raise Exception('MTM_ERROR', 'Connection closed in frame payload')
+
+        registry = metrics.registry
+        if registry is not None:
+            registry.received(length + 2)
+
+        if raw:
+            return bytes(message)
+        return makestring(message)
+
+    def _send_buffers(self, buffers):
+        """
+        Send all `buffers` as one contiguous message, resuming after partial
+        writes until everything is sent
+        """
+        if not self._use_sendmsg:
+            self._apply_deadline()
+            self._socket.sendall(b''.join(buffers))
+            return
+
+        buffers = [memoryview(b) for b in buffers if len(b)]
+        while buffers:
+            self._apply_deadline()
+            sent = self._socket.sendmsg(buffers)
+            while buffers and sent >= len(buffers[0]):
+                sent -= len(buffers[0])
+                buffers.pop(0)
+            if buffers:
+                buffers[0] = buffers[0][sent:]
+
+    def _recv_into(self, view):
+        """
+        Fill `view` from the socket, retrying on short reads.
+        Returns the number of bytes read (less than len(view) only on EOF)
+        """
         read_count = 0
+        length = len(view)
         while read_count < length:
-            read_block = min(length - read_count, 1024)
-            partial_message = makestring(self._socket.recv(read_block))
-            read_count += len(partial_message)
-            if not partial_message:
+            self._apply_deadline()
+            try:
+                n = self._socket.recv_into(view[read_count:])
+            except socket.timeout:
+                self._timed_out('receive')
+            if not n:
                 break
-            message += partial_message
-        return message
+            read_count += n
+        return read_count
+
+    def _apply_deadline(self):
+        """
+        Set the socket timeout to the time left before the current deadline
+        """
+        timeout = timeouts.remaining()
+        if timeout is not None and timeout <= 0:
+            self._timed_out('deadline')
+        if timeout != self._socket_timeout:
+            self._socket.settimeout(timeout)
+            self._socket_timeout = timeout
+
+    def _timed_out(self, operation):
+        self._unusable = 'timeout'
+        raise timeouts.MTMTimeout(
+            'MTM_TIMEOUT', 'Deadline expired (%s)' % operation
+        )
@@ -1,18 +1,29 @@
 """
 An attempt to support both py2 and py3
 """
+import os
 import sys
+import time
 
 
 PY3 = sys.version_info[0] > 2
 
+# not affected by system clock changes, when available
+_monotonic = getattr(time, 'monotonic', time.time)
+
+# rename over an existing file (python 2: POSIX only)
+_replace = getattr(os, 'replace', os.rename)
+
 if PY3:
     _basestring = str
     _range = range
+    _input = input
 
     def makestring(x):
         if x is not None:
-            if isinstance(x, bytes):
+            if isinstance(x, memoryview):
+                x = x.tobytes()
+            if isinstance(x, (bytes, bytearray)):
                 x = x.decode('latin-1')
         return x
 
@@ -21,12 +32,31 @@ if PY3:
             if isinstance(x, str):
                 return x.encode('latin-1')
         return x
+
+    def int_to_bytes(x, length):
+        return x.to_bytes(length, 'big')
+
+    def int_from_bytes(x):
+        return int.from_bytes(x, 'big')
 else:
     _basestring = basestring
     _range = xrange
+    _input = raw_input
 
     def makestring(x):
+        if isinstance(x, memoryview):
+            return x.tobytes()
+        if isinstance(x, bytearray):
+            return str(x)
         return x
 
     def makebytes(x):
         return x
+
+    def int_to_bytes(x, length):
+        return ''.join(
+            chr((x >> (8 * i)) & 0xff) for i in reversed(xrange(length))
+        )
+
+    def int_from_bytes(x):
+        return reduce(lambda acc, c: acc * 256 + ord(c), x, 0)
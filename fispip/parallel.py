@@ -0,0 +1,136 @@
+"""
+Run independent SQL statements or MRPC calls concurrently, spread over the
+sessions of a pool (one thread per session)
+
+    pool = PIPPool('localhost', 61315, '1', 'XXX', max_size=8)
+    results = map_mrpc(pool, [('155', 'SELECT TJD FROM CUVAR')] * 100)
+    results = map_sql(pool, ['SELECT TJD FROM CUVAR',
+                             ('SELECT * FROM DEP WHERE CID=?', 123)])
+
+Results come back in input order, a call that failed gets the exception
+instance as its result without stopping the others. imap_unordered yields
+them as they complete instead.
+"""
+import threading
+from . import timeouts
+from .mysix import _basestring, _monotonic, _range
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+def map_sql(pool, queries, concurrency=None, timeout=None, **kwargs):
+    """
+    executeSQL every query, either a statement or a tuple of statement and
+    its arguments. Extra keyword arguments (decode) are passed along.
+    concurrency: number of sessions used (defaults to pool max_size)
+    timeout: seconds each call may take (see timeouts.deadline), the
+             session is discarded when it expires
+    """
+    return _map(pool, 'executeSQL', queries, concurrency, timeout, kwargs)
+
+
+def map_mrpc(pool, calls, concurrency=None, timeout=None, **kwargs):
+    """
+    executeMRPC every call, either an MRPC id or a tuple of MRPC id and its
+    arguments. Extra keyword arguments (version, success_unpack) are passed
+    along, see map_sql for the others
+    """
+    return _map(pool, 'executeMRPC', calls, concurrency, timeout, kwargs)
+
+
+def imap_unordered(pool, calls, concurrency=None, timeout=None):
+    """
+    Run calls, (method, args) or (method, args, kwargs) tuples such as
+    ('executeMRPC', ('155', 'X')), yielding (position, result, seconds) as
+    each one completes. method is the name of a session method or a
+    function called with the session first (fn(pip, *args, **kwargs)).
+    calls can be any iterable, it is consumed as sessions become free.
+    See map_sql for the other arguments
+    """
+    if concurrency is None:
+        concurrency = pool.max_size
+
+    calls = enumerate(calls)
+    lock = threading.Lock()
+    completed = queue.Queue()
+
+    def next_call():
+        with lock:
+            return next(calls, None)
+
+    workers = [
+        threading.Thread(
+            target=_worker,
+            args=(pool, next_call, completed, timeout)
+        )
+        for _ in _range(concurrency)
+    ]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+
+    # each worker ends with None
+    running = len(workers)
+    while running:
+        item = completed.get()
+        if item is None:
+            running -= 1
+        else:
+            yield item
+
+
+def _map(pool, method, calls, concurrency, timeout, kwargs):
+    calls = [
+        (method, (c,) if isinstance(c, _basestring) else tuple(c), kwargs)
+        for c in calls
+    ]
+    results = [None] * len(calls)
+    if concurrency is None:
+        concurrency = pool.max_size
+
+    for i, result, _ in imap_unordered(
+        pool, calls, min(concurrency, len(calls)), timeout
+    ):
+        results[i] = result
+    return results
+
+
+def _worker(pool, next_call, completed, timeout):
+    """
+    Run calls with a single session until none is left, replacing the
+    session when it breaks (or a call times out)
+    """
+    pip = None
+    try:
+        while True:
+            item = next_call()
+            if item is None:
+                return
+            i, call = item
+            start = _monotonic()
+            try:
+                if pip is None:
+                    pip = pool.acquire()
+                result = _call(pip, call, timeout)
+            except Exception as e:
+                result = e
+                if pip is not None and pool._is_broken(e):
+                    pool.release(pip, discard=True)
+                    pip = None
+            completed.put((i, result, _monotonic() - start))
+    finally:
+        if pip is not None:
+            pool.release(pip)
+        completed.put(None)
+
+
+def _call(pip, call, timeout):
+    method, args = call[:2]
+    kwargs = call[2] if len(call) > 2 else {}
+    with timeouts.deadline(timeout):
+        if callable(method):
+            return method(pip, *args, **kwargs)
+        return getattr(pip, method)(*args, **kwargs)
@@ -1,6 +1,14 @@
+import collections
 import time
 from . import MTM
-from .mysix import _basestring, _range, makestring
+from . import converters
+from . import lv
+from . import metrics
+from . import schema
+from . import sql
+from . import timeouts
+from .cache import key_id as cache_key_id
+from .mysix import _basestring, _monotonic, makebytes, makestring
 
 
 SERV_CLASS_SIGNON = '0'
@@ -8,16 +16,28 @@ SERV_CLASS_SQL = '5'
 SERV_CLASS_MRPC = '3'
 
 
-class PIP(MTM):
-    def __init__(self, server_type='SCA$IBS'):
-        super(PIP, self).__init__(server_type)
+class PIPProtocol(object):
+    """
+    PIP message building and parsing, independent of the transport.
+    Mixed in with a transport class providing exchange_message (see PIP).
+
+    With binary=True, messages are packed and replies parsed as bytes, with
+    no latin-1 transcoding: results (rows, MRPC returns) are bytes and str
+    arguments are encoded once, as latin-1, when packed
+    """
+    def __init__(self, server_type='SCA$IBS', binary=False):
+        super(PIPProtocol, self).__init__(server_type)
+        self.binary = binary
         self._token = None
         self._msgid = 0
         self.max_rows = 30
+        self._cursor_id = 0
+        # cursors left open by garbage collected Cursor objects
+        self._orphan_cursors = []
+        # counted in metrics open sessions
+        self._metered_session = False
 
-    def connect(self, host, port, user, password):
-        super(PIP, self).connect(host, port)
-
+    def _signon_message(self, user, password):
         # Sign on (and acquire token)
         '''
         #define srv_prc   0
@@ -38,96 +58,139 @@ class PIP(MTM):
             '',
             '\x15\x025\x06ICODE\x021\x08PREPARE\x023',  # context
         ]
+        return self._pack_lv(msg_arr)
 
-        result = self.exchange_message(
-            SERV_CLASS_SIGNON,
-            self._pack_lv(msg_arr)
-        )
+    def _signon_reply(self, result):
+        result_arr = self._check_error(result).nested(1)
 
-        result_arr = self._check_error(result)
-        result_arr = self._unpack_lv(result_arr[1])
+        self._token = self._value(result_arr[0])
+
+    def _sql_message(self, query, args, rows=None):
+        """
+        Returns the packed SQL message and the id of the cursor it opens
+        (0 if query is not a SELECT), fetching `rows` (or max_rows) rows
+        """
+        sql_modifiers = '/ROWS=%d' % (rows or self.max_rows)
 
-        self._token = result_arr[0]
+        # Replace "?" with host variables
+        if len(args) > 0:
+            query, markers = sql.compile_query(query)
+            if markers > len(args):
+                raise Exception('VAL_ERROR', 'More markers than variables')
+            if markers < len(args):
+                raise Exception('VAL_ERROR', 'More variables than markers')
+
+            sql_modifiers += '/USING=(%s)' % ','.join(
+                'C%d=\'%s\'' % (variable_id, makestring(arg))
+                for variable_id, arg in enumerate(args, 1)
+            )
 
-    def executeSQL(self, query, *args):
         cursor_id = 0
         final_sql = ''
         if query[:6].lower() == 'select':
-            cursor_id = int(time.time())
+            cursor_id = self._next_cursor_id()
             final_sql = 'OPEN CURSOR %d AS %s' % (cursor_id, query)
         else:
             final_sql = query
 
-        sql_modifiers = '/ROWS=%d' % self.max_rows
-
-        # Replace "?" with host variables
-        # TODO desperate need of actual parsing and validation
-        # TODO INSERT ... VALUES (?,?,?...) are not covered
-        if len(args) > 0:
-            host_variables = []
-            temp_sql = final_sql.replace('=?', '= ?')
-            final_sql = ''
-            i = temp_sql.find('= ?')
-            old_i = 0
-            variable_id = 1
-            while i > -1:
-                variable_str = 'C%d' % variable_id
-                final_sql += temp_sql[old_i:i] + '= :' + variable_str
-                old_i = i + 3
-                try:
-                    host_variables.append('%s=\'%s\'' % (
-                        variable_str,
-                        args[variable_id - 1]
-                    ))
-                except IndexError:
-                    raise Exception('VAL_ERROR', 'More markers than variables')
-                variable_id += 1
-                i = temp_sql.find('= ?', old_i)
-
-            if variable_id != (len(args) + 1):
-                raise Exception('VAL_ERROR', 'More variables than markers')
-
-            sql_modifiers += '/USING=(%s)' % ','.join(host_variables)
-
         msg_arr = [
             final_sql,  # query
             sql_modifiers,
             '',  # ?
         ]
 
-        result = self.exchange_message(
-            SERV_CLASS_SQL,
-            self._pack_lv(msg_arr)
+        return self._pack_lv(msg_arr), cursor_id
+
+    def _next_cursor_id(self):
+        # unique in the session, even for cursors opened in the same second
+        self._cursor_id = max(int(time.time()), self._cursor_id + 1)
+        return self._cursor_id
+
+    def _sql_reply(self, result, decode=False, row_type=None):
+        return self._sql_result(
+            self._check_error(result).nested(1), decode, row_type
         )
 
-        result_arr = self._check_error(result)
-        result_arr = self._unpack_lv(result_arr[1])
+    def _sql_result(self, result_arr, decode=False, row_type=None):
+        """
+        Returns (rows, column types) from the fields of an SQL reply, rows
+        as instances of row_type (a named tuple) if given
+        """
+        if decode or row_type is not None:
+            rows, types, _ = self._sql_rows(result_arr)
+            decoder = self._row_decoder(types, decode, row_type)
+            return ([decoder(row) for row in rows], types)
 
         # count = result_arr[2]
 
-        result = result_arr[3].split('\r\n')
+        result = self._value(result_arr[3]).split(self._literal('\r\n'))
 
-        types = list(result_arr[5].split('|')[0])
-
-        if cursor_id > 0:
-            msg_arr = [
-                'CLOSE %d' % cursor_id,  # query
-                '',
-                '',
-            ]
-            # ignored
-            self.exchange_message(SERV_CLASS_SQL, self._pack_lv(msg_arr))
+        types = self._types(result_arr)
 
         return (result, types)
 
-    def executeMRPC(self, mrpc_id, *args, **kwargs):
-        version = kwargs.get('version', '1')
-        # Some MRPCs will apply V2LV on RETURN variable, others will not
-        # if they do, an extra unpack is required...
-        # only 3 MRPCs exist in PIPv02, not enough for a default based on
-        # "most cases"... default to "not unpack" for now...
-        success_unpack = kwargs.get('success_unpack', False)
+    def _sql_batch(self, result):
+        """
+        Returns (rows, column types, row count) of an SQL reply, with no rows
+        (instead of an empty one) when the count is 0
+        """
+        return self._sql_rows(self._check_error(result).nested(1))
+
+    def _sql_rows(self, result_arr):
+        rows = self._value(result_arr[3]).split(self._literal('\r\n'))
+        types = self._types(result_arr)
+        try:
+            count = int(makestring(result_arr[2]))
+        except ValueError:
+            count = len(rows)
+        if not count:
+            rows = []
+
+        return (rows, types, count)
+
+    def _types(self, result_arr):
+        # column types are always text
+        return list(makestring(result_arr[5]).split('|')[0])
+
+    def _row_decoder(self, types, decode, row_type):
+        if decode:
+            decoder = converters.row_decoder(types)
+            if self.binary:
+                decode_text = decoder
+
+                def decoder(row):
+                    return decode_text(makestring(row))
+        else:
+            separator = self._literal('\t')
+
+            def decoder(row):
+                return row.split(separator)
+        if row_type is None:
+            return decoder
+
+        make = row_type._make
+
+        def named_decoder(row):
+            return make(decoder(row))
+        return named_decoder
+
+    def _fetch_message(self, cursor_id, rows):
+        msg_arr = [
+            'FETCH %d' % cursor_id,  # query
+            '/ROWS=%d' % rows,
+            '',
+        ]
+        return self._pack_lv(msg_arr)
 
+    def _close_message(self, cursor_id):
+        msg_arr = [
+            'CLOSE %d' % cursor_id,  # query
+            '',
+            '',
+        ]
+        return self._pack_lv(msg_arr)
+
+    def _mrpc_message(self, mrpc_id, args, version='1'):
         params = self._pack_lv(args)
         msg_arr = [
             mrpc_id,
@@ -135,19 +198,82 @@ class PIP(MTM):
             params,
             '\x04\x03\x021',  # dunno
         ]
+        return self._pack_lv(msg_arr)
 
-        result = self.exchange_message(
-            SERV_CLASS_MRPC,
-            self._pack_lv(msg_arr)
+    def mrpc_arg_limit(self, mrpc_id, args, index, version='1'):
+        """
+        Largest length args[index] can have (whatever its current value)
+        for executeMRPC(mrpc_id, *args) to fit in a single frame
+        """
+        budget = self.max_frame - self._frame_overhead()
+        others = sum(
+            lv.packed_size(len(arg)) for i, arg in enumerate(args)
+            if i != index
+        )
+        fixed = (
+            lv.packed_size(len(mrpc_id)) + lv.packed_size(len(version)) +
+            lv.packed_size(len('\x04\x03\x021'))
         )
 
+        def fits(n):
+            return fixed + lv.packed_size(
+                others + lv.packed_size(n)
+            ) <= budget
+
+        low, high = 0, budget
+        if not fits(low):
+            raise Exception('VAL_ERROR', 'Arguments do not fit in a frame')
+        while low < high:
+            middle = (low + high + 1) // 2
+            if fits(middle):
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def _mrpc_reply(self, result, success_unpack=False):
         result_arr = self._check_error(result)
 
         if success_unpack:
-            return self._unpack_lv(result_arr[1])
-        return result_arr[1]
+            return [self._value(value) for value in result_arr.nested(1)]
+        return self._value(result_arr[1])
+
+    def _group_reply(self, result, count):
+        """
+        Returns the SQL result of each of the `count` records in a grouped
+        reply, or the exception for the records that failed
+        """
+        records = self._check_error(result).nested(1)
+        if len(records) != count:
+            raise Exception(
+                'MTM_ERROR',
+                'Expected %d grouped replies, got %d' % (count, len(records))
+            )
+
+        replies = []
+        for i in range(count):
+            try:
+                replies.append(self._sql_result(
+                    self._check_status(records.nested(i)).nested(1)
+                ))
+            except Exception as e:
+                replies.append(e)
+        return replies
+
+    def _frame_overhead(self):
+        """
+        Upper bound of the bytes a frame adds to the message it carries
+        """
+        header = self._pack_lv(
+            [SERV_CLASS_SQL, self._token or '', '9' * 12, '0', '9' * 6]
+        )
+        # frame length, server type prefix, header and message LV prefixes
+        return 2 + len(self._prefix) + lv.packed_size(len(header)) + 5
 
-    def exchange_message(self, service_class, message):
+    def _frame(self, service_class, message, grp_recs='', stf_flg='0'):
+        """
+        Prepend PIP header to message (consuming one message id)
+        """
         # Message Header
         '''
         From libsql.h (for reference):
@@ -162,8 +288,8 @@ class PIP(MTM):
             service_class,
             self._token,
             str(self._msgid),
-            '0',
-            '',
+            stf_flg,
+            grp_recs,
         ]
 
         if service_class == SERV_CLASS_SIGNON:
@@ -176,87 +302,523 @@ class PIP(MTM):
 
         self._msgid += 1
 
-        return super(PIP, self).exchange_message(self._pack_lv(msg_arr))
+        return self._pack_lv(msg_arr)
+
+    def _reply_msgid(self, result):
+        """
+        Message id echoed in the reply header, None if there is none
+        """
+        if result[:1] != self._literal('0'):
+            return None
+        try:
+            return makestring(lv.LVView(result, 1).nested(0)[2])
+        except IndexError:
+            return None
 
     def _check_error(self, packed_string):
-        if packed_string[0] != '0':
-            raise Exception('MTM_ERROR', packed_string[1:])
+        if packed_string[:1] != self._literal('0'):
+            self._count_error('MTM_ERROR')
+            raise Exception('MTM_ERROR', makestring(packed_string[1:]))
 
-        result_arr = self._unpack_lv(packed_string[1:])
-        result_arr = self._unpack_lv(result_arr[1])
+        # lazy views: nothing is copied until values are read
+        return self._check_status(lv.LVView(packed_string, 1).nested(1))
 
-        if result_arr[0] != '0':
-            result_arr = self._unpack_lv(result_arr[1])
-            raise Exception(result_arr[2], result_arr[4])
+    def _check_status(self, result_arr):
+        if result_arr[0] != self._literal('0'):
+            result_arr = result_arr.nested(1)
+            code = makestring(result_arr[2])
+            self._count_error(code)
+            raise Exception(code, makestring(result_arr[4]))
 
         return result_arr
 
+    def _literal(self, text):
+        """
+        Protocol constant as it appears in replies (bytes if binary)
+        """
+        return makebytes(text) if self.binary else text
+
+    def _value(self, value):
+        """
+        Reply value as a result: bytes (no copy of the rest of the reply
+        is kept) if binary, str otherwise
+        """
+        return bytes(value) if self.binary else value
+
+    def _count_error(self, code):
+        registry = metrics.registry
+        if registry is not None:
+            registry.error(code)
+
+    def _session_opened(self):
+        registry = metrics.registry
+        if registry is not None:
+            registry.session(1)
+            self._metered_session = True
+
+    def _session_closed(self):
+        if self._metered_session:
+            self._metered_session = False
+            registry = metrics.registry
+            if registry is not None:
+                registry.session(-1)
+
     def _unpack_lv(self, packed_string):
-        ret_array = []
-        i = 0
-        while i < len(packed_string):
-            l, o = self._calc_size(packed_string, i)
-            i += o
-            ret_array.append(packed_string[i:i+l])
-            i += l
-        return ret_array
+        return lv.unpack(packed_string)
 
     def _pack_lv(self, unpacked_array):
         """
         Based on V2LV^MSG
         """
-        if isinstance(unpacked_array, _basestring):
+        if isinstance(unpacked_array, (_basestring, bytes)):
             unpacked_array = [unpacked_array]
+        if self.binary:
+            return lv.pack(unpacked_array)
+        return lv.pack_str(unpacked_array)
 
-        message = []
-
-        for s in unpacked_array:
-            l = len(s) + 1
-            if l > 255:
-                larr = []
-                while True:
-                    larr.append(l % 256)
-                    l = int(l / 256)  # truncate py3
-                    if l == 0:
-                        break
-                    larr[0] += 1
-
-                # in case first larr element got bigger than 256
-                carry = 0
-                for i in _range(len(larr)):
-                    larr[i] += carry
-                    if larr[i] < 256:
-                        carry = 0
-                        break
-                    larr[i] = larr[i] % 256
-                    carry = 1
-                if carry:
-                    larr.append(1)
-
-                message.extend(['\x00', chr(len(larr))])
-                message.extend(map(chr, larr[::-1]))
-            else:
-                message.append(chr(l))
-            message.append(s)
+    def _calc_size(self, message, start_index=0):
+        return lv.calc_size(message, start_index)
 
-        return ''.join(message)
 
-    def _calc_size(self, message, start_index=0):
-        len_attempt = ord(message[start_index])
-        offset = 1
+class PIP(PIPProtocol, MTM):
+    # cache.MRPCCache for results of read-only MRPCs, set on the class to
+    # share it between every session (None disables caching)
+    mrpc_cache = None
+
+    def connect(self, host, port, user, password):
+        super(PIP, self).connect(host, port)
+
+        result = self.exchange_message(
+            SERV_CLASS_SIGNON,
+            self._signon_message(user, password)
+        )
+        self._signon_reply(result)
+        self._session_opened()
+
+    def close(self):
+        super(PIP, self).close()
+        self._session_closed()
+
+    def executeSQL(self, query, *args, **kwargs):
+        """
+        Returns (rows, column types), rows as delimited strings or, with
+        decode=True, as tuples of python values (see converters).
+        With named=True, rows are named tuples (see describe)
+        """
+        decode = kwargs.get('decode', False)
+        row_type = None
+        if kwargs.get('named', False):
+            row_type = schema.row_type(self.describe(query))
+        message, cursor_id = self._sql_message(query, args)
+
+        result = self._sql_reply(
+            self.exchange_message(SERV_CLASS_SQL, message),
+            decode, row_type
+        )
+
+        if cursor_id > 0:
+            # ignored
+            self.exchange_message(
+                SERV_CLASS_SQL,
+                self._close_message(cursor_id)
+            )
+
+        return result
+
+    def executeMRPC(self, mrpc_id, *args, **kwargs):
+        version = kwargs.get('version', '1')
+        # Some MRPCs will apply V2LV on RETURN variable, others will not
+        # if they do, an extra unpack is required...
+        # only 3 MRPCs exist in PIPv02, not enough for a default based on
+        # "most cases"... default to "not unpack" for now...
+        success_unpack = kwargs.get('success_unpack', False)
+
+        cache = self.mrpc_cache
+        if cache is not None:
+            ttl = cache.ttl_for(mrpc_id)
+            if ttl:
+                result = cache.get_or_load(
+                    (cache_key_id(mrpc_id), version, args, success_unpack,
+                     self.binary),
+                    lambda: self._call_mrpc(
+                        mrpc_id, args, version, success_unpack
+                    ),
+                    ttl
+                )
+                # unpacked results are lists, do not share them
+                return list(result) if success_unpack else result
+
+        return self._call_mrpc(mrpc_id, args, version, success_unpack)
+
+    def _call_mrpc(self, mrpc_id, args, version, success_unpack):
+        registry = metrics.registry
+        if registry is not None:
+            start = _monotonic()
+
+        result = self.exchange_message(
+            SERV_CLASS_MRPC,
+            self._mrpc_message(mrpc_id, args, version)
+        )
+
+        if registry is not None:
+            registry.mrpc(mrpc_id, _monotonic() - start)
+        return self._mrpc_reply(result, success_unpack)
+
+    def executemany(self, query, seq_of_params, **kwargs):
+        """
+        Execute a (non SELECT) statement once for each tuple of parameters,
+        sending as many statements per grouped-record message as fit in a
+        frame (and no more than `group_size`, if given).
+        Returns one result per tuple, the exception for the ones that failed
+        (including the ones that could not be sent, such as a statement
+        too large for a frame)
+        """
+        if query[:6].lower() == 'select':
+            raise Exception('VAL_ERROR', 'executemany does not support SELECT')
+        group_size = kwargs.get('group_size')
+        budget = self.max_frame - self._frame_overhead()
+
+        results = []
+        # (position in results, message) of the statements not sent yet
+        group = []
+        size = 0
+        for params in seq_of_params:
+            try:
+                message, _ = self._sql_message(query, params)
+                message_size = lv.packed_size(len(message))
+                if message_size > budget:
+                    raise Exception(
+                        'MTM_ERROR', 'Statement does not fit in a frame'
+                    )
+            except Exception as e:
+                results.append(e)
+                continue
+            if group and (
+                size + message_size > budget or len(group) == group_size
+            ):
+                self._execute_group(group, results)
+                group = []
+                size = 0
+            group.append((len(results), message))
+            results.append(None)
+            size += message_size
+
+        if group:
+            self._execute_group(group, results)
+        return results
+
+    def _execute_group(self, group, results):
+        messages = [message for _, message in group]
+        result = self.exchange_message(
+            SERV_CLASS_SQL,
+            self._pack_lv(messages),
+            str(len(messages))
+        )
+        replies = self._group_reply(result, len(messages))
+        for (i, _), reply in zip(group, replies):
+            results[i] = reply
+
+    def cursor(self, query, *args, **kwargs):
+        """
+        Open a server side cursor for a SELECT, see Cursor.
+        Rows are fetched `batch_size` (default max_rows) at a time, decoded
+        into tuples of python values if `decode` is set and made named
+        tuples if `named` is set
+        """
+        return Cursor(
+            self, query, args,
+            kwargs.get('batch_size'), kwargs.get('decode', False),
+            kwargs.get('named', False)
+        )
 
-        if len_attempt != 0:
-            return (len_attempt - 1, offset)
+    def describe(self, query):
+        """
+        Returns a schema.Column (name, type, length, decimals) for each
+        column of a SELECT, from the data dictionary (see schema).
+        Table definitions are cached, so only the first query on a table
+        costs a round trip
+        """
+        return schema.describe(self, query)
+
+    def pipeline(self, window=64):
+        """
+        Batch of requests sent back to back, see Pipeline
+        """
+        return Pipeline(self, window)
+
+    def exchange_message(self, service_class, message, grp_recs='',
+                         stf_flg='0'):
+        if self._orphan_cursors:
+            self._close_orphan_cursors()
+
+        frame = self._frame(service_class, message, grp_recs, stf_flg)
+        registry = metrics.registry
+        if registry is None:
+            return self._exchange_frame(frame)
+
+        start = _monotonic()
+        try:
+            return self._exchange_frame(frame)
+        except Exception as e:
+            registry.error(metrics.error_code(e))
+            raise
+        finally:
+            registry.request(service_class, _monotonic() - start)
+
+    def _close_orphan_cursors(self):
+        cursors, self._orphan_cursors = self._orphan_cursors, []
+        for cursor_id in cursors:
+            # ignored
+            self._exchange_frame(
+                self._frame(SERV_CLASS_SQL, self._close_message(cursor_id))
+            )
 
-        start_index += 1
-        len_len = ord(message[start_index])
+    def _sent(self, service_class):
+        """
+        A pipelined request was sent (bypassing exchange_message), returns
+        the start time to pass to _replied
+        """
+        return _monotonic()
 
-        total_len = 0
-        start_index += 1
-        for byte_ind in _range(len_len):
-            total_len *= 256
-            total_len += ord(message[start_index + byte_ind])
+    def _replied(self, service_class, start, success=True):
+        """
+        The reply to a pipelined request was read (or never will be)
+        """
+        registry = metrics.registry
+        if registry is not None:
+            registry.request(service_class, _monotonic() - start)
 
-        offset += 1 + len_len
+    def _pipeline_failed(self, exc, pending):
+        """
+        A transport error ended a pipelined batch, before reading the replies
+        to `pending` (service class, start time) requests
+        """
+        self._count_error(metrics.error_code(exc))
+        for service_class, start in pending:
+            self._replied(service_class, start, False)
+
+    def _exchange_frame(self, frame):
+        if self.binary:
+            # replies as bytes, parsed through memoryviews
+            return super(PIP, self).exchange_message(frame, True)
+        return super(PIP, self).exchange_message(frame)
+
+    def _read_frame(self):
+        if self.binary:
+            return self.read_message(True)
+        return self.read_message()
+
+
+class Cursor(object):
+    """
+    Server side cursor over a SELECT, fetching rows in batches:
+
+        cursor = pip.cursor('SELECT * FROM DEP', batch_size=100)
+        for row in cursor:
+            ...
+
+    Only one batch is held in memory at a time. The cursor is closed as soon
+    as the last batch is fetched, when close() is called or, failing that,
+    on the first request after it is garbage collected.
+    """
+    def __init__(self, pip, query, args=(), batch_size=None, decode=False,
+                 named=False):
+        self._pip = pip
+        self.batch_size = batch_size or pip.max_rows
+        self.types = None
+        # schema.Column of each column, with named=True
+        self.columns = None
+        self._decode = decode
+        self._decoder = None
+        self._row_type = None
+        # set before anything can fail, __del__ relies on them
+        self._cursor_id = 0
+        self._rows = collections.deque()
+        self._open = False
+        self._exhausted = False
+        if named:
+            self.columns = pip.describe(query)
+            self._row_type = schema.row_type(self.columns)
+
+        message, self._cursor_id = pip._sql_message(
+            query, args, self.batch_size
+        )
+        if not self._cursor_id:
+            raise Exception('VAL_ERROR', 'Cursor requires a SELECT')
+
+        result = pip.exchange_message(SERV_CLASS_SQL, message)
+        self._open = True
+        self._read_batch(result)
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        if rows:
+            return rows[0]
+        return None
+
+    def fetchmany(self, size=None):
+        size = size or self.batch_size
+        while len(self._rows) < size and not self._exhausted:
+            self._fetch()
+        size = min(size, len(self._rows))
+        return [self._rows.popleft() for _ in range(size)]
+
+    def fetchall(self):
+        return list(self)
+
+    def __iter__(self):
+        while True:
+            while self._rows:
+                yield self._rows.popleft()
+            if self._exhausted:
+                return
+            self._fetch()
+
+    def close(self):
+        self._rows.clear()
+        self._exhausted = True
+        self._close_cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        # no I/O here, GC might run in the middle of another exchange
+        if self._open:
+            self._open = False
+            self._pip._orphan_cursors.append(self._cursor_id)
+
+    def _fetch(self):
+        self._read_batch(self._pip.exchange_message(
+            SERV_CLASS_SQL,
+            self._pip._fetch_message(self._cursor_id, self.batch_size)
+        ))
+
+    def _read_batch(self, result):
+        rows, types, count = self._pip._sql_batch(result)
+        if self.types is None:
+            self.types = types
+            if self._decode or self._row_type is not None:
+                self._decoder = self._pip._row_decoder(
+                    types, self._decode, self._row_type
+                )
+        if self._decoder is not None:
+            rows = map(self._decoder, rows)
+        self._rows.extend(rows)
+        if count < self.batch_size:
+            self._exhausted = True
+            self._close_cursor()
+
+    def _close_cursor(self):
+        if self._open:
+            self._open = False
+            # ignored
+            self._pip.exchange_message(
+                SERV_CLASS_SQL,
+                self._pip._close_message(self._cursor_id)
+            )
+
+
+class Pipeline(object):
+    """
+    Queue SQL/MRPC requests and send them without waiting for each reply:
+
+        p = pip.pipeline()
+        p.executeSQL('SELECT TJD FROM CUVAR')
+        p.executeMRPC('155', 'SELECT TJD FROM CUVAR')
+        (rows, col_types), html = p.execute()
+
+    execute() returns one result per request, in the order they were queued.
+    A request that failed gets the exception instance as its result, while
+    transport errors abort the whole batch.
+    Up to `window` requests are kept in flight, so neither side blocks
+    writing while the other is not reading. The session timeout bounds the
+    whole batch.
+    """
+    def __init__(self, pip, window=64):
+        self._pip = pip
+        self._window = window
+        # (service class, message, reply parser or None to ignore reply)
+        self._requests = []
+
+    def __len__(self):
+        return len([r for r in self._requests if r[2] is not None])
+
+    def executeSQL(self, query, *args, **kwargs):
+        decode = kwargs.get('decode', False)
+        message, cursor_id = self._pip._sql_message(query, args)
+        self._requests.append((
+            SERV_CLASS_SQL,
+            message,
+            lambda result: self._pip._sql_reply(result, decode)
+        ))
+        if cursor_id > 0:
+            self._requests.append(
+                (SERV_CLASS_SQL, self._pip._close_message(cursor_id), None)
+            )
 
-        return (total_len - len_len, offset)
+    def executeMRPC(self, mrpc_id, *args, **kwargs):
+        version = kwargs.get('version', '1')
+        success_unpack = kwargs.get('success_unpack', False)
+        self._requests.append((
+            SERV_CLASS_MRPC,
+            self._pip._mrpc_message(mrpc_id, args, version),
+            lambda result: self._pip._mrpc_reply(result, success_unpack)
+        ))
+
+    def execute(self):
+        requests, self._requests = self._requests, []
+        pip = self._pip
+        if pip._orphan_cursors:
+            pip._close_orphan_cursors()
+        # msg_id -> (service class, start time, reply parser or None), in
+        # the order they were sent
+        pending = collections.OrderedDict()
+        results = {}
+        order = []
+
+        try:
+            with timeouts.deadline(pip.timeout):
+                for service_class, message, parse in requests:
+                    msgid = str(pip._msgid)
+                    frame = pip._frame(service_class, message)
+                    pending[msgid] = (
+                        service_class, pip._sent(service_class), parse
+                    )
+                    pip.send_message(frame)
+                    if parse is not None:
+                        order.append(msgid)
+                    if len(pending) >= self._window:
+                        self._read_reply(pending, results)
+
+                while pending:
+                    self._read_reply(pending, results)
+        except Exception as e:
+            pip._pipeline_failed(e, [
+                (service_class, start)
+                for service_class, start, _ in pending.values()
+            ])
+            raise
+
+        return [results[msgid] for msgid in order]
+
+    def _read_reply(self, pending, results):
+        result = self._pip._read_frame()
+        if result is None:
+            raise Exception('MTM_ERROR', 'Connection closed')
+
+        # MTM replies in order, use the echoed msg_id when there is one
+        msgid = self._pip._reply_msgid(result)
+        if msgid not in pending:
+            msgid = next(iter(pending))
+        service_class, start, parse = pending.pop(msgid)
+        self._pip._replied(service_class, start)
+
+        if parse is not None:
+            try:
+                results[msgid] = parse(result)
+            except Exception as e:
+                results[msgid] = e
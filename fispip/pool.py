@@ -0,0 +1,238 @@
+"""
+Pool of signed-on PIP sessions, shareable between threads
+
+    pool = PIPPool('localhost', 61315, '1', 'XXX', min_size=2, max_size=8)
+    with pool.connection() as pip:
+        rows, col_types = pip.executeSQL('SELECT TJD FROM CUVAR')
+"""
+import collections
+import contextlib
+import socket
+import threading
+from .mysix import _monotonic
+from .pip import PIP
+
+
+class PIPPool(object):
+    # error codes (first exception argument) that leave a session unusable
+    broken_errors = ('MTM_ERROR', 'MTM_TIMEOUT')
+
+    def __init__(self, host, port, user, password, server_type='SCA$IBS',
+                 min_size=1, max_size=10, timeout=None, probe_after=30,
+                 max_lifetime=None):
+        """
+        min_size: sessions kept open, signed on up front and again (in the
+                  background) when broken or expired ones are discarded
+        timeout: seconds to wait for a session when all max_size are in use
+                 (None waits forever)
+        probe_after: idle seconds after which a session is probed before
+                     being handed out (None disables probing)
+        max_lifetime: seconds after which a session is replaced by a new
+                      sign on, to avoid expired tokens (None keeps them)
+        """
+        if min_size > max_size:
+            raise Exception('VAL_ERROR', 'min_size greater than max_size')
+        self._connect_args = (host, port, user, password)
+        self._server_type = server_type
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.probe_after = probe_after
+        self.max_lifetime = max_lifetime
+
+        self._cond = threading.Condition()
+        # (pip, last checkin time), most recently used on the right
+        self._idle = collections.deque()
+        # sign on time of every open session, by id()
+        self._born = {}
+        self._size = 0
+        self._closed = False
+        # a thread is signing on sessions up to min_size
+        self._refilling = False
+
+        for _ in range(min_size):
+            self._size += 1
+            self._checkin(self._new_session())
+
+    def probe(self, pip):
+        """
+        Validate an idle session (and its token), raising if it is broken.
+        Override for a cheaper statement or servers without CUVAR
+        """
+        pip.executeSQL('SELECT TJD FROM CUVAR')
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        pip = self.acquire(timeout)
+        try:
+            yield pip
+        except Exception as e:
+            self.release(pip, discard=self._is_broken(e))
+            raise
+        else:
+            self.release(pip)
+
+    def acquire(self, timeout=None):
+        """
+        Check a session out of the pool, waiting up to timeout seconds
+        (defaults to pool timeout) if max_size are already in use
+        """
+        if timeout is None:
+            timeout = self.timeout
+        deadline = None if timeout is None else _monotonic() + timeout
+
+        while True:
+            entry = self._reserve(deadline, timeout)
+            if entry is None:
+                # slot reserved, sign on outside the lock
+                try:
+                    return self._new_session()
+                except Exception:
+                    self._discard(None)
+                    raise
+            pip, last_used = entry
+            if self._healthy(pip, last_used):
+                return pip
+            self._discard(pip)
+
+    def release(self, pip, discard=False):
+        """
+        Check a session back in, or close it if discard is set, the session
+        is unusable (after a timeout or cancel()) or the pool was closed
+        """
+        if discard or self._closed or _unusable(pip):
+            self._discard(pip)
+        else:
+            self._checkin(pip)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for pip, _ in idle:
+            self._discard(pip)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _reserve(self, deadline, timeout):
+        """
+        Pop an idle (pip, last checkin) entry or, if none and pool is not
+        full, reserve a slot for a new session (returning None)
+        """
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise Exception('POOL_ERROR', 'Pool is closed')
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - _monotonic()
+                    if remaining <= 0:
+                        raise Exception(
+                            'POOL_TIMEOUT',
+                            'No session available in %ss' % timeout
+                        )
+                    self._cond.wait(remaining)
+
+    def _healthy(self, pip, last_used):
+        if _unusable(pip):
+            return False
+        now = _monotonic()
+        if (
+            self.max_lifetime is not None and
+            now - self._born[id(pip)] >= self.max_lifetime
+        ):
+            return False
+        if (
+            self.probe_after is not None and
+            now - last_used >= self.probe_after
+        ):
+            try:
+                self.probe(pip)
+            except Exception:
+                return False
+        return True
+
+    def connect(self):
+        """
+        Open and sign on a new session, override to create them differently
+        """
+        pip = PIP(self._server_type)
+        pip.connect(*self._connect_args)
+        return pip
+
+    def _new_session(self):
+        pip = self.connect()
+        self._born[id(pip)] = _monotonic()
+        return pip
+
+    def _checkin(self, pip):
+        with self._cond:
+            self._idle.append((pip, _monotonic()))
+            self._cond.notify()
+
+    def _discard(self, pip):
+        if pip is not None:
+            self._born.pop(id(pip), None)
+            try:
+                pip.close()
+            except Exception:
+                pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+            refill = (
+                not self._closed and not self._refilling and
+                self._size < self.min_size
+            )
+            if refill:
+                self._refilling = True
+        if refill:
+            # not in the caller's thread, the server may well be down
+            thread = threading.Thread(target=self._refill)
+            thread.daemon = True
+            thread.start()
+
+    def _refill(self):
+        """
+        Sign on sessions until min_size are open again, giving up at the
+        first failure (until the next discard)
+        """
+        try:
+            while True:
+                with self._cond:
+                    if self._closed or self._size >= self.min_size:
+                        return
+                    self._size += 1
+                try:
+                    pip = self._new_session()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    return
+                # discarded if the pool was closed meanwhile
+                self.release(pip)
+        finally:
+            with self._cond:
+                self._refilling = False
+
+    def _is_broken(self, exc):
+        if isinstance(exc, (socket.error, EnvironmentError)):
+            return True
+        return bool(exc.args) and exc.args[0] in self.broken_errors
+
+
+def _unusable(pip):
+    return bool(getattr(pip, '_unusable', None))
@@ -0,0 +1,246 @@
+"""
+Spread PIP sessions over several MTM servers
+
+    router = Router(
+        [('pip1', 61315, 2), ('pip2', 61315, 1)], '1', 'XXX',
+        strategy='round_robin'
+    )
+    pip = router.connect()
+    pool = router.pool(max_size=16)
+
+Endpoints that fail to connect (or fail a request) are skipped until a
+backoff, doubling with each consecutive failure, expires.
+"""
+import threading
+from .mysix import _monotonic
+from .pip import PIP
+from .pool import PIPPool
+
+
+LEAST_OUTSTANDING = 'least_outstanding'
+ROUND_ROBIN = 'round_robin'
+
+
+class Endpoint(object):
+    def __init__(self, host, port, weight=1):
+        self.host = host
+        self.port = port
+        self.weight = weight
+        # requests currently waiting for a reply
+        self.outstanding = 0
+        self.sessions = 0
+        self.failures = 0
+        self.down_until = 0
+        self.requests = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        # exponentially weighted moving average of latency
+        self.ewma_time = None
+        # smooth weighted round robin state
+        self._current = 0
+
+    def stats(self):
+        mean_time = None
+        if self.requests:
+            mean_time = self.total_time / self.requests
+        return {
+            'host': self.host,
+            'port': self.port,
+            'weight': self.weight,
+            'up': self.down_until <= _monotonic(),
+            'sessions': self.sessions,
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'errors': self.errors,
+            'mean_time': mean_time,
+            'ewma_time': self.ewma_time,
+            'max_time': self.max_time,
+        }
+
+
+class RoutedPIP(PIP):
+    """
+    PIP session reporting its requests to the Endpoint it is connected to
+    """
+    def __init__(self, router, endpoint, server_type='SCA$IBS'):
+        super(RoutedPIP, self).__init__(server_type)
+        self.router = router
+        self.endpoint = endpoint
+        self._counted = False
+
+    def exchange_message(self, *args, **kwargs):
+        self.router._begin(self.endpoint)
+        start = _monotonic()
+        try:
+            result = super(RoutedPIP, self).exchange_message(*args, **kwargs)
+        except Exception:
+            self.router._end(self.endpoint, _monotonic() - start, False)
+            if self._token is not None:
+                # sign on failures are handled by Router.connect
+                self.router._failed(self.endpoint)
+            raise
+        self.router._end(self.endpoint, _monotonic() - start, True)
+        return result
+
+    def _sent(self, service_class):
+        self.router._begin(self.endpoint)
+        return super(RoutedPIP, self)._sent(service_class)
+
+    def _replied(self, service_class, start, success=True):
+        super(RoutedPIP, self)._replied(service_class, start, success)
+        self.router._end(self.endpoint, _monotonic() - start, success)
+
+    def _pipeline_failed(self, exc, pending):
+        super(RoutedPIP, self)._pipeline_failed(exc, pending)
+        self.router._failed(self.endpoint)
+
+    def close(self):
+        super(RoutedPIP, self).close()
+        if self._counted:
+            self._counted = False
+            self.router._closed(self.endpoint)
+
+
+class Router(object):
+    # weight of the latest request in Endpoint.ewma_time
+    ewma_alpha = 0.2
+
+    def __init__(self, endpoints, user, password, server_type='SCA$IBS',
+                 strategy=LEAST_OUTSTANDING, backoff=1, max_backoff=60):
+        """
+        endpoints: list of (host, port) or (host, port, weight)
+        strategy: LEAST_OUTSTANDING (fewest requests in flight, then fewest
+                  sessions, relative to weight) or ROUND_ROBIN (weighted)
+        backoff: seconds an endpoint is skipped after its first failure
+        """
+        if strategy not in (LEAST_OUTSTANDING, ROUND_ROBIN):
+            raise Exception('VAL_ERROR', 'Unknown strategy %s' % strategy)
+        self.endpoints = [Endpoint(*e) for e in endpoints]
+        if not self.endpoints:
+            raise Exception('VAL_ERROR', 'No endpoints')
+        self._user = user
+        self._password = password
+        self._server_type = server_type
+        self.strategy = strategy
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+
+    def connect(self):
+        """
+        Open and sign on a session on the preferred endpoint, trying the
+        others (in order of preference) if it fails
+        """
+        error = None
+        for endpoint in self._candidates():
+            pip = RoutedPIP(self, endpoint, self._server_type)
+            try:
+                pip.connect(
+                    endpoint.host, endpoint.port, self._user, self._password
+                )
+            except Exception as e:
+                error = e
+                self._failed(endpoint)
+                try:
+                    pip.close()
+                except Exception:
+                    pass
+                continue
+            with self._lock:
+                endpoint.sessions += 1
+                endpoint.failures = 0
+            pip._counted = True
+            return pip
+        raise error
+
+    def pool(self, **kwargs):
+        """
+        PIPPool of sessions opened through this router
+        """
+        return RoutedPool(self, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return [e.stats() for e in self.endpoints]
+
+    def _candidates(self):
+        """
+        Endpoints that are up, best first, followed by those in backoff
+        (soonest to be retried first)
+        """
+        now = _monotonic()
+        with self._lock:
+            up = [e for e in self.endpoints if e.down_until <= now]
+            down = sorted(
+                (e for e in self.endpoints if e.down_until > now),
+                key=lambda e: e.down_until
+            )
+            if self.strategy == ROUND_ROBIN:
+                up = self._round_robin(up)
+            else:
+                up.sort(key=lambda e: (
+                    float(e.outstanding) / e.weight,
+                    float(e.sessions) / e.weight
+                ))
+        return up + down
+
+    def _round_robin(self, endpoints):
+        """
+        Smooth weighted round robin: pick the endpoint with the highest
+        accumulated weight, the rest follow as fallbacks
+        """
+        if not endpoints:
+            return endpoints
+        total = 0
+        for e in endpoints:
+            e._current += e.weight
+            total += e.weight
+        best = max(endpoints, key=lambda e: e._current)
+        best._current -= total
+        return [best] + [e for e in endpoints if e is not best]
+
+    def _failed(self, endpoint):
+        with self._lock:
+            endpoint.failures += 1
+            endpoint.down_until = _monotonic() + min(
+                self.backoff * 2 ** (endpoint.failures - 1),
+                self.max_backoff
+            )
+
+    def _begin(self, endpoint):
+        with self._lock:
+            endpoint.outstanding += 1
+
+    def _end(self, endpoint, elapsed, success):
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.requests += 1
+            endpoint.total_time += elapsed
+            endpoint.max_time = max(endpoint.max_time, elapsed)
+            if endpoint.ewma_time is None:
+                endpoint.ewma_time = elapsed
+            else:
+                endpoint.ewma_time += self.ewma_alpha * (
+                    elapsed - endpoint.ewma_time
+                )
+            if not success:
+                endpoint.errors += 1
+
+    def _closed(self, endpoint):
+        with self._lock:
+            endpoint.sessions -= 1
+
+
+class RoutedPool(PIPPool):
+    """
+    PIPPool creating its sessions through a Router
+    """
+    def __init__(self, router, **kwargs):
+        self._router = router
+        super(RoutedPool, self).__init__(
+            None, None, None, None, router._server_type, **kwargs
+        )
+
+    def connect(self):
+        return self._router.connect()
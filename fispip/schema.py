@@ -0,0 +1,170 @@
+"""
+Column metadata of SELECT results, from the data dictionary
+
+    columns = pip.describe('SELECT CID,BAL FROM DEP')
+    # [Column(name='CID', type='N', length=12, decimals=0), ...]
+    rows, col_types = pip.executeSQL('SELECT CID,BAL FROM DEP', named=True)
+    rows[0].CID
+
+Column definitions (DBTBL1D) are read once per table into schema_cache,
+shared by every session, until refresh() is called.
+"""
+import collections
+import re
+from .cache import LRUCache, TTLCache
+from .mysix import makestring
+
+
+Column = collections.namedtuple('Column', 'name type length decimals')
+
+DICTIONARY_QUERY = 'SELECT DI,TYP,LEN,DEC FROM DBTBL1D WHERE FID=?'
+
+_SELECT = re.compile(
+    r'^\s*SELECT\s+(?:DISTINCT\s+|ALL\s+)?(.*?)\s+FROM\s+(.*?)'
+    r'(?:\s+(?:WHERE|GROUP|HAVING|ORDER|UNION)\b.*)?$',
+    re.I | re.S
+)
+_COLUMN = re.compile(r'^(?:(\w+)\.)?(\*|[\w%]+)$')
+
+# named tuple classes, by column names
+_row_types = LRUCache(256)
+
+
+class SchemaCache(object):
+    """
+    Column definitions by table, loaded on first use. Concurrent loads of
+    the same table are merged into a single dictionary query
+    """
+    def __init__(self, maxsize=1024):
+        self._tables = TTLCache(maxsize, ttl=float('inf'))
+
+    def table(self, pip, name):
+        """
+        Returns an OrderedDict of column name -> Column for table `name`,
+        querying the data dictionary through pip if not cached yet
+        """
+        name = name.upper()
+        return self._tables.get_or_load(name, lambda: self._load(pip, name))
+
+    def refresh(self, table=None):
+        """
+        Drop the cached definition of table (of every table if None)
+        """
+        if table is None:
+            self._tables.invalidate()
+        else:
+            self._tables.pop(table.upper())
+
+    def _load(self, pip, name):
+        # through a cursor, tables can have more columns than max_rows
+        with pip.cursor(DICTIONARY_QUERY, name) as cursor:
+            rows = cursor.fetchall()
+        columns = collections.OrderedDict()
+        for row in rows:
+            di, typ, length, decimals = makestring(row).split('\t')
+            columns[di] = Column(di, typ, _int(length), _int(decimals))
+        if not columns:
+            raise Exception('VAL_ERROR', 'Unknown table %s' % name)
+        return columns
+
+
+schema_cache = SchemaCache()
+
+
+def describe(pip, query, types=None, cache=schema_cache):
+    """
+    Returns a Column for each column of a SELECT result. Columns that are
+    not plain table columns (functions, expressions) are named after their
+    text, with the type from `types` (the result column types) if given
+    """
+    m = _SELECT.match(query)
+    if m is None:
+        raise Exception('VAL_ERROR', 'Not a SELECT')
+
+    # alias (or table name) -> table name
+    tables = collections.OrderedDict()
+    for table in _split(m.group(2)):
+        words = table.split()
+        tables[words[-1].upper()] = words[0].upper()
+        tables[words[0].upper()] = words[0].upper()
+
+    columns = []
+    for item in _split(m.group(1)):
+        c = _COLUMN.match(item)
+        if c is None:
+            columns.append(_expression(item, types, len(columns)))
+            continue
+
+        table, name = c.group(1), c.group(2).upper()
+        if table is not None:
+            candidates = [tables.get(table.upper(), table.upper())]
+        else:
+            candidates = list(collections.OrderedDict.fromkeys(
+                tables.values()
+            ))
+
+        if name == '*':
+            for t in candidates:
+                columns.extend(cache.table(pip, t).values())
+            continue
+
+        for t in candidates:
+            column = cache.table(pip, t).get(name)
+            if column is not None:
+                columns.append(column)
+                break
+        else:
+            columns.append(_expression(item, types, len(columns)))
+
+    return columns
+
+
+def row_type(columns):
+    """
+    Named tuple class with a field per column (invalid or duplicate names
+    are renamed to _<position>)
+    """
+    names = tuple(c.name for c in columns)
+    cls = _row_types.get(names)
+    if cls is None:
+        cls = collections.namedtuple('Row', names, rename=True)
+        _row_types.put(names, cls)
+    return cls
+
+
+def _expression(item, types, position):
+    if types is not None and position < len(types):
+        return Column(item, types[position], None, None)
+    return Column(item, None, None, None)
+
+
+def _split(text):
+    """
+    Split on commas outside parentheses and quotes
+    """
+    parts = []
+    depth = 0
+    quote = None
+    last = 0
+    for i, ch in enumerate(text):
+        if quote is not None:
+            if ch == quote:
+                quote = None
+        elif ch in '\'"':
+            quote = ch
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == ',' and not depth:
+            parts.append(text[last:i].strip())
+            last = i + 1
+    parts.append(text[last:].strip())
+    return [p for p in parts if p]
+
+
+def _int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return None
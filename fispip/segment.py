@@ -0,0 +1,111 @@
+"""
+Move data too large for a single frame through MRPCs that take (or return)
+it in pieces, in as few calls as frames allow
+
+    # MRPC121 INITCODE, carrying a token from one call to the next
+    token = segment.send(
+        pip, '121', ['INITCODE', None, ''], 1, code,
+        update=lambda args, result: args[:2] + [result[0]],
+        success_unpack=True
+    )
+    # MRPC121 RETOBJ, call returning (has_more, piece)
+    code = segment.collect(lambda: ret_obj(token))
+"""
+from .mysix import _range
+
+
+def split(data, limit, encode=None):
+    """
+    Yield the pieces of data, each as long as fits `limit` (an int, or a
+    callable returning it before each piece).
+    encode, if given, maps each element of data (byte or character) to its
+    encoded string and the encoded pieces are yielded instead.
+    Raises VAL_ERROR if the limit is below 1 or an encoded element does not
+    fit it
+    """
+    def get_limit():
+        size = limit() if callable(limit) else limit
+        if size < 1:
+            raise Exception('VAL_ERROR', 'Invalid piece size %d' % size)
+        return size
+
+    if encode is None:
+        i = 0
+        while i < len(data):
+            size = get_limit()
+            yield data[i:i + size]
+            i += size
+        return
+
+    size = get_limit()
+    piece = []
+    piece_size = 0
+    for element in data:
+        encoded = encode(element)
+        if piece and piece_size + len(encoded) > size:
+            yield ''.join(piece)
+            size = get_limit()
+            piece = []
+            piece_size = 0
+        if len(encoded) > size:
+            raise Exception(
+                'VAL_ERROR',
+                'Encoded element of %d exceeds piece size %d' % (
+                    len(encoded), size
+                )
+            )
+        piece.append(encoded)
+        piece_size += len(encoded)
+    if piece:
+        yield ''.join(piece)
+
+
+def send(pip, mrpc_id, args, index, data, encode=None, update=None,
+         **kwargs):
+    """
+    executeMRPC(mrpc_id, *args) once per piece of data (see split), each
+    placed at args[index] and as large as frames allow.
+    update(args, result), if given, returns the args for the next call.
+    Extra keyword arguments are passed to executeMRPC.
+    Returns the result of the last call (None if there was no data)
+    """
+    version = kwargs.get('version', '1')
+    args = list(args)
+    result = None
+
+    def limit():
+        return pip.mrpc_arg_limit(mrpc_id, args, index, version)
+
+    for piece in split(data, limit, encode):
+        args[index] = piece
+        result = pip.executeMRPC(mrpc_id, *args, **kwargs)
+        if update is not None:
+            args = list(update(args, result))
+    return result
+
+
+def collect(call):
+    """
+    Join a reply returned in pieces: call() returns (has_more, piece) and is
+    repeated while has_more is set
+    """
+    pieces = []
+    has_more = True
+    while has_more:
+        has_more, piece = call()
+        pieces.append(piece)
+    return ''.join(pieces)
+
+
+def decimal_codes(separator='|'):
+    """
+    encode table for split/send turning each byte into its decimal code
+    followed by separator (as MRPC121 INITCODE expects)
+    """
+    table = ['%d%s' % (b, separator) for b in _range(256)]
+
+    def encode(element):
+        if isinstance(element, int):
+            return table[element]
+        return table[ord(element)]
+    return encode
@@ -0,0 +1,173 @@
+"""
+Interactive PIP shell over a single signed-on session
+
+    $ python -m fispip shell localhost
+    fispip> SELECT TJD FROM CUVAR
+    60960
+    (1 row, 2.1 ms, 142 B sent, 98 B received)
+    fispip> :mrpc 155 "SELECT TJD FROM CUVAR"
+    fispip> \\rows 100
+
+SELECT results are paged through a cursor, max_rows rows at a time.
+"""
+import shlex
+import sys
+from . import metrics
+from .mysix import _input, _monotonic
+
+
+HELP = """\
+SQL_STATEMENT              execute SQL (SELECT results are paged)
+:mrpc ID [PARAM...]        execute MRPC (shell-style quoting)
+\\timing                    toggle round trip time and bytes display
+\\rows N                    rows per page and FETCH (max_rows)
+\\?                         this help
+\\q                         quit
+"""
+
+
+class Shell(object):
+    def __init__(self, pip, stdin=None, stdout=None):
+        self._pip = pip
+        self._stdin = stdin or sys.stdin
+        self._stdout = stdout or sys.stdout
+        self._interactive = self._stdin is sys.stdin and sys.stdin.isatty()
+        self.timing = True
+        # bytes transferred are taken from the metrics registry
+        self._registry = metrics.registry or metrics.enable()
+        # seconds spent in requests by the current command
+        self._elapsed = 0
+
+    def run(self):
+        if self._interactive:
+            try:
+                import readline  # noqa: F401 (line editing and history)
+            except ImportError:
+                pass
+            self._write('Connected, \\? for help\n')
+
+        while True:
+            line = self._read('fispip> ')
+            if line is None:
+                break
+            line = line.strip().rstrip(';')
+            if not line:
+                continue
+            if line in ('\\q', 'quit', 'exit'):
+                break
+            self.execute(line)
+
+    def execute(self, line):
+        """
+        Run one command, printing its output and statistics
+        """
+        if line.startswith('\\'):
+            return self._meta(line)
+
+        self._elapsed = 0
+        sent = self._registry.value('fispip_bytes_sent_total')
+        received = self._registry.value('fispip_bytes_received_total')
+        try:
+            if line.startswith(':mrpc'):
+                args = shlex.split(line[5:])
+                if not args:
+                    raise Exception('VAL_ERROR', 'Missing MRPC id')
+                result = self._timed(self._pip.executeMRPC, *args)
+                self._write('%s\n' % result)
+                count = None
+            elif line[:6].lower() == 'select':
+                count = self._select(line)
+            else:
+                rows, _ = self._timed(self._pip.executeSQL, line)
+                count = len([r for r in rows if r])
+                for row in rows:
+                    if row:
+                        self._write(row + '\n')
+        except Exception as e:
+            self._write('ERROR: %s\n' % ': '.join(str(a) for a in e.args))
+            count = None
+
+        stats = []
+        if count is not None:
+            stats.append('%d row%s' % (count, '' if count == 1 else 's'))
+        if self.timing:
+            stats.append('%.1f ms' % (self._elapsed * 1000))
+            stats.append('%s sent' % _size(
+                self._registry.value('fispip_bytes_sent_total') - sent
+            ))
+            stats.append('%s received' % _size(
+                self._registry.value('fispip_bytes_received_total') -
+                received
+            ))
+        if stats:
+            self._write('(%s)\n' % ', '.join(stats))
+
+    def _select(self, query):
+        page = self._pip.max_rows
+        cursor = self._timed(self._pip.cursor, query, batch_size=page)
+        count = 0
+        try:
+            while True:
+                rows = self._timed(cursor.fetchmany, page)
+                for row in rows:
+                    self._write(row + '\n')
+                count += len(rows)
+                if len(rows) < page:
+                    break
+                if self._interactive:
+                    answer = self._read('-- more (Enter, q to stop) --')
+                    if answer is None or answer.strip().lower() == 'q':
+                        break
+        finally:
+            self._timed(cursor.close)
+        return count
+
+    def _meta(self, line):
+        parts = line.split()
+        command = parts[0]
+        if command == '\\timing':
+            self.timing = not self.timing
+            self._write('Timing is %s\n' % ('on' if self.timing else 'off'))
+        elif command == '\\rows':
+            try:
+                self._pip.max_rows = int(parts[1])
+            except (IndexError, ValueError):
+                self._write('Usage: \\rows N\n')
+                return
+            self._write('max_rows is %d\n' % self._pip.max_rows)
+        elif command == '\\?':
+            self._write(HELP)
+        else:
+            self._write('Unknown command %s, \\? for help\n' % command)
+
+    def _timed(self, fn, *args, **kwargs):
+        start = _monotonic()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._elapsed += _monotonic() - start
+
+    def _read(self, prompt):
+        """
+        Next input line, None at end of input
+        """
+        if self._interactive:
+            try:
+                return _input(prompt)
+            except EOFError:
+                self._write('\n')
+                return None
+        line = self._stdin.readline()
+        if not line:
+            return None
+        return line
+
+    def _write(self, text):
+        self._stdout.write(text)
+        self._stdout.flush()
+
+
+def _size(n):
+    if n < 1024:
+        return '%d B' % n
+    return '%.1f KB' % (n / 1024.0)
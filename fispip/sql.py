@@ -0,0 +1,40 @@
+"""
+SQL statement helpers
+"""
+import re
+from .cache import LRUCache
+
+
+# quoted literals (possibly unterminated) are matched whole so that any
+# "?" inside them is skipped, doubled quotes are just two literals in a row
+_TOKENS = re.compile(r"'[^']*(?:'|$)|\"[^\"]*(?:\"|$)|\?")
+
+# compiled statements, by query text
+statement_cache = LRUCache(256)
+
+
+def compile_query(query):
+    """
+    Replace "?" placeholders (outside quotes) with :C1..:Cn host variables.
+    Returns (compiled query, number of placeholders), from statement_cache
+    when the same query was already compiled
+    """
+    compiled = statement_cache.get(query)
+    if compiled is None:
+        compiled = _compile(query)
+        statement_cache.put(query, compiled)
+    return compiled
+
+
+def _compile(query):
+    parts = []
+    markers = 0
+    last = 0
+    for m in _TOKENS.finditer(query):
+        if m.group() == '?':
+            markers += 1
+            parts.append(query[last:m.start()])
+            parts.append(':C%d' % markers)
+            last = m.end()
+    parts.append(query[last:])
+    return (''.join(parts), markers)
@@ -0,0 +1,254 @@
+"""
+Store-and-forward (fire-and-forget) submission of SQL/MRPC requests
+
+    stf = StoreAndForward(pool, path='/var/spool/app/pip.journal')
+    ticket = stf.submit_mrpc('901', 'AUDIT', 'login')
+    ...
+    stf.status(ticket)  # 'pending', 'delivered', 'failed' or None
+
+Requests are queued in memory (and journaled to `path`, if given, so that
+undelivered ones survive a restart) and sent, with the STF header flag set,
+by a background thread using sessions from a PIPPool.
+"""
+import collections
+import json
+import os
+import threading
+import uuid
+from . import lv
+from .cache import LRUCache
+from .mysix import _monotonic, _replace
+from .pip import SERV_CLASS_SQL, SERV_CLASS_MRPC
+
+
+PENDING = 'pending'
+DELIVERED = 'delivered'
+FAILED = 'failed'
+
+
+class StoreAndForward(object):
+    def __init__(self, pool, path=None, retry_delay=1, max_acks=10000,
+                 max_retries=None):
+        """
+        retry_delay: seconds to wait before resending after a transport error
+        max_acks: number of acknowledgements kept for status()
+        max_retries: resends after which a request is failed with the last
+                     transport error, instead of holding up the queue
+                     (None retries until delivered)
+        """
+        self._pool = pool
+        self._path = path
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        # ticket -> (True, result) or (False, exception)
+        self.acks = LRUCache(max_acks)
+
+        self._cond = threading.Condition()
+        # (ticket, service class, request)
+        self._queue = collections.deque()
+        self._pending = set()
+        self._stopped = False
+
+        self._journal = None
+        if path:
+            self._replay()
+
+        self._thread = threading.Thread(target=self._drain)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit_mrpc(self, mrpc_id, *args, **kwargs):
+        """
+        Queue an MRPC call, returns its ticket
+        """
+        version = kwargs.get('version', '1')
+        return self._submit(SERV_CLASS_MRPC, [mrpc_id, list(args), version])
+
+    def submit_sql(self, query, *args):
+        """
+        Queue a (non SELECT) SQL statement, returns its ticket
+        """
+        if query[:6].lower() == 'select':
+            raise Exception('VAL_ERROR', 'SELECT cannot be forwarded')
+        return self._submit(SERV_CLASS_SQL, [query, list(args)])
+
+    def status(self, ticket):
+        """
+        'pending', 'delivered', 'failed' or None if unknown (or forgotten)
+        """
+        with self._cond:
+            if ticket in self._pending:
+                return PENDING
+        ack = self.acks.get(ticket)
+        if ack is None:
+            return None
+        return DELIVERED if ack[0] else FAILED
+
+    def result(self, ticket):
+        """
+        Reply of a delivered request, raises the error of a failed one
+        """
+        ack = self.acks.get(ticket)
+        if ack is None:
+            raise Exception('VAL_ERROR', 'No acknowledgement for %s' % ticket)
+        if not ack[0]:
+            raise ack[1]
+        return ack[1]
+
+    def flush(self, timeout=None):
+        """
+        Wait until the queue is empty, returns False on timeout
+        """
+        deadline = None if timeout is None else _monotonic() + timeout
+        with self._cond:
+            while self._queue:
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - _monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+            return True
+
+    def close(self, timeout=None):
+        """
+        Stop after flushing (up to timeout seconds), requests still queued
+        are only kept in the journal
+        """
+        self.flush(timeout)
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self._journal is not None:
+            self._journal.close()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def _submit(self, service_class, request):
+        ticket = uuid.uuid4().hex
+        with self._cond:
+            self._write_journal(['+', ticket, service_class, request])
+            self._queue.append((ticket, service_class, request))
+            self._pending.add(ticket)
+            self._cond.notify_all()
+        return ticket
+
+    def _drain(self):
+        # transport errors of the request at the head of the queue
+        retries = 0
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                ticket, service_class, request = self._queue[0]
+
+            try:
+                ack = self._send(service_class, request)
+            except Exception as e:
+                # transport error (session already discarded by the pool)
+                if self.max_retries is None or retries < self.max_retries:
+                    retries += 1
+                    with self._cond:
+                        self._cond.wait(self.retry_delay)
+                    continue
+                ack = (False, e)
+            retries = 0
+
+            with self._cond:
+                self._queue.popleft()
+                self._pending.discard(ticket)
+                self.acks.put(ticket, ack)
+                self._write_journal(['-', ticket])
+                if not self._queue:
+                    self._compact_journal()
+                self._cond.notify_all()
+
+    def _send(self, service_class, request):
+        """
+        Returns the acknowledgement for request, raises on transport errors.
+        Requests that can never be sent (invalid, too large for a frame)
+        are failed without sending them
+        """
+        with self._pool.connection() as pip:
+            try:
+                if service_class == SERV_CLASS_MRPC:
+                    mrpc_id, args, version = request
+                    message = pip._mrpc_message(mrpc_id, args, version)
+                    parse = pip._mrpc_reply
+                else:
+                    query, args = request
+                    message, _ = pip._sql_message(query, args)
+                    parse = pip._sql_reply
+                size = lv.packed_size(len(message))
+                if size > pip.max_frame - pip._frame_overhead():
+                    raise Exception(
+                        'MTM_ERROR',
+                        'Request of %d bytes exceeds max_frame (%d)' % (
+                            size, pip.max_frame
+                        )
+                    )
+            except Exception as e:
+                return (False, e)
+
+            result = pip.exchange_message(
+                service_class, message, stf_flg='1'
+            )
+
+        try:
+            return (True, parse(result))
+        except Exception as e:
+            return (False, e)
+
+    def _replay(self):
+        """
+        Queue the requests journaled but not acknowledged by a previous run
+        """
+        pending = collections.OrderedDict()
+        if os.path.exists(self._path):
+            with open(self._path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # truncated last line
+                        continue
+                    if entry[0] == '+':
+                        pending[entry[1]] = (entry[1], entry[2], entry[3])
+                    else:
+                        pending.pop(entry[1], None)
+
+        self._queue.extend(pending.values())
+        self._pending.update(pending)
+        self._compact_journal()
+
+    def _compact_journal(self):
+        """
+        Replace the journal with the queued requests only, written aside
+        and renamed over it so that a crash leaves one or the other
+        """
+        if not self._path:
+            return
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for ticket, service_class, request in self._queue:
+                f.write(
+                    json.dumps(['+', ticket, service_class, request]) + '\n'
+                )
+            f.flush()
+            os.fsync(f.fileno())
+        if self._journal is not None:
+            self._journal.close()
+        try:
+            _replace(tmp_path, self._path)
+        finally:
+            self._journal = open(self._path, 'a')
+
+    def _write_journal(self, entry):
+        if self._journal is not None:
+            self._journal.write(json.dumps(entry) + '\n')
+            self._journal.flush()
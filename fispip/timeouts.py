@@ -0,0 +1,57 @@
+"""
+Deadlines for MTM/PIP calls
+
+    with deadline(5):
+        pip.executeSQL('SELECT TJD FROM CUVAR')
+        with deadline(2):
+            # at most 2 seconds, and never past the outer 5 seconds
+            pip.executeMRPC('155', 'SELECT TJD FROM CUVAR')
+
+Deadlines apply to every connect, send and receive made by the current
+thread while they are active. When one expires MTMTimeout is raised and the
+session is left unusable, as a late reply would be taken for the next one.
+"""
+import contextlib
+import threading
+from .mysix import _monotonic
+
+
+_local = threading.local()
+
+
+class MTMTimeout(Exception):
+    """
+    Deadline expired, args being ('MTM_TIMEOUT', message) as with other
+    errors
+    """
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """
+    Limit the enclosed calls to `seconds` (None adds no limit), within the
+    time left of any enclosing deadline
+    """
+    if seconds is None:
+        yield
+        return
+
+    previous = getattr(_local, 'deadline', None)
+    expires = _monotonic() + seconds
+    if previous is not None and previous < expires:
+        expires = previous
+    _local.deadline = expires
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def remaining():
+    """
+    Seconds left before the current deadline, None if there is none
+    """
+    expires = getattr(_local, 'deadline', None)
+    if expires is None:
+        return None
+    return expires - _monotonic()
@@ -0,0 +1,247 @@
+"""
+Download and upload Profile elements (procedures, data, tables...) through
+MRPC121 instead of a shell, one at a time or many concurrently over the
+sessions of a pool
+
+    tbx = Toolbox(pip)
+    code = tbx.get_element_by_name('MRPC121.PROC')
+    tbx.send_element('STBLMSG-9999.DAT', data)
+
+    pool = PIPPool('localhost', 61315, '1', 'XXX', max_size=8)
+    for filename, code in get_elements(pool, filenames):
+        ...
+    for path, error in send_elements(pool, paths):
+        ...
+
+Code is uploaded in as few INITCODE calls as frames allow (see segment).
+Implementation based on crtns/MRPC121.PSL and mrtns/TBXDQSVR.m (in PIP
+directory)
+"""
+import getpass
+import os
+from . import parallel
+from . import segment
+from .mysix import _basestring, makebytes
+
+
+OBJ_TYPES = {
+    # incomplete mapping based on TBXDQSVR.m
+    'DAT': 'Data',
+    'PROC': 'Procedure',
+    'TBL': 'Table',
+    'COL': 'Column'
+}
+
+# INITCODE takes the code as '|' terminated decimal byte values
+_encode_code = segment.decimal_codes()
+
+
+def guess_type(filename):
+    """
+    (object type, object id) of an element file name, such as
+    ('Procedure', 'MRPC121') for MRPC121.PROC
+    """
+    name, ext = os.path.splitext(os.path.basename(filename))
+    if ext:
+        ext = OBJ_TYPES.get(ext[1:].upper(), '')
+    return ext, name
+
+
+class MRPC121(object):
+    """
+    Calls exposed by MRPC121
+    """
+    def __init__(self, connection=None, mrpc_id='121'):
+        self._con = connection
+        self._id = mrpc_id
+
+    def _call(self, *args):
+        return self._con.executeMRPC(self._id, *args, success_unpack=True)[0]
+
+    def init_obj(self, obj_type, obj_id):
+        r = self._call(
+            'INITOBJ',
+            '', '', '', obj_type, obj_id
+        )
+        if r[0] == '0':
+            # some of the TBX routines split code and message
+            # with | (pipe - such as Data)
+            # others split with '\r' (such as Procedure)
+            # and the default "Invalid Type" error is split with '\r\n'
+            err = r[2:]
+            if err[:1] == '\n':
+                err = err[1:]
+            raise Exception('TBX_ERROR', err)
+        return r.split('\r\n')[1:]
+
+    def ret_obj(self, token):
+        r = self._call(
+            'RETOBJ',
+            '', '', '', '', '', token
+        )
+        has_more = r[0] == '1'
+        return has_more, r[1:]
+
+    def init_code(self, code, compilation_token):
+        return self._call(
+            'INITCODE',
+            code, compilation_token
+        )
+
+    def check_obj(self, local_file, token):
+        r = self._call(
+            'CHECKOBJ',
+            '', '', local_file, '', '', token
+        )
+        if r[0] == '0':
+            raise Exception('TBX_ERROR', r[3:])
+
+    def save_obj(self, local_file, token, username):
+        r = self._call(
+            'SAVEOBJ',
+            '', '', local_file, '', '', token, username
+        )
+        if r[0] == '0':
+            raise Exception('TBX_ERROR', r[3:])
+
+    def exec_comp(self, local_file, compilation_token):
+        return self._call(
+            'EXECCOMP',
+            '', compilation_token, local_file
+        )
+
+
+class MRPC081(object):
+    """
+    This procedure exists in PIP but it is not registered as an RPC
+
+    Register easily with
+
+    GTM>s ^SCATBL(5,81)="Profile Interface ToolBox|$$^MRPC081|PBS|1|1|1|1|1|1|1|1|1|0|0|0|0|0|0|0|0|0|0|0|0|0|0|0|0|0"  # noqa: E501
+    GTM>s ^SCATBL(5,81,"SCA")=0
+
+    Or using a .DAT and sending it with MRPC121,
+    as in docker_integration_tests.py
+    """
+    def __init__(self, connection=None, mrpc_id='81'):
+        self._con = connection
+        self._id = mrpc_id
+
+    def _call(self, *args):
+        return self._con.executeMRPC(self._id, *args, success_unpack=True)[0]
+
+    def compile(self, table, elements):
+        return self._call(table, elements)
+
+
+class Toolbox(object):
+    """
+    Element transfer over a (text, not binary) PIP session.
+    Elements are saved under `username` (default: the local user)
+    """
+    def __init__(self, pip, username=None):
+        self._pip = pip
+        self.username = username or getpass.getuser()
+        self._rpc = MRPC121(pip)
+        self._rpc81 = MRPC081(pip)
+
+    def get_element(self, obj_type, obj_id):
+        """
+        Returns the code of an element
+        """
+        token, name = self._rpc.init_obj(obj_type, obj_id)
+        return segment.collect(lambda: self._rpc.ret_obj(token))
+
+    def get_element_by_name(self, filename):
+        return self.get_element(*guess_type(filename))
+
+    def send_element(self, filename, code):
+        """
+        Upload code (bytes or latin-1 str), checked and saved as the
+        element named by filename
+        """
+        token = self._send_code(code)
+        local_file = os.path.basename(filename)
+        self._rpc.check_obj(local_file, token)
+        self._rpc.save_obj(local_file, token, self.username)
+
+    def test_compile_element(self, filename, code):
+        """
+        Returns the compilation output of code, without saving it
+        """
+        token = self._send_code(code)
+        return self._rpc.exec_comp(os.path.basename(filename), token)
+
+    def compile_and_link(self, filename):
+        ext, name = guess_type(filename)
+        if ext == 'Procedure':
+            table = 'DBTBL25'
+        elif ext in ['Table', 'Column']:
+            table = 'DBTBL1'
+        else:
+            raise Exception('VAL_ERROR', 'Cannot compile %s %s' % (ext, name))
+        return self._rpc81.compile(table, name)
+
+    def _send_code(self, code):
+        # as many bytes per INITCODE as fit in a frame
+        result = segment.send(
+            self._pip, self._rpc._id, ['INITCODE', '', ''], 1,
+            makebytes(code), encode=_encode_code,
+            update=lambda args, result: args[:2] + [result[0]],
+            success_unpack=True
+        )
+        token = '' if result is None else result[0]
+        # one last call to make sure code is saved even if it doesn't end
+        # in a NEWLINE (condition based on INITCOD1^TBXDQSVR.m)
+        # this is also useful in case we're trying to send an empty file
+        # in which case, the previous calls did not initialize
+        # the token (required for check_obj and save_obj)
+        return self._rpc.init_code('', token)
+
+
+def get_elements(pool, filenames, concurrency=None, timeout=None):
+    """
+    Download elements by file name (see guess_type) over the sessions of
+    pool, yielding (filename, code) as each one completes, the exception
+    instead of code for the ones that failed.
+    concurrency and timeout (per element) as in parallel.map_sql
+    """
+    filenames = list(filenames)
+    calls = [(_get_element, (filename,)) for filename in filenames]
+    for i, result, _ in parallel.imap_unordered(
+        pool, calls, concurrency, timeout
+    ):
+        yield filenames[i], result
+
+
+def send_elements(pool, elements, concurrency=None, timeout=None,
+                  username=None):
+    """
+    Upload elements, either paths of files to read or (filename, code)
+    tuples, over the sessions of pool, yielding (filename, None) as each one
+    is saved, the exception instead of None for the ones that failed.
+    See get_elements for the other arguments
+    """
+    elements = [
+        (e, None) if isinstance(e, _basestring) else tuple(e)
+        for e in elements
+    ]
+    calls = [
+        (_send_element, (filename, code, username))
+        for filename, code in elements
+    ]
+    for i, result, _ in parallel.imap_unordered(
+        pool, calls, concurrency, timeout
+    ):
+        yield elements[i][0], result
+
+
+def _get_element(pip, filename):
+    return Toolbox(pip).get_element_by_name(filename)
+
+
+def _send_element(pip, filename, code, username):
+    if code is None:
+        with open(filename, 'rb') as f:
+            code = f.read()
+    Toolbox(pip, username).send_element(filename, code)
@@ -19,7 +19,7 @@ setup(
     __version__,
     author='Filipe Pina',
     author_email='fopina@skmobi.com',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'examples']),
     classifiers=[
         'Development Status :: 4 - Beta',
         'Intended Audience :: Developers',
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+import contextlib
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+from mock import patch, MagicMock
+from fispip import __main__ as cli
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from fispip.agent import Agent, AgentClient, default_path
+from fispip.timeouts import MTMTimeout, deadline
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'UNIX sockets required')
+class AgentTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self._path = os.path.join(directory, 'agent.sock')
+
+        self._pip = MagicMock()
+        self._pip.executeSQL.return_value = (['1\t2'], ['N', 'N'])
+        self._pip.executeMRPC.side_effect = Exception('ER_SV_NOMRPC', 'nope')
+
+        pool = MagicMock(_connect_args=('wtv', 1337, 'user', 'pass'),
+                         _server_type='SCA$IBS')
+
+        @contextlib.contextmanager
+        def _connection():
+            yield self._pip
+        pool.connection.side_effect = _connection
+        self._agent = Agent(pool, self._path).start()
+        self.addCleanup(self._agent.stop)
+
+    def test_requests(self):
+        client = AgentClient.connect(
+            'wtv', 1337, 'user', 'SCA$IBS', self._path
+        )
+        self.addCleanup(client.close)
+
+        self.assertEqual(
+            client.executeSQL('SELECT A,B FROM T WHERE A=?', 1),
+            (['1\t2'], ['N', 'N'])
+        )
+        self._pip.executeSQL.assert_called_once_with(
+            'SELECT A,B FROM T WHERE A=?', 1
+        )
+        cursor = self._pip.cursor.return_value
+        cursor.fetchall.return_value = ['%d' % i for i in range(40)]
+        cursor.types = ['N']
+        rows, types = client.select('SELECT A FROM T WHERE B=?', 1)
+        self.assertEqual(len(rows), 40)
+        self.assertEqual(types, ['N'])
+        self._pip.cursor.assert_called_once_with(
+            'SELECT A FROM T WHERE B=?', 1
+        )
+
+        with self.assertRaises(Exception) as cm:
+            client.executeMRPC('155', 'X')
+        self.assertEqual(cm.exception.args, ('ER_SV_NOMRPC', 'nope'))
+
+    def test_deadline(self):
+        client = AgentClient.connect(
+            'wtv', 1337, 'user', 'SCA$IBS', self._path
+        )
+        self.addCleanup(client.close)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        self._pip.executeSQL.side_effect = lambda *args: release.wait(5)
+
+        with self.assertRaises(MTMTimeout) as cm:
+            with deadline(0.1):
+                client.executeSQL('SELECT A FROM T')
+        self.assertEqual(cm.exception.args[0], 'MTM_TIMEOUT')
+
+    def test_fallback(self):
+        # agent serving another target, or none at all
+        self.assertIsNone(AgentClient.connect(
+            'wtv', 1337, 'other', 'SCA$IBS', self._path
+        ))
+        self.assertIsNone(AgentClient.connect(
+            'wtv', 1337, 'user', 'SCA$IBS', self._path + '.none'
+        ))
+
+        args = cli.build_parser().parse_args(
+            ['-A', self._path, '-u', 'other', 'wtv', '-s', 'SELECT']
+        )
+        with patch('fispip.__main__.PIP') as pip_class:
+            self.assertIs(cli.connect(args), pip_class.return_value)
+        pip_class.return_value.connect.assert_called_once_with(
+            'wtv', 61315, 'other', 'XXX'
+        )
+
+    def test_untrusted(self):
+        # a directory other users can write to could hold their socket
+        os.chmod(os.path.dirname(self._path), 0o777)
+        self.assertIsNone(AgentClient.connect(
+            'wtv', 1337, 'user', 'SCA$IBS', self._path
+        ))
+        with self.assertRaises(Exception) as cm:
+            Agent(self._agent.pool, self._path + '2').start()
+        self.assertEqual(cm.exception.args[0], 'AGENT_ERROR')
+
+        with patch('os.stat', return_value=MagicMock(
+            st_uid=os.getuid() + 1, st_mode=0o700
+        )):
+            self.assertIsNone(AgentClient.connect(
+                'wtv', 1337, 'user', 'SCA$IBS', self._path
+            ))
+
+    def test_default_path(self):
+        with patch.dict(os.environ, {'FISPIP_AGENT': '/x/agent.sock'}):
+            self.assertEqual(default_path(), '/x/agent.sock')
+        with patch.dict(os.environ, {'XDG_RUNTIME_DIR': '/run/user/1'}):
+            os.environ.pop('FISPIP_AGENT', None)
+            self.assertEqual(default_path(), '/run/user/1/fispip-agent.sock')
+
+        directory = os.path.dirname(self._path)
+        with patch.dict(os.environ, {}):
+            os.environ.pop('FISPIP_AGENT', None)
+            os.environ.pop('XDG_RUNTIME_DIR', None)
+            with patch('tempfile.gettempdir', return_value=directory):
+                path = default_path()
+                Agent(self._agent.pool, path).start().stop()
+        # created private to the current user
+        self.assertEqual(os.stat(os.path.dirname(path)).st_mode & 0o777,
+                         0o700)
+
+    def test_cli_fork(self):
+        path = self._path + '2'
+        out = StringIO()
+        with patch('fispip.__main__.PIPPool',
+                   return_value=self._agent.pool), \
+                patch('os.fork', return_value=4242) as fork, \
+                patch('os._exit', side_effect=SystemExit), \
+                patch('sys.stdout', out):
+            with self.assertRaises(SystemExit):
+                cli.main(['agent', '-A', path, 'wtv'])
+            # bound by the parent, before forking
+            self.assertTrue(os.path.exists(path))
+            self.assertEqual(out.getvalue(), (
+                'FISPIP_AGENT=%s; export FISPIP_AGENT;\n'
+                'FISPIP_AGENT_PID=4242; export FISPIP_AGENT_PID;\n'
+            ) % path)
+
+            fork.reset_mock()
+            with self.assertRaises(Exception) as cm:
+                cli.main(['agent', '-A', self._path, 'wtv'])
+            self.assertEqual(cm.exception.args[0], 'AGENT_ERROR')
+            self.assertFalse(fork.called)
+
+    def test_already_running(self):
+        with self.assertRaises(Exception) as cm:
+            Agent(self._agent.pool, self._path).start()
+        self.assertEqual(cm.exception.args[0], 'AGENT_ERROR')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+import socket
+import struct
+import threading
+import time
+import unittest
+from fispip.mysix import PY3
+from fispip.timeouts import MTMTimeout
+
+if PY3:
+    import asyncio
+    from fispip.aio import AsyncMTM, AsyncPIP
+
+
+SIGNON_REPLY = b'0\x01\x08\x020\x05\x04abc'
+
+
+class _CannedServer(threading.Thread):
+    """
+    Loopback MTM stand-in: every frame received is recorded and answered
+    with reply(frame)
+    """
+    def __init__(self, reply):
+        super(_CannedServer, self).__init__()
+        self.daemon = True
+        self.frames = []
+        self._reply = reply
+        self._listener = socket.socket()
+        self._listener.bind(('127.0.0.1', 0))
+        self._listener.listen(16)
+        self.port = self._listener.getsockname()[1]
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self._listener.accept()
+            except socket.error:
+                break
+            t = threading.Thread(target=self._serve, args=(conn,))
+            t.daemon = True
+            t.start()
+
+    def _serve(self, conn):
+        f = conn.makefile('rb')
+        while True:
+            header = f.read(2)
+            if len(header) < 2:
+                break
+            frame = f.read(struct.unpack('!h', header)[0] - 2)
+            self.frames.append(frame)
+            reply = self._reply(frame)
+            conn.sendall(struct.pack('!h', len(reply) + 2) + reply)
+        conn.close()
+
+    def stop(self):
+        self._listener.close()
+
+
+def _pip_reply(frame):
+    # frame is "SCA$IBS\x1c" + LV(LV(header), message)
+    # header[1] (after LV size byte) is the service class
+    if frame[10:11] == b'0':
+        return SIGNON_REPLY
+    # echo the message id back as the result
+    msgid = frame[16:17]
+    return b'0\x01\x08\x020\x05' + msgid * 4
+
+
+@unittest.skipUnless(PY3, 'asyncio requires python 3')
+class AsyncPIPTest(unittest.TestCase):
+    def setUp(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = _CannedServer(_pip_reply)
+        self._server.start()
+
+    def tearDown(self):
+        self._server.stop()
+        self._loop.close()
+        asyncio.set_event_loop(None)
+
+    def _run(self, coro):
+        return self._loop.run_until_complete(coro)
+
+    def test_mtm(self):
+        self._server._reply = lambda frame: frame[5:]
+        mtm = AsyncMTM()
+        self._run(mtm.connect('127.0.0.1', self._server.port))
+        r = self._run(mtm.exchange_message('echo 123'))
+        self.assertEqual(r, '123')
+        r = self._run(mtm.exchange_message('echo 456', raw=True))
+        self.assertEqual(r, b'456')
+        self._run(mtm.close())
+
+    def test_timeout(self):
+        self._server._reply = lambda frame: time.sleep(0.5) or frame[5:]
+        mtm = AsyncMTM()
+        mtm.timeout = 0.05
+        self._run(mtm.connect('127.0.0.1', self._server.port))
+        with self.assertRaises(MTMTimeout):
+            self._run(mtm.exchange_message('echo 123'))
+        # late reply would be read as the next one
+        with self.assertRaises(Exception) as cm:
+            self._run(mtm.exchange_message('echo 456'))
+        self.assertEqual(cm.exception.args[0], 'MTM_ERROR')
+        self._run(mtm.close())
+
+    def test_connect_and_mrpc(self):
+        pip = AsyncPIP()
+        self._run(pip.connect('127.0.0.1', self._server.port, 'user', 'pass'))
+        self.assertEqual(pip._token, 'abc')
+        r = self._run(pip.executeMRPC('1337', 'param1', 'param2'))
+        self.assertEqual(r, '1111')
+        self._run(pip.close())
+
+        self.assertEqual(
+            self._server.frames[1],
+            b'SCA$IBS\x1c'
+            b'\x0c\x023\x04abc\x021\x020\x01'
+            b'\x1c\x051337\x021\x0f\x07param1\x07param2\x05\x04\x03\x021'
+        )
+
+    def test_concurrent_sessions(self):
+        sessions = [AsyncPIP() for _ in range(20)]
+        self._run(asyncio.gather(*[
+            pip.connect('127.0.0.1', self._server.port, 'u', 'p')
+            for pip in sessions
+        ]))
+        # concurrent calls on the same session are serialized
+        results = self._run(asyncio.gather(*[
+            pip.executeMRPC('1') for pip in sessions for _ in range(3)
+        ]))
+        self._run(asyncio.gather(*[pip.close() for pip in sessions]))
+        self.assertEqual(results, ['1111', '2222', '3333'] * 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+import threading
+import time
+import unittest
+from mock import patch
+from fispip import PIP, lv
+from fispip.cache import MRPCCache, TTLCache
+
+
+class TTLCacheTest(unittest.TestCase):
+    def test_expiry(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        with patch('fispip.cache._monotonic', return_value=100):
+            cache.put('a', 1)
+            cache.put('b', 2, ttl=5)
+            self.assertEqual(cache.get('a'), 1)
+        with patch('fispip.cache._monotonic', return_value=105):
+            self.assertIsNone(cache.get('b'))
+            self.assertFalse('b' in cache)
+            self.assertEqual(cache.get('a'), 1)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+        cache.put('c', 3)
+        cache.put('d', 4)
+        # LRU eviction still applies
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('a'))
+
+    def test_coalesced_load(self):
+        cache = TTLCache()
+        calls = []
+        release = threading.Event()
+
+        def _load():
+            calls.append(1)
+            release.wait()
+            return 'value'
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(cache.get_or_load('k', _load))
+            )
+            for _ in range(4)
+        ]
+        for t in threads:
+            t.start()
+        while cache.coalesced < 3:
+            time.sleep(0.001)
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, ['value'] * 4)
+        self.assertEqual(cache.get_or_load('k', _load), 'value')
+        self.assertEqual(calls, [1])
+
+    def test_failed_load(self):
+        cache = TTLCache()
+
+        def _load():
+            raise Exception('ER_SV_NOMRPC', 'nope')
+
+        with self.assertRaises(Exception):
+            cache.get_or_load('k', _load)
+        # errors are not cached
+        self.assertEqual(cache.get_or_load('k', lambda: 'ok'), 'ok')
+
+
+class MRPCCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._pip = PIP('SCA$IBS')
+        self._pip._token = 'abc'
+        self._pip.mrpc_cache = MRPCCache({'155': 60})
+
+    def test_execute_mrpc(self):
+        reply = '0' + lv.pack_str(['', lv.pack_str(['0', 'ok'])])
+        with patch(
+            'fispip.MTM.exchange_message', return_value=reply
+        ) as f_e:
+            self.assertEqual(self._pip.executeMRPC('155', 'X'), 'ok')
+            self.assertEqual(self._pip.executeMRPC(155, 'X'), 'ok')
+            self.assertEqual(f_e.call_count, 1)
+
+            # different arguments, and MRPCs without TTL, are not shared
+            self._pip.executeMRPC('155', 'Y')
+            self._pip.executeMRPC('121', 'X')
+            self._pip.executeMRPC('121', 'X')
+            self.assertEqual(f_e.call_count, 4)
+
+            self._pip.mrpc_cache.invalidate('155', args=['X'])
+            self._pip.executeMRPC('155', 'X')
+            self._pip.executeMRPC('155', 'Y')
+            self.assertEqual(f_e.call_count, 5)
+
+            self._pip.mrpc_cache.invalidate()
+            self._pip.executeMRPC('155', 'Y')
+            self.assertEqual(f_e.call_count, 6)
+
+        cache = self._pip.mrpc_cache
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+
+    def test_binary_sessions(self):
+        binary = PIP('SCA$IBS', binary=True)
+        binary._token = b'abc'
+        # as if set on the class
+        binary.mrpc_cache = self._pip.mrpc_cache
+        reply = '0' + lv.pack_str(['', lv.pack_str(['0', 'ok'])])
+        with patch('fispip.MTM.exchange_message', side_effect=[
+            reply, b'0' + bytes(lv.pack([b'', lv.pack([b'0', b'ok'])]))
+        ]):
+            self.assertEqual(self._pip.executeMRPC('155', 'X'), 'ok')
+            # not shared between text and binary sessions
+            self.assertEqual(binary.executeMRPC(b'155', 'X'), b'ok')
+            self.assertEqual(binary.executeMRPC('155', 'X'), b'ok')
+            self.assertEqual(self._pip.executeMRPC('155', 'X'), 'ok')
+
+        cache = self._pip.mrpc_cache
+        cache.invalidate(binary=True)
+        self.assertEqual(len(cache), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+import datetime
+import unittest
+from decimal import Decimal
+from fispip import converters
+
+
+class ConvertersTest(unittest.TestCase):
+    def test_values(self):
+        self.assertEqual(
+            converters.to_date('60960'),
+            datetime.date(2007, 11, 26)
+        )
+        self.assertEqual(converters.to_date('1'), datetime.date(1841, 1, 1))
+        self.assertIsNone(converters.to_date(''))
+        self.assertEqual(
+            converters.to_time('45296'),
+            datetime.time(12, 34, 56)
+        )
+        self.assertEqual(converters.to_number('-12'), -12)
+        self.assertEqual(converters.to_number('.5'), Decimal('0.5'))
+        self.assertEqual(converters.to_decimal('10'), Decimal('10'))
+        self.assertIsNone(converters.to_number(''))
+        self.assertIs(converters.to_bool('1'), True)
+        self.assertIs(converters.to_bool('0'), False)
+        self.assertIs(converters.to_bool(''), False)
+
+    def test_rows(self):
+        self.assertEqual(
+            converters.decode_rows(
+                ['abc\t60960\t3\t1.25\t1', '\t\t\t\t0'],
+                ['T', 'D', 'N', '$', 'L']
+            ),
+            [
+                ('abc', datetime.date(2007, 11, 26), 3, Decimal('1.25'), True),
+                ('', None, None, None, False),
+            ]
+        )
+        # text only results are just split
+        decode = converters.row_decoder(['T', 'U'])
+        self.assertEqual(decode('a\tB'), ('a', 'B'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+import random
+import unittest
+from fispip import lv
+from fispip.mysix import makestring, makebytes
+
+
+def _bytes_values(values):
+    return [makestring(v) for v in values]
+
+
+class LVTest(unittest.TestCase):
+    def test_vectors(self):
+        LONG = 'b' * 255
+        self.assertEqual(lv.pack_str(['ab', 'abc']), '\x03ab\x04abc')
+        self.assertEqual(
+            lv.pack_str(['a', LONG]),
+            '\x02a\x00\x02\x01\x01' + LONG
+        )
+        self.assertEqual(lv.pack(['ab', b'abc']), b'\x03ab\x04abc')
+        self.assertEqual(
+            lv.pack([b'a', LONG]),
+            b'\x02a\x00\x02\x01\x01' + makebytes(LONG)
+        )
+        self.assertEqual(lv.pack_str([]), '')
+        self.assertEqual(lv.unpack(''), [])
+        self.assertEqual(lv.unpack('\x01\x01'), ['', ''])
+
+        # 3 length bytes needed once length + 2 no longer fits in 2
+        self.assertEqual(lv.pack_str(['x' * 65533])[:4], '\x00\x02\xff\xff')
+        self.assertEqual(
+            lv.pack_str(['x' * 65534])[:5],
+            '\x00\x03\x01\x00\x01'
+        )
+
+    def test_calc_size(self):
+        self.assertEqual(lv.calc_size('\x04abc'), (3, 1))
+        self.assertEqual(lv.calc_size(b'xx\x00\x02\x01\x01', 2), (255, 4))
+        self.assertEqual(lv.calc_size(b'\x00\x03\x01\x00\x01'), (65534, 5))
+
+    def test_unpack_memoryview(self):
+        buf = lv.pack([b'ab', b'c' * 300])
+        values = lv.unpack(buf)
+        self.assertEqual(_bytes_values(values), ['ab', 'c' * 300])
+        # nested values are decoded in place
+        nested = lv.pack([lv.pack([b'x', b'yz']), b''])
+        inner = lv.unpack(lv.unpack(nested)[0])
+        self.assertEqual(_bytes_values(inner), ['x', 'yz'])
+
+    def test_view(self):
+        packed = lv.pack_str(['a', lv.pack_str(['x', 'yz']), 'b' * 300])
+        # trailing garbage is never reached if not requested
+        view = lv.LVView('0' + packed + '\x00', 1)
+        self.assertEqual(view[0], 'a')
+        self.assertEqual(view.span(0), (2, 3))
+        self.assertEqual(list(view.nested(1)), ['x', 'yz'])
+        self.assertEqual(view.nested(1)[-1], 'yz')
+        self.assertEqual(view[2], 'b' * 300)
+        with self.assertRaises(IndexError):
+            len(view)
+
+        view = lv.LVView(lv.pack([b'a', lv.pack([b'x', b'yz'])]))
+        self.assertEqual(len(view), 2)
+        self.assertEqual(_bytes_values(view.nested(1)), ['x', 'yz'])
+        with self.assertRaises(IndexError):
+            view[2]
+        self.assertEqual(len(lv.LVView(b'')), 0)
+
+    def test_round_trip(self):
+        rand = random.Random(1337)
+        # lengths around every prefix boundary
+        lengths = [0, 1, 253, 254, 255, 256, 65532, 65533, 65534, 65535]
+        for _ in range(200):
+            values = [
+                ''.join(
+                    chr(rand.randint(0, 255))
+                    for _ in range(rand.choice(lengths) % rand.randint(1, 300))
+                )
+                for _ in range(rand.randint(0, 20))
+            ]
+            values.append('z' * rand.choice(lengths))
+            packed = lv.pack_str(values)
+            self.assertEqual(lv.unpack(packed), values)
+            self.assertEqual(bytes(lv.pack(values)), makebytes(packed))
+            self.assertEqual(_bytes_values(lv.unpack(lv.pack(values))), values)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from mock import patch, MagicMock
+from fispip import __main__ as cli
+from fispip import timeouts
+from fispip.agent import AgentClient
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self._file = os.path.join(directory, 'batch.txt')
+        with open(self._file, 'w') as f:
+            f.write(
+                'SELECT A,B FROM T\n'
+                '# skipped\n'
+                '\n'
+                ':mrpc 155 "a b" c\n'
+                'UPDATE T SET A=1\n'
+            )
+
+        self._pip = MagicMock()
+        # SELECTs go through a cursor, executeSQL stops at max_rows
+        cursor = self._pip.cursor.return_value
+        cursor.fetchall.return_value = ['1\t2', '3\t4']
+        cursor.types = ['N', 'N']
+        self._pip.executeSQL.side_effect = Exception(
+            'ER_SV_INVLDSQL', 'bad query'
+        )
+        self._pip.executeMRPC.return_value = 'ok'
+
+    def _batch(self, *args):
+        out = StringIO()
+        with patch('fispip.__main__.connect', return_value=self._pip), \
+                patch('sys.stdout', out):
+            cli.main(['batch', '-f', self._file] + list(args) + ['wtv'])
+        return out.getvalue()
+
+    def test_jsonl(self):
+        records = [json.loads(line) for line in self._batch().splitlines()]
+        for record in records:
+            self.assertTrue(record.pop('elapsed_ms') >= 0)
+        self.assertEqual(records, [
+            {'seq': 1, 'command': 'SELECT A,B FROM T',
+             'rows': [['1', '2'], ['3', '4']], 'types': ['N', 'N']},
+            {'seq': 2, 'command': ':mrpc 155 "a b" c', 'result': 'ok'},
+            {'seq': 3, 'command': 'UPDATE T SET A=1',
+             'error': ['ER_SV_INVLDSQL', 'bad query']},
+        ])
+        self._pip.cursor.assert_called_once_with('SELECT A,B FROM T')
+        self._pip.executeMRPC.assert_called_once_with('155', 'a b', 'c')
+        self._pip.close.assert_called_once_with()
+
+    def test_agent_select(self):
+        agent = MagicMock(spec=AgentClient)
+        agent.select.return_value = (['1\t2'], ['N', 'N'])
+        agent.executeMRPC.return_value = 'ok'
+        agent.executeSQL.return_value = ([''], ['T'])
+        self._pip = agent
+
+        records = [json.loads(line) for line in self._batch().splitlines()]
+        self.assertEqual(records[0]['rows'], [['1', '2']])
+        agent.select.assert_called_once_with('SELECT A,B FROM T')
+
+    def test_csv(self):
+        lines = self._batch('-o', 'csv').splitlines()
+        self.assertEqual(lines[0], 'seq,elapsed_ms,status,values')
+        self.assertEqual(
+            [line.split(',', 2)[::2] for line in lines[1:]],
+            [
+                ['1', 'ok,1,2'],
+                ['1', 'ok,3,4'],
+                ['2', 'ok,ok'],
+                ['3', 'ER_SV_INVLDSQL,bad query'],
+            ]
+        )
+
+    def test_reconnect(self):
+        broken = MagicMock()
+        broken.cursor.side_effect = timeouts.MTMTimeout(
+            'MTM_TIMEOUT', 'Deadline expired (read)'
+        )
+        out = StringIO()
+        with patch('fispip.__main__.connect',
+                   side_effect=[broken, self._pip]), \
+                patch('sys.stdout', out):
+            cli.main(['batch', '-f', self._file, '-t', '1', 'wtv'])
+
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(records[0]['error'][0], 'MTM_TIMEOUT')
+        # next statements on a new session
+        self.assertEqual(records[1]['result'], 'ok')
+        broken.close.assert_called_once_with()
+        self._pip.close.assert_called_once_with()
+
+    def test_concurrency(self):
+        with patch('fispip.__main__.PIPPool') as pool_class:
+            pool = pool_class.return_value
+            pool.max_size = 2
+            pool.acquire.return_value = self._pip
+            pool._is_broken.return_value = False
+            out = self._batch('-c', '2')
+
+        records = [json.loads(line) for line in out.splitlines()]
+        self.assertEqual(sorted(r['seq'] for r in records), [1, 2, 3])
+        pool.close.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+import unittest
+from mock import patch
+from fispip import PIP, lv, metrics
+
+
+def _reply(status, data):
+    return '0' + lv.pack_str(['', lv.pack_str([status, data])])
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.enable()
+        self.addCleanup(metrics.disable)
+        self._pip = PIP('SCA$IBS')
+        self._pip._token = 'abc'
+
+    def test_disabled(self):
+        metrics.disable()
+        with patch('fispip.MTM.exchange_message', return_value=_reply(
+            '0', 'ok'
+        )):
+            self._pip.executeMRPC('155')
+        self.assertEqual(self.registry.counters, {})
+        self.assertEqual(self.registry.histograms, {})
+
+    def test_mrpc(self):
+        with patch('fispip.MTM.exchange_message', return_value=_reply(
+            '0', 'ok'
+        )):
+            self._pip.executeMRPC('155')
+            self._pip.executeMRPC('155')
+
+        counters = self.registry.counters
+        self.assertEqual(
+            counters[('fispip_requests_total', (('service', 'MRPC'),))], 2
+        )
+        self.assertEqual(
+            counters[('fispip_mrpc_requests_total', (('mrpc', '155'),))], 2
+        )
+        self.assertEqual(self.registry.histograms[
+            ('fispip_mrpc_seconds', (('mrpc', '155'),))
+        ].count, 2)
+
+    def test_errors(self):
+        error = _reply('1', lv.pack_str(['', '', 'ER_SV_NOMRPC', '', 'nope']))
+        with patch('fispip.MTM.exchange_message', return_value=error):
+            with self.assertRaises(Exception):
+                self._pip.executeMRPC('155')
+        with patch(
+            'fispip.MTM.exchange_message',
+            side_effect=Exception('MTM_ERROR', 'Connection closed')
+        ):
+            with self.assertRaises(Exception):
+                self._pip.executeMRPC('155')
+
+        counters = self.registry.counters
+        self.assertEqual(
+            counters[('fispip_errors_total', (('code', 'ER_SV_NOMRPC'),))], 1
+        )
+        self.assertEqual(
+            counters[('fispip_errors_total', (('code', 'MTM_ERROR'),))], 1
+        )
+
+    def test_bytes(self):
+        def _fake_recv_into(view):
+            data = b'\x00\x05abc'[:len(view)]
+            view[:len(data)] = data
+            return len(data)
+
+        with patch.object(self._pip, '_socket') as f_s:
+            f_s.recv_into.side_effect = _fake_recv_into
+            self._pip._use_sendmsg = False
+            self._pip.send_message('abc')
+            self._pip.read_message()
+
+        counters = self.registry.counters
+        # header + SCA$IBS\x1c + abc
+        self.assertEqual(counters[('fispip_bytes_sent_total', ())], 13)
+        self.assertEqual(counters[('fispip_bytes_received_total', ())], 5)
+
+    def test_sessions(self):
+        with patch('fispip.MTM.connect'), patch('fispip.MTM.close'):
+            with patch(
+                'fispip.MTM.exchange_message',
+                return_value='0\x01\x08\x020\x05\x04abc'
+            ):
+                self._pip.connect('wtv', 1337, 'user', 'pass')
+            key = ('fispip_open_sessions', ())
+            self.assertEqual(self.registry.gauges[key], 1)
+            self._pip.close()
+            self._pip.close()
+            self.assertEqual(self.registry.gauges[key], 0)
+
+    def test_prometheus(self):
+        registry = metrics.Registry(buckets=(0.1, 1))
+        registry.request('5', 0.05)
+        registry.request('5', 0.5)
+        registry.error('ER"X')
+        self.assertEqual(
+            registry.prometheus(),
+            '# TYPE fispip_errors_total counter\n'
+            'fispip_errors_total{code="ER\\"X"} 1\n'
+            '# TYPE fispip_requests_total counter\n'
+            'fispip_requests_total{service="SQL"} 2\n'
+            '# TYPE fispip_request_seconds histogram\n'
+            'fispip_request_seconds_bucket{service="SQL",le="0.1"} 1\n'
+            'fispip_request_seconds_bucket{service="SQL",le="1"} 2\n'
+            'fispip_request_seconds_bucket{service="SQL",le="+Inf"} 2\n'
+            'fispip_request_seconds_sum{service="SQL"} 0.55\n'
+            'fispip_request_seconds_count{service="SQL"} 2\n'
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,33 @@
 #!/usr/bin/env python
 
+import socket
 import unittest
 from mock import patch
 from fispip import MTM
 
 
+def _fake_recv_into(chunks):
+    """
+    socket.recv_into replacement serving `chunks` (never more than one chunk
+    per call, to simulate short reads)
+    """
+    def _recv_into(s, view):
+        if not chunks:
+            return 0
+        data = chunks.pop(0)
+        n = min(len(data), len(view))
+        view[:n] = data[:n]
+        if n < len(data):
+            chunks.insert(0, data[n:])
+        return n
+    return _recv_into
+
+
 class MTMTest(unittest.TestCase):
     def setUp(self):
         self._mtm = MTM()
+        # sendmsg path is covered by test_sendmsg
+        self._mtm._use_sendmsg = False
 
     def test_connect(self):
         with patch('socket.socket.connect') as f:
@@ -16,15 +36,15 @@ class MTMTest(unittest.TestCase):
 
     def test_exchange_message(self):
         _recv_queue = [
-            b'123',
-            b'\x00\x05'
+            b'\x00\x05',
+            b'123'
         ]
 
-        def _fake_recv(s, l):
-            return _recv_queue.pop()
-
-        with patch('socket.socket.send') as f_s:
-            with patch('socket.socket.recv', _fake_recv):
+        with patch('socket.socket.sendall') as f_s:
+            with patch(
+                'socket.socket.recv_into',
+                _fake_recv_into(_recv_queue)
+            ):
                 r = self._mtm.exchange_message('echo 123')
 
         f_s.assert_called_once_with(b'\x00\x0Aecho 123')
@@ -36,7 +56,7 @@ class MTMTest(unittest.TestCase):
         f.assert_called_once_with()
 
     def test_endianess(self):
-        with patch('socket.socket.send') as f_s:
+        with patch('socket.socket.sendall') as f_s:
             # big-endian
             self._mtm.set_endianess('>')
             self._mtm.send_message('hello')
@@ -54,20 +74,80 @@ class MTMTest(unittest.TestCase):
             self._mtm.send_message('hello')
             f_s.assert_called_once_with(b'\00\x07hello')
 
+    def test_unsigned(self):
+        message = 'x' * 0x9000
+        with patch('socket.socket.sendall') as f_s:
+            with self.assertRaises(Exception) as cm:
+                self._mtm.send_message(message)
+            self.assertEqual(cm.exception.args[0], 'MTM_ERROR')
+            self.assertFalse(f_s.called)
+
+            self._mtm.set_unsigned()
+            self._mtm.set_endianess('<')
+            self.assertEqual(self._mtm.max_frame, 0xffff)
+            self._mtm.send_message(message)
+            f_s.assert_called_once_with(b'\x02\x90' + message.encode())
+
+        _recv_queue = [b'\x02\x90', message.encode()]
+        with patch(
+            'socket.socket.recv_into', _fake_recv_into(_recv_queue)
+        ):
+            self.assertEqual(self._mtm.read_message(), message)
+
     def test_server_type(self):
         self._mtm = MTM('CUSTOM$SERVER')
-        with patch('socket.socket.send') as f_s:
+        self._mtm._use_sendmsg = False
+        with patch('socket.socket.sendall') as f_s:
             self._mtm.send_message('hello')
             f_s.assert_called_once_with(
                 b'\x00\x15CUSTOM$SERVER\x1c'
                 b'hello'
             )
 
+    @unittest.skipUnless(
+        hasattr(socket.socket, 'sendmsg'), 'sendmsg not available'
+    )
+    def test_sendmsg(self):
+        self._mtm = MTM('CUSTOM$SERVER')
+        _sent = []
+
+        def _fake_sendmsg(s, buffers):
+            # accept at most 3 bytes per call to force partial writes
+            data = b''.join(bytes(b) for b in buffers)[:3]
+            _sent.append(data)
+            return len(data)
+
+        with patch('socket.socket.sendmsg', _fake_sendmsg):
+            self._mtm.send_message('hello')
+
+        self.assertEqual(len(_sent), 7)
+        self.assertEqual(b''.join(_sent), b'\x00\x15CUSTOM$SERVER\x1chello')
+
+    def test_read_short_reads(self):
+        _recv_queue = [b'\x00', b'\x08', b'he', b'l', b'lo\xff']
+        with patch('socket.socket.recv_into', _fake_recv_into(_recv_queue)):
+            r = self._mtm.read_message()
+        self.assertEqual(r, 'hello\xff')
+
+        _recv_queue = [b'\x00\x08hello\xff']
+        with patch('socket.socket.recv_into', _fake_recv_into(_recv_queue)):
+            r = self._mtm.read_message(raw=True)
+        self.assertEqual(r, b'hello\xff')
+
     def test_read_errors(self):
-        with patch('socket.socket.recv', return_value=''):
+        with patch('socket.socket.recv_into', return_value=0):
             r = self._mtm.read_message()
         self.assertIsNone(r)
 
+        for _recv_queue in ([b'\x00'], [b'\x00\x08hel'], [b'\x00\x01']):
+            with patch(
+                'socket.socket.recv_into',
+                _fake_recv_into(_recv_queue)
+            ):
+                with self.assertRaises(Exception) as cm:
+                    self._mtm.read_message()
+            self.assertEqual(cm.exception.args[0], 'MTM_ERROR')
+
 
 if __name__ == '__main__':
     unittest.main()
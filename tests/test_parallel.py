@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+import threading
+import time
+import unittest
+from mock import patch, MagicMock
+from fispip import timeouts
+from fispip.pool import PIPPool
+from fispip.parallel import imap_unordered, map_mrpc, map_sql
+
+
+class ParallelTest(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('fispip.pool.PIP', side_effect=lambda *a: MagicMock())
+        self._pip_class = patcher.start()
+        self.addCleanup(patcher.stop)
+        self._pool = PIPPool('wtv', 1337, 'user', 'pass', min_size=0,
+                             max_size=4)
+        self.addCleanup(self._pool.close)
+
+    def test_order_and_concurrency(self):
+        active = [0, 0]
+        lock = threading.Lock()
+
+        def _execute(mrpc_id, value):
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+            # later calls finish first
+            time.sleep(0.01 * (10 - value) / 10.0)
+            with lock:
+                active[0] -= 1
+            return value * 2
+
+        with patch.object(
+            self._pool, 'connect',
+            side_effect=lambda: MagicMock(executeMRPC=_execute)
+        ):
+            results = map_mrpc(self._pool, [('1', v) for v in range(10)])
+
+        self.assertEqual(results, [v * 2 for v in range(10)])
+        self.assertTrue(1 < active[1] <= 4)
+
+    def test_failures(self):
+        pips = []
+        budgets = []
+
+        def _connect():
+            pip = MagicMock()
+            pip.executeSQL.side_effect = lambda query, *args: (
+                _fail(query) if query.startswith('BAD') else [query, args]
+            )
+            pips.append(pip)
+            return pip
+
+        def _fail(query):
+            budgets.append(timeouts.remaining())
+            if query == 'BAD':
+                raise Exception('ER_SV_INVLDSQL', 'bad query')
+            raise timeouts.MTMTimeout('MTM_TIMEOUT', 'Deadline expired')
+
+        with patch.object(self._pool, 'connect', side_effect=_connect):
+            results = map_sql(
+                self._pool,
+                ['A', 'BAD', ('C', 1), 'BAD TIMEOUT', 'E'],
+                concurrency=1, timeout=5
+            )
+
+        self.assertEqual(results[0], ['A', ()])
+        self.assertEqual(results[1].args[0], 'ER_SV_INVLDSQL')
+        self.assertEqual(results[2], ['C', (1,)])
+        self.assertIsInstance(results[3], timeouts.MTMTimeout)
+        self.assertEqual(results[4], ['E', ()])
+
+        # every call runs within its own deadline
+        self.assertTrue(all(0 < b <= 5 for b in budgets))
+        self.assertIsNone(timeouts.remaining())
+        # timed out session discarded and replaced
+        self.assertEqual(len(pips), 2)
+        pips[0].close.assert_called_once_with()
+
+    def test_imap_unordered(self):
+        def _execute(mrpc_id, delay):
+            time.sleep(delay)
+            return delay
+
+        with patch.object(
+            self._pool, 'connect',
+            side_effect=lambda: MagicMock(executeMRPC=_execute)
+        ):
+            results = list(imap_unordered(
+                self._pool,
+                (('executeMRPC', ('1', d)) for d in (0.05, 0, 0)),
+                concurrency=2
+            ))
+
+        # slow first call completes last
+        self.assertEqual([r[0] for r in results][-1], 0)
+        self.assertEqual(sorted(r[1] for r in results), [0, 0, 0.05])
+        self.assertTrue(all(seconds >= 0 for _, _, seconds in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,18 @@
 #!/usr/bin/env python
 
+import gc
+import sys
 import unittest
 from mock import patch
-from fispip import PIP
+from fispip import PIP, lv
+
+
+def _sql_body(rows, types='T'):
+    return lv.pack_str(['', '', str(len(rows)), '\r\n'.join(rows), '', types])
+
+
+def _sql_reply(rows, types='T'):
+    return '0' + lv.pack_str(['', lv.pack_str(['0', _sql_body(rows, types)])])
 
 
 class PIPTest(unittest.TestCase):
@@ -143,5 +153,294 @@ class PIPTest(unittest.TestCase):
             '\x01' ''
         )
 
+    def test_sql_args(self):
+        self.test_connect()
+
+        with patch(
+            'fispip.MTM.exchange_message',
+            return_value=_sql_reply([])
+        ) as f_e:
+            self._pip.executeSQL(
+                'INSERT INTO T (A,B) VALUES (?,\'?\',?)', 'x', 2
+            )
+
+        self.assertIn(
+            '\x29' 'INSERT INTO T (A,B) VALUES (:C1,\'?\',:C2)'
+            '\x1f' '/ROWS=30/USING=(C1=\'x\',C2=\'2\')',
+            f_e.call_args[0][0]
+        )
+
+        with self.assertRaises(Exception) as cm:
+            self._pip.executeSQL('DELETE FROM T WHERE A = ?', 1, 2)
+        self.assertEqual(
+            cm.exception.args,
+            ('VAL_ERROR', 'More variables than markers')
+        )
+        with self.assertRaises(Exception) as cm:
+            self._pip.executeSQL('DELETE FROM T WHERE A = ? OR B = ?', 1)
+        self.assertEqual(
+            cm.exception.args,
+            ('VAL_ERROR', 'More markers than variables')
+        )
+
+    def test_sql_decode(self):
+        self.test_connect()
+
+        with patch(
+            'fispip.MTM.exchange_message',
+            return_value=_sql_reply(['a\t1', 'b\t2'], 'TN')
+        ):
+            rows, col_types = self._pip.executeSQL(
+                'SELECT A,B FROM T', decode=True
+            )
+            self.assertEqual(rows, [('a', 1), ('b', 2)])
+            self.assertEqual(col_types, ['T', 'N'])
+
+            cursor = self._pip.cursor('SELECT A,B FROM T', decode=True)
+            self.assertEqual(cursor.fetchone(), ('a', 1))
+
+        with patch('fispip.MTM.exchange_message', return_value=_sql_reply([])):
+            rows, _ = self._pip.executeSQL('SELECT A FROM T', decode=True)
+        self.assertEqual(rows, [])
+
+    def test_binary(self):
+        pip = PIP('SCA$IBS', binary=True)
+        with patch('fispip.MTM.connect'):
+            with patch(
+                'fispip.MTM.exchange_message',
+                return_value=b'0\x01\x08\x020\x05\x04abc'
+            ) as f_e:
+                pip.connect('wtv', 1337, 'user', 'pass')
+        self.assertEqual(pip._token, b'abc')
+        self.assertEqual(f_e.call_args[0][1], True)
+
+        payload = b'\x00\xff\x1c\r\n'
+        with patch(
+            'fispip.MTM.exchange_message',
+            return_value=b'0\x01\x09\x020\x06' + payload
+        ) as f_e:
+            r = pip.executeMRPC('1337', payload)
+        self.assertEqual(r, payload)
+        self.assertEqual(
+            bytes(f_e.call_args[0][0]),
+            b'\x0c\x023\x04abc\x021\x020\x01'
+            b'\x14\x051337\x021\x07\x06' + payload + b'\x05\x04\x03\x021'
+        )
+
+        reply = lv.pack([b'', lv.pack([b'0', lv.pack(
+            [b'', b'', b'2', b'a\xff\t1\r\nb\t2', b'', b'TN']
+        )])])
+        with patch(
+            'fispip.MTM.exchange_message', return_value=b'0' + bytes(reply)
+        ):
+            rows, col_types = pip.executeSQL('UPDATE T SET A=1')
+            self.assertEqual(rows, [b'a\xff\t1', b'b\t2'])
+            self.assertEqual(col_types, ['T', 'N'])
+
+            rows, _ = pip.executeSQL('UPDATE T SET A=1', decode=True)
+            self.assertEqual(rows, [(u'a\xff', 1), (u'b', 2)])
+
+        reply = lv.pack([b'', lv.pack([b'1', lv.pack(
+            [b'', b'', b'ER_SV_CODE', b'', b'bad thing']
+        )])])
+        with patch(
+            'fispip.MTM.exchange_message', return_value=b'0' + bytes(reply)
+        ):
+            with self.assertRaises(Exception) as e:
+                pip.executeMRPC('1337')
+        self.assertEqual(e.exception.args, ('ER_SV_CODE', 'bad thing'))
+
+    def test_executemany(self):
+        self.test_connect()
+
+        def _group_reply(records):
+            return '0' + lv.pack_str(['', lv.pack_str(['0', lv.pack_str([
+                lv.pack_str(['0', _sql_body([])]) if r else
+                lv.pack_str(['1', lv.pack_str(['', '', 'ERR', '', 'msg'])])
+                for r in records
+            ])])])
+
+        _out = [_group_reply([True, False]), _group_reply([True])]
+        _inp = []
+
+        def _fake_exchange(*args):
+            _inp.append(args[1])
+            return _out.pop(0)
+
+        message, _ = self._pip._sql_message('DELETE FROM T WHERE A = ?', 'x')
+        # room for two statements per frame
+        self._pip.max_frame = (
+            self._pip._frame_overhead() + 2 * lv.packed_size(len(message))
+        )
+
+        with patch('fispip.MTM.exchange_message', _fake_exchange):
+            r = self._pip.executemany(
+                'DELETE FROM T WHERE A = ?',
+                [('x',), ('y',), ('z',)]
+            )
+
+        self.assertEqual(len(_inp), 2)
+        self.assertEqual(r[0], ([''], ['T']))
+        self.assertEqual(r[1].args, ('ERR', 'msg'))
+        self.assertEqual(r[2], ([''], ['T']))
+
+        header = lv.unpack(lv.unpack(_inp[0])[0])
+        self.assertEqual(header[4], '2')
+        statements = lv.unpack(lv.unpack(_inp[0])[1])
+        self.assertEqual(len(statements), 2)
+        self.assertIn('A = :C1', statements[1])
+        self.assertIn("/USING=(C1='y')", statements[1])
+        self.assertEqual(lv.unpack(lv.unpack(_inp[1])[0])[4], '1')
+
+        # rows that cannot be sent fail alone, in their own position
+        _out = [_group_reply([True, True])]
+        del _inp[:]
+        with patch('fispip.MTM.exchange_message', _fake_exchange):
+            r = self._pip.executemany(
+                'DELETE FROM T WHERE A = ?',
+                [('x',), ('x', 'y'), ('y' * 2 * len(message),), ('z',)]
+            )
+
+        self.assertEqual(len(_inp), 1)
+        self.assertEqual(len(r), 4)
+        self.assertEqual(r[0], ([''], ['T']))
+        self.assertEqual(r[1].args[0], 'VAL_ERROR')
+        self.assertEqual(
+            r[2].args, ('MTM_ERROR', 'Statement does not fit in a frame')
+        )
+        self.assertEqual(r[3], ([''], ['T']))
+
+        with self.assertRaises(Exception) as cm:
+            self._pip.executemany('SELECT A FROM T WHERE B = ?', [('x',)])
+        self.assertEqual(cm.exception.args[0], 'VAL_ERROR')
+
+    def test_pipeline(self):
+        self.test_connect()
+
+        _out = [
+            # MRPC
+            '0\x01\x08'
+            '\x020\x05'
+            'leet',
+            # OPEN CURSOR
+            '0\x01\x0f'
+            '\x020\x0c'
+            '\x01' ''
+            '\x01' ''
+            '\x02' '1'
+            '\x04' 'val'
+            '\x01' ''
+            '\x02' 'T',
+            # CLOSE
+            '0\x01\x0f'
+            '\x020\x01',
+            # MRPC error
+            '0\x01\x11'
+            '\x021\x0e\x01\x01\x04ERR\x01\x06error',
+        ]
+        _inp = []
+
+        with patch('fispip.MTM.send_message', _inp.append):
+            with patch('fispip.MTM.read_message', lambda s: _out.pop(0)):
+                p = self._pip.pipeline(window=2)
+                p.executeMRPC('1337')
+                p.executeSQL('SELECT col FROM table')
+                p.executeMRPC('1337')
+                self.assertEqual(len(p), 3)
+                r = p.execute()
+
+        # CLOSE reply is consumed but not returned
+        self.assertEqual(len(_inp), 4)
+        self.assertEqual(r[0], 'leet')
+        self.assertEqual(r[1], (['val'], ['T']))
+        self.assertEqual(r[2].args, ('ERR', 'error'))
+        self.assertEqual(self._pip._msgid, 5)
+
+    def test_pipeline_msgid(self):
+        self.test_connect()
+
+        def _reply(msgid, value):
+            header = self._pip._pack_lv(['3', 'abc', msgid, '0', ''])
+            body = self._pip._pack_lv(['0', value])
+            return '0' + self._pip._pack_lv([header, body])
+
+        # replies arrive out of order but echo the msg_id
+        _out = [_reply('2', 'second'), _reply('1', 'first')]
+
+        with patch('fispip.MTM.send_message'):
+            with patch('fispip.MTM.read_message', lambda s: _out.pop(0)):
+                p = self._pip.pipeline()
+                p.executeMRPC('1')
+                p.executeMRPC('2')
+                r = p.execute()
+
+        self.assertEqual(r, ['first', 'second'])
+
+    def test_cursor(self):
+        self.test_connect()
+
+        _out = [
+            _sql_reply(['r1', 'r2']),
+            _sql_reply(['r3', 'r4']),
+            _sql_reply(['r5']),
+            # CLOSE
+            _sql_reply([]),
+        ]
+        _inp = []
+
+        def _fake_exchange(*args):
+            _inp.append(args[1])
+            return _out.pop(0)
+
+        with patch('fispip.MTM.exchange_message', _fake_exchange):
+            cursor = self._pip.cursor('SELECT col FROM table', batch_size=2)
+            self.assertEqual(cursor.types, ['T'])
+            self.assertEqual(len(_inp), 1)
+            self.assertEqual(cursor.fetchmany(3), ['r1', 'r2', 'r3'])
+            self.assertEqual(len(_inp), 2)
+            self.assertEqual(list(cursor), ['r4', 'r5'])
+            self.assertIsNone(cursor.fetchone())
+
+        self.assertIn('/ROWS=2', _inp[0])
+        self.assertRegexpMatches(_inp[1], 'FETCH \\d{10}\x08/ROWS=2')
+        # closed right after the last batch
+        self.assertRegexpMatches(_inp[3], 'CLOSE \\d{10}')
+        self.assertEqual(len(_inp), 4)
+
+    def test_cursor_gc(self):
+        self.test_connect()
+
+        _inp = []
+
+        def _fake_exchange(*args):
+            _inp.append(args[1])
+            return _sql_reply(['r1', 'r2'])
+
+        with patch('fispip.MTM.exchange_message', _fake_exchange):
+            cursor = self._pip.cursor('SELECT col FROM table', batch_size=2)
+            self.assertEqual(cursor.fetchone(), 'r1')
+            del cursor
+            self.assertEqual(len(_inp), 1)
+            self._pip.executeMRPC('1')
+
+        self.assertRegexpMatches(_inp[1], 'CLOSE \\d{10}')
+        self.assertIn('1', _inp[2])
+
+        with self.assertRaises(Exception) as cm:
+            self._pip.cursor('UPDATE table SET col = 1')
+        self.assertEqual(cm.exception.args[0], 'VAL_ERROR')
+
+        # describe failing in the constructor leaves nothing for __del__
+        unraisable = []
+        with patch.object(sys, 'unraisablehook', unraisable.append,
+                          create=True):
+            with self.assertRaises(Exception) as cm:
+                self._pip.cursor('UPDATE table SET col = 1', named=True)
+            self.assertEqual(cm.exception.args[0], 'VAL_ERROR')
+            del cm
+            gc.collect()
+        self.assertEqual(unraisable, [])
+
+
 if __name__ == '__main__':
     unittest.main()
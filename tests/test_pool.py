@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+import socket
+import threading
+import time
+import unittest
+from mock import patch, MagicMock
+from fispip.pool import PIPPool
+
+
+class PIPPoolTest(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('fispip.pool.PIP', side_effect=lambda *a: MagicMock(
+            _unusable=None
+        ))
+        self._pip_class = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_prefill_and_reuse(self):
+        pool = PIPPool('wtv', 1337, 'user', 'pass', min_size=2, max_size=3)
+        self.assertEqual(self._pip_class.call_count, 2)
+
+        with pool.connection() as pip:
+            pip.connect.assert_called_once_with('wtv', 1337, 'user', 'pass')
+            first = pip
+        with pool.connection() as pip:
+            # most recently used session is handed out first
+            self.assertIs(pip, first)
+        self.assertEqual(self._pip_class.call_count, 2)
+
+        pool.close()
+        first.close.assert_called_once_with()
+
+    def test_exhausted(self):
+        pool = PIPPool('wtv', 1337, 'user', 'pass', max_size=1, timeout=0.05)
+        pip = pool.acquire()
+        with self.assertRaises(Exception) as cm:
+            pool.acquire()
+        self.assertEqual(
+            cm.exception.args,
+            ('POOL_TIMEOUT', 'No session available in 0.05s')
+        )
+        with self.assertRaises(Exception) as cm:
+            pool.acquire(timeout=0.01)
+        self.assertEqual(cm.exception.args[1], 'No session available in 0.01s')
+
+        # blocked checkout is served as soon as the session is checked in
+        t = threading.Timer(0.05, pool.release, (pip,))
+        t.start()
+        self.assertIs(pool.acquire(timeout=5), pip)
+        t.join()
+
+    def test_refill(self):
+        pool = PIPPool('wtv', 1337, 'user', 'pass', min_size=2, max_size=3)
+        self.addCleanup(pool.close)
+        pip = pool.acquire()
+        pool.release(pip, discard=True)
+
+        # replaced in the background, back to min_size idle sessions
+        deadline = time.time() + 5
+        while len(pool._idle) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual((pool._size, len(pool._idle)), (2, 2))
+        self.assertEqual(self._pip_class.call_count, 3)
+        self.assertNotIn(pip, [p for p, _ in pool._idle])
+
+    def test_broken_sessions(self):
+        pool = PIPPool('wtv', 1337, 'user', 'pass', max_size=1)
+
+        with self.assertRaises(Exception):
+            with pool.connection() as pip:
+                raise Exception('ER_SV_INVLDSQL', 'bad query')
+        # server errors do not affect the session
+        self.assertFalse(pip.close.called)
+
+        with self.assertRaises(socket.error):
+            with pool.connection() as pip2:
+                raise socket.error('reset')
+        self.assertIs(pip, pip2)
+        pip.close.assert_called_once_with()
+
+        with pool.connection() as pip3:
+            self.assertIsNot(pip3, pip)
+
+        # timed out (or cancelled) call whose error the caller handled
+        with pool.connection() as pip4:
+            pip4._unusable = 'timeout'
+        pip4.close.assert_called_once_with()
+        with pool.connection() as pip5:
+            self.assertIsNot(pip5, pip4)
+
+    def test_probe_and_lifetime(self):
+        pool = PIPPool('wtv', 1337, 'user', 'pass', probe_after=0)
+        pip = pool.acquire()
+        pool.release(pip)
+
+        pip.executeSQL.side_effect = Exception('MTM_ERROR', 'gone')
+        pip2 = pool.acquire()
+        self.assertIsNot(pip2, pip)
+        pip.close.assert_called_once_with()
+        pool.release(pip2)
+
+        pool.probe_after = None
+        pool.max_lifetime = 0
+        self.assertIsNot(pool.acquire(), pip2)
+        pip2.close.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+import socket
+import unittest
+from mock import patch
+from fispip.router import Router
+
+
+class RouterTest(unittest.TestCase):
+    def setUp(self):
+        self._connected = []
+
+        def _fake_connect(pip, host, port, user, password):
+            if host in self._down:
+                raise socket.error('refused')
+            self._connected.append(host)
+            pip._token = 'abc'
+
+        self._down = set()
+        patcher = patch('fispip.PIP.connect', _fake_connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('fispip.MTM.close')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_round_robin(self):
+        router = Router(
+            [('a', 1, 2), ('b', 1, 1)], 'user', 'pass',
+            strategy='round_robin'
+        )
+        for _ in range(6):
+            router.connect()
+        self.assertEqual(self._connected, ['a', 'b', 'a', 'a', 'b', 'a'])
+
+    def test_least_outstanding(self):
+        router = Router([('a', 1), ('b', 1)], 'user', 'pass')
+        p1 = router.connect()
+        p2 = router.connect()
+        self.assertEqual(self._connected, ['a', 'b'])
+        p1.close()
+        # a now has fewer sessions
+        router.connect()
+        self.assertEqual(self._connected[-1], 'a')
+        self.assertEqual([s['sessions'] for s in router.stats()], [1, 1])
+
+        with patch('fispip.MTM.exchange_message', return_value='x'):
+            p2.exchange_message('3', 'msg')
+        stats = router.stats()[1]
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['outstanding'], 0)
+        self.assertIsNotNone(stats['ewma_time'])
+
+    def test_failover(self):
+        router = Router([('a', 1), ('b', 1)], 'user', 'pass', backoff=60)
+        self._down.add('a')
+        router.connect()
+        router.connect()
+        # a is in backoff after the first failure, so only tried once
+        self.assertEqual(self._connected, ['b', 'b'])
+        stats = router.stats()
+        self.assertFalse(stats[0]['up'])
+        self.assertTrue(stats[1]['up'])
+
+        # request failures also take endpoints out
+        pip = router.connect()
+        with patch(
+            'fispip.MTM.exchange_message',
+            side_effect=socket.error('reset')
+        ):
+            with self.assertRaises(socket.error):
+                pip.exchange_message('3', 'msg')
+        self.assertFalse(router.stats()[1]['up'])
+        self.assertEqual(router.stats()[1]['errors'], 1)
+
+        # everything down: still try, soonest to recover first
+        self._down.add('b')
+        with self.assertRaises(socket.error):
+            router.connect()
+
+    def test_pool(self):
+        router = Router([('a', 1), ('b', 1)], 'user', 'pass')
+        pool = router.pool(min_size=2, max_size=2)
+        self.assertEqual(sorted(self._connected), ['a', 'b'])
+        with pool.connection() as pip:
+            self.assertIn(pip.endpoint.host, ('a', 'b'))
+        pool.close()
+
+    def test_pipeline(self):
+        router = Router([('a', 1)], 'user', 'pass')
+        pip = router.connect()
+        endpoint = router.endpoints[0]
+        reply = '0\x01\x08\x020\x05leet'
+
+        with patch('fispip.MTM.send_message'), \
+                patch('fispip.MTM.read_message', return_value=reply):
+            p = pip.pipeline()
+            p.executeMRPC('1')
+            p.executeMRPC('2')
+            self.assertEqual(p.execute(), ['leet', 'leet'])
+        self.assertEqual((endpoint.requests, endpoint.outstanding), (2, 0))
+
+        with patch('fispip.MTM.send_message'), \
+                patch('fispip.MTM.read_message',
+                      side_effect=socket.error('reset')):
+            p = pip.pipeline()
+            p.executeMRPC('1')
+            with self.assertRaises(socket.error):
+                p.execute()
+        self.assertEqual(endpoint.outstanding, 0)
+        self.assertEqual((endpoint.errors, endpoint.failures), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
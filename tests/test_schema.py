@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+import unittest
+from mock import patch, MagicMock
+from fispip import PIP, lv, schema
+
+
+DICTIONARY = {
+    'DEP': (['CID\tN\t12\t0', 'BAL\t$\t18\t2', 'DESC\tT\t40\t'], ['T'] * 4),
+    'CIF': (['ACN\tN\t12\t0', 'NAM\tT\t40\t'], ['T'] * 4),
+}
+
+
+def _sql_reply(rows, types):
+    body = lv.pack_str(['', '', str(len(rows)), '\r\n'.join(rows), '', types])
+    return '0' + lv.pack_str(['', lv.pack_str(['0', body])])
+
+
+class _FakeCursor(object):
+    def __init__(self, rows):
+        self._rows = rows
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class SchemaTest(unittest.TestCase):
+    def setUp(self):
+        self._cache = schema.SchemaCache()
+        self._pip = MagicMock()
+        self._pip.cursor.side_effect = (
+            lambda query, table: _FakeCursor(DICTIONARY.get(table, ([],))[0])
+        )
+
+    def _describe(self, query, types=None):
+        return schema.describe(self._pip, query, types, self._cache)
+
+    def test_describe(self):
+        self.assertEqual(
+            self._describe('SELECT CID, bal FROM DEP WHERE CID=?'),
+            [
+                schema.Column('CID', 'N', 12, 0),
+                schema.Column('BAL', '$', 18, 2),
+            ]
+        )
+        self.assertEqual(
+            [c.name for c in self._describe('SELECT * FROM DEP')],
+            ['CID', 'BAL', 'DESC']
+        )
+        self.assertEqual(
+            self._describe(
+                'SELECT D.CID,NAM,COUNT(*),MAX(BAL,0) FROM DEP D,CIF',
+                ['N', 'T', 'N', '$']
+            )[1:],
+            [
+                schema.Column('NAM', 'T', 40, None),
+                schema.Column('COUNT(*)', 'N', None, None),
+                schema.Column('MAX(BAL,0)', '$', None, None),
+            ]
+        )
+        # one dictionary query per table
+        self.assertEqual(self._pip.cursor.call_count, 2)
+
+        self._cache.refresh('dep')
+        self._describe('SELECT CID FROM DEP')
+        self.assertEqual(self._pip.cursor.call_count, 3)
+
+    def test_errors(self):
+        with self.assertRaises(Exception) as cm:
+            self._describe('SELECT X FROM NOPE')
+        self.assertEqual(cm.exception.args[0], 'VAL_ERROR')
+        with self.assertRaises(Exception) as cm:
+            self._describe('UPDATE DEP SET BAL=0')
+        self.assertEqual(cm.exception.args[0], 'VAL_ERROR')
+
+    def test_row_type(self):
+        row_type = schema.row_type([
+            schema.Column('CID', 'N', 12, 0),
+            schema.Column('COUNT(*)', 'N', None, None),
+        ])
+        self.assertEqual(row_type._fields, ('CID', '_1'))
+        self.assertIs(row_type, schema.row_type([
+            schema.Column('CID', 'N', 12, 0),
+            schema.Column('COUNT(*)', 'N', None, None),
+        ]))
+
+    def test_execute_named(self):
+        pip = PIP('SCA$IBS')
+        pip._token = 'abc'
+        schema.schema_cache.refresh()
+        self.addCleanup(schema.schema_cache.refresh)
+
+        with patch('fispip.MTM.exchange_message', side_effect=[
+            # dictionary query and cursor close
+            _sql_reply(DICTIONARY['DEP'][0], 'TTTT'), '',
+            _sql_reply(['1\t10.50', '2\t3'], 'N$'), '',
+            _sql_reply(['1\t10.50'], 'N$'), '',
+        ]):
+            rows, types = pip.executeSQL(
+                'SELECT CID,BAL FROM DEP', named=True
+            )
+            self.assertEqual(rows[0].CID, '1')
+            self.assertEqual(rows[1].BAL, '3')
+
+            rows, _ = pip.executeSQL(
+                'SELECT CID,BAL FROM DEP', named=True, decode=True
+            )
+            self.assertEqual(rows[0].CID, 1)
+            self.assertEqual(str(rows[0].BAL), '10.50')
+
+    def test_large_table(self):
+        pip = PIP('SCA$IBS')
+        pip._token = 'abc'
+        schema.schema_cache.refresh()
+        self.addCleanup(schema.schema_cache.refresh)
+        dictionary = ['C%d\tN\t12\t0' % i for i in range(45)]
+
+        with patch('fispip.MTM.exchange_message', side_effect=[
+            # dictionary cursor: more columns than max_rows, then close
+            _sql_reply(dictionary[:30], 'TTTT'),
+            _sql_reply(dictionary[30:], 'TTTT'), '',
+        ]):
+            columns = pip.describe('SELECT * FROM BIG')
+        self.assertEqual(len(columns), 45)
+        self.assertEqual(columns[44], schema.Column('C44', 'N', 12, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
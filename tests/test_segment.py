@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+import unittest
+from mock import patch
+from fispip import PIP, lv, segment
+
+
+class SegmentTest(unittest.TestCase):
+    def test_split(self):
+        self.assertEqual(list(segment.split('abcdefg', 3)),
+                         ['abc', 'def', 'g'])
+        self.assertEqual(list(segment.split('', 3)), [])
+
+        encode = segment.decimal_codes()
+        self.assertEqual(
+            list(segment.split(b'\x01\x0a\xff', 6, encode)),
+            ['1|10|', '255|']
+        )
+
+        limits = [4, 2, 100]
+        self.assertEqual(
+            list(segment.split('abcdefg', lambda: limits.pop(0))),
+            ['abcd', 'ef', 'g']
+        )
+
+        # would never get through data
+        for args in (('abc', 0), ('abc', 0, encode), ('abc', lambda: -1)):
+            with self.assertRaises(Exception) as cm:
+                list(segment.split(*args))
+            self.assertEqual(cm.exception.args[0], 'VAL_ERROR')
+        # '255|' alone does not fit
+        with self.assertRaises(Exception) as cm:
+            list(segment.split(b'\x01\xff', 3, encode))
+        self.assertEqual(cm.exception.args[0], 'VAL_ERROR')
+
+    def test_collect(self):
+        pieces = [(True, 'ab'), (True, 'cd'), (False, 'e')]
+        self.assertEqual(segment.collect(lambda: pieces.pop(0)), 'abcde')
+
+    def test_arg_limit(self):
+        pip = PIP('SCA$IBS')
+        pip._token = 'abc'
+        args = ['INITCODE', None, 'token']
+        limit = pip.mrpc_arg_limit('121', args, 1)
+
+        # frame overhead is an upper bound (largest msg_id...)
+        for size, fits in ((limit, True), (limit + 32, False)):
+            args[1] = 'x' * size
+            frame = pip._frame('3', pip._mrpc_message('121', args))
+            self.assertEqual(
+                2 + len(pip._prefix) + len(frame) <= pip.max_frame, fits
+            )
+
+        pip.set_unsigned()
+        self.assertTrue(pip.mrpc_arg_limit('121', args, 1) > 0xfff0 - 100)
+
+    def test_send(self):
+        pip = PIP('SCA$IBS')
+        pip._token = 'abc'
+        sent = []
+
+        def _exchange(message):
+            sent.append(message)
+            token = 'T%d' % len(sent)
+            return '0' + lv.pack_str(
+                ['', lv.pack_str(['0', lv.pack_str([token])])]
+            )
+
+        with patch('fispip.MTM.exchange_message', side_effect=_exchange):
+            result = segment.send(
+                pip, '121', ['INITCODE', '', ''], 1, b'\xff' * 20000,
+                encode=segment.decimal_codes(),
+                update=lambda args, result: args[:2] + [result[0]],
+                success_unpack=True
+            )
+
+        # 80000 encoded bytes, in 3 frames instead of 20 (1024 bytes each)
+        self.assertEqual(len(sent), 3)
+        self.assertEqual(result, ['T3'])
+        self.assertTrue(all(len(m) <= pip.max_frame for m in sent))
+        self.assertTrue('\x03T1' in sent[1] and '\x03T2' in sent[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
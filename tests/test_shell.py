@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+import unittest
+from mock import MagicMock
+from fispip import metrics
+from fispip.shell import Shell
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class ShellTest(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(metrics.disable)
+        self._pip = MagicMock(max_rows=30)
+        self._rows = ['r%d' % i for i in range(5)]
+
+        def _fetchmany(size):
+            rows, self._rows[:size] = self._rows[:size], []
+            return rows
+        self._cursor = self._pip.cursor.return_value
+        self._cursor.fetchmany.side_effect = _fetchmany
+
+    def _run(self, commands):
+        out = StringIO()
+        Shell(self._pip, StringIO(commands), out).run()
+        return out.getvalue().splitlines()
+
+    def test_select(self):
+        lines = self._run('\\rows 2\n\\timing\nSELECT A FROM T;\n')
+        self.assertEqual(lines, [
+            'max_rows is 2',
+            'Timing is off',
+            'r0', 'r1', 'r2', 'r3', 'r4',
+            '(5 rows)',
+        ])
+        self._pip.cursor.assert_called_once_with(
+            'SELECT A FROM T', batch_size=2
+        )
+        self._cursor.close.assert_called_once_with()
+
+    def test_commands(self):
+        self._pip.executeMRPC.return_value = 'ok'
+        self._pip.executeSQL.side_effect = Exception('ER_SV_INVLDSQL', 'bad')
+        lines = self._run(
+            ':mrpc 155 "a b"\n'
+            'UPDATE T SET A=1\n'
+            '\\q\n'
+            ':mrpc 1\n'
+        )
+        self._pip.executeMRPC.assert_called_once_with('155', 'a b')
+        self.assertEqual(lines[0], 'ok')
+        self.assertTrue(lines[1].startswith('(') and 'ms' in lines[1])
+        self.assertEqual(lines[2], 'ERROR: ER_SV_INVLDSQL: bad')
+        # nothing after \q
+        self.assertEqual(len(lines), 4)
+
+    def test_bytes(self):
+        registry = metrics.enable()
+
+        def _execute(*args):
+            registry.sent(100)
+            registry.received(2048)
+            return 'ok'
+        self._pip.executeMRPC.side_effect = _execute
+
+        lines = self._run(':mrpc 1\n')
+        self.assertTrue(lines[1].endswith(', 100 B sent, 2.0 KB received)'))
+
+
+if __name__ == '__main__':
+    unittest.main()
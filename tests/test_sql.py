@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+import unittest
+from fispip import sql
+from fispip.cache import LRUCache
+
+
+class SQLTest(unittest.TestCase):
+    def test_compile_query(self):
+        self.assertEqual(
+            sql.compile_query('UPDATE CUVAR SET ICITY=? WHERE X = ?'),
+            ('UPDATE CUVAR SET ICITY=:C1 WHERE X = :C2', 2)
+        )
+        self.assertEqual(
+            sql.compile_query('INSERT INTO T (A,B) VALUES (?, ?)'),
+            ('INSERT INTO T (A,B) VALUES (:C1, :C2)', 2)
+        )
+        self.assertEqual(
+            sql.compile_query('SELECT A FROM T WHERE A IN (?) OR B LIKE ?'),
+            ('SELECT A FROM T WHERE A IN (:C1) OR B LIKE :C2', 2)
+        )
+        # markers inside quotes are left alone
+        self.assertEqual(
+            sql.compile_query(
+                'SELECT A FROM T WHERE A = \'?\' AND B = \'it\'\'s ?\' '
+                'AND "C?" = ?'
+            ),
+            (
+                'SELECT A FROM T WHERE A = \'?\' AND B = \'it\'\'s ?\' '
+                'AND "C?" = :C1',
+                1
+            )
+        )
+        self.assertEqual(sql.compile_query('SELECT \'?'), ('SELECT \'?', 0))
+
+    def test_statement_cache(self):
+        sql.statement_cache.clear()
+        hits = sql.statement_cache.hits
+        sql.compile_query('SELECT A FROM T WHERE B = ?')
+        self.assertEqual(sql.statement_cache.hits, hits)
+        sql.compile_query('SELECT A FROM T WHERE B = ?')
+        self.assertEqual(sql.statement_cache.hits, hits + 1)
+
+    def test_lru(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        # b was the least recently used
+        self.assertNotIn('b', cache)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
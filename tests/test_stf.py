@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+import contextlib
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+from mock import patch, MagicMock
+from fispip import PIP
+from fispip.stf import StoreAndForward
+
+
+class _FakePool(object):
+    def __init__(self, replies):
+        self.pip = PIP()
+        self.pip.exchange_message = MagicMock(side_effect=replies)
+
+    @contextlib.contextmanager
+    def connection(self):
+        yield self.pip
+
+
+OK_REPLY = '0\x01\x08\x020\x05leet'
+ERR_REPLY = '0\x01\x11\x021\x0e\x01\x01\x04ERR\x01\x06error'
+
+
+class StoreAndForwardTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'journal')
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_submit(self):
+        pool = _FakePool([OK_REPLY, ERR_REPLY])
+        stf = StoreAndForward(pool)
+        t1 = stf.submit_mrpc('901', 'a', 'b')
+        t2 = stf.submit_sql('UPDATE T SET A = ?', 1)
+        self.assertTrue(stf.flush(5))
+        stf.close()
+
+        self.assertEqual(stf.status(t1), 'delivered')
+        self.assertEqual(stf.result(t1), 'leet')
+        self.assertEqual(stf.status(t2), 'failed')
+        with self.assertRaises(Exception) as cm:
+            stf.result(t2)
+        self.assertEqual(cm.exception.args, ('ERR', 'error'))
+        self.assertIsNone(stf.status('unknown'))
+
+        calls = pool.pip.exchange_message.call_args_list
+        self.assertEqual(calls[0][0][0], '3')
+        self.assertEqual(calls[0][1], {'stf_flg': '1'})
+        self.assertIn(':C1', calls[1][0][1])
+
+        with self.assertRaises(Exception):
+            stf.submit_sql('SELECT A FROM T')
+
+    def test_retry(self):
+        pool = _FakePool([socket.error('reset'), OK_REPLY])
+        stf = StoreAndForward(pool, retry_delay=0.01)
+        ticket = stf.submit_mrpc('901')
+        self.assertTrue(stf.flush(5))
+        stf.close()
+        self.assertEqual(stf.result(ticket), 'leet')
+        self.assertEqual(pool.pip.exchange_message.call_count, 2)
+
+    def test_unsendable(self):
+        pool = _FakePool([OK_REPLY])
+        stf = StoreAndForward(pool, retry_delay=0.01)
+        t1 = stf.submit_mrpc('901', 'x' * 40000)
+        t2 = stf.submit_mrpc('901')
+        self.assertTrue(stf.flush(5))
+        stf.close()
+        self.assertEqual(stf.status(t1), 'failed')
+        with self.assertRaises(Exception) as cm:
+            stf.result(t1)
+        self.assertEqual(cm.exception.args[0], 'MTM_ERROR')
+        self.assertEqual(stf.result(t2), 'leet')
+        self.assertEqual(pool.pip.exchange_message.call_count, 1)
+
+    def test_max_retries(self):
+        pool = _FakePool([socket.error('reset')] * 3 + [OK_REPLY])
+        stf = StoreAndForward(pool, retry_delay=0.01, max_retries=2)
+        t1 = stf.submit_mrpc('901')
+        t2 = stf.submit_mrpc('901')
+        self.assertTrue(stf.flush(5))
+        stf.close()
+        self.assertEqual(stf.status(t1), 'failed')
+        with self.assertRaises(socket.error):
+            stf.result(t1)
+        self.assertEqual(stf.result(t2), 'leet')
+
+    def test_journal(self):
+        # server down: requests stay queued and journaled
+        pool = _FakePool(socket.error('down'))
+        stf = StoreAndForward(pool, path=self._path, retry_delay=0.01)
+        t1 = stf.submit_mrpc('901', 'a')
+        t2 = stf.submit_mrpc('901', 'b')
+        self.assertFalse(stf.flush(0.05))
+        stf.close(0)
+        self.assertEqual(stf.status(t1), 'pending')
+
+        # picked up by the next instance
+        pool = _FakePool([OK_REPLY, OK_REPLY])
+        stf = StoreAndForward(pool, path=self._path)
+        self.assertTrue(stf.flush(5))
+        stf.close()
+        self.assertEqual(stf.status(t1), 'delivered')
+        self.assertEqual(stf.status(t2), 'delivered')
+        self.assertEqual(
+            pool.pip.exchange_message.call_args_list[1][0][1],
+            pool.pip._mrpc_message('901', ['b'], '1')
+        )
+        with open(self._path) as f:
+            self.assertEqual(f.read(), '')
+        self.assertFalse(os.path.exists(self._path + '.tmp'))
+
+    def test_journal_compaction(self):
+        journal = (
+            '["+", "t1", "3", ["901", ["a"], "1"]]\n'
+            '["+", "t2", "3", ["901", ["b"], "1"]]\n'
+            '["-", "t1"]\n'
+        )
+        with open(self._path, 'w') as f:
+            f.write(journal)
+
+        # failing before the rename leaves the journal as it was
+        pool = _FakePool(socket.error('down'))
+        with patch('os.fsync', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                StoreAndForward(pool, path=self._path)
+        with open(self._path) as f:
+            self.assertEqual(f.read(), journal)
+
+        stf = StoreAndForward(pool, path=self._path, retry_delay=0.01)
+        stf.close(0)
+        with open(self._path) as f:
+            self.assertEqual(
+                f.read(), '["+", "t2", "3", ["901", ["b"], "1"]]\n'
+            )
+        self.assertEqual(stf.status('t2'), 'pending')
+
+
+if __name__ == '__main__':
+    unittest.main()
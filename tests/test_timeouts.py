@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+import socket
+import threading
+import time
+import unittest
+from fispip import MTM, PIP, metrics, timeouts
+
+
+class DeadlineTest(unittest.TestCase):
+    def test_nested(self):
+        self.assertIsNone(timeouts.remaining())
+        with timeouts.deadline(5):
+            self.assertTrue(4 < timeouts.remaining() <= 5)
+            with timeouts.deadline(1):
+                self.assertTrue(0 < timeouts.remaining() <= 1)
+            # inner deadlines cannot extend the outer one
+            with timeouts.deadline(60):
+                self.assertTrue(timeouts.remaining() <= 5)
+            with timeouts.deadline(None):
+                self.assertTrue(timeouts.remaining() <= 5)
+        self.assertIsNone(timeouts.remaining())
+
+
+class MTMTimeoutTest(unittest.TestCase):
+    def setUp(self):
+        # accepts connections, never replies
+        self._listener = socket.socket()
+        self._listener.bind(('127.0.0.1', 0))
+        self._listener.listen(1)
+        self.addCleanup(self._listener.close)
+        self._mtm = MTM()
+        self._mtm.connect('127.0.0.1', self._listener.getsockname()[1])
+        self.addCleanup(self._mtm.close)
+
+    def _assert_unusable(self):
+        with self.assertRaises(Exception) as cm:
+            self._mtm.exchange_message('echo 456')
+        self.assertEqual(cm.exception.args[0], 'MTM_ERROR')
+
+    def test_deadline(self):
+        start = time.time()
+        with self.assertRaises(timeouts.MTMTimeout) as cm:
+            with timeouts.deadline(0.05):
+                self._mtm.exchange_message('echo 123')
+        self.assertEqual(cm.exception.args[0], 'MTM_TIMEOUT')
+        self.assertTrue(time.time() - start < 1)
+        self._assert_unusable()
+
+    def test_connection_timeout(self):
+        self._mtm.timeout = 0.05
+        with self.assertRaises(timeouts.MTMTimeout):
+            self._mtm.exchange_message('echo 123')
+        self._assert_unusable()
+
+    def test_cancel(self):
+        t = threading.Timer(0.05, self._mtm.cancel)
+        t.start()
+        with self.assertRaises(Exception) as cm:
+            self._mtm.exchange_message('echo 123')
+        t.join()
+        self.assertEqual(cm.exception.args[0], 'MTM_ERROR')
+        self._assert_unusable()
+
+    def test_pipeline(self):
+        # bypasses exchange_message, still bound by the session timeout
+        pip = PIP()
+        MTM.connect(pip, '127.0.0.1', self._listener.getsockname()[1])
+        self.addCleanup(pip.close)
+        pip._token = 'abc'
+        pip.timeout = 0.05
+        registry = metrics.enable()
+        self.addCleanup(metrics.disable)
+
+        p = pip.pipeline()
+        p.executeMRPC('155', 'X')
+        p.executeMRPC('155', 'Y')
+        start = time.time()
+        with self.assertRaises(timeouts.MTMTimeout):
+            p.execute()
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual(pip._unusable, 'timeout')
+        self.assertEqual(registry.value(
+            'fispip_requests_total', (('service', 'MRPC'),)
+        ), 2)
+        self.assertEqual(registry.value(
+            'fispip_errors_total', (('code', 'MTM_TIMEOUT'),)
+        ), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
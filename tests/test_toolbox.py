@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+import itertools
+import threading
+import unittest
+from mock import patch, MagicMock
+from fispip import PIP, toolbox
+from fispip.pool import PIPPool
+
+
+class _FakeMRPC121(object):
+    """
+    executeMRPC standing in for MRPC121, storing elements in a dict
+    """
+    def __init__(self, elements):
+        self.elements = elements
+        self.calls = []
+        self._uploads = {}
+        self._downloads = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+
+    def __call__(self, mrpc_id, *args, **kwargs):
+        with self._lock:
+            self.calls.append(args[0])
+            return [getattr(self, args[0].lower())(*args[1:])]
+
+    def initobj(self, _1, _2, _3, obj_type, obj_id):
+        if obj_id not in self.elements:
+            return '0|\nInvalid name - %s' % obj_id
+        token = 'T%d' % next(self._ids)
+        code = self.elements[obj_id]
+        # 4 characters per RETOBJ
+        self._downloads[token] = [
+            code[i:i + 4] for i in range(0, len(code), 4)
+        ]
+        return '1\r\n%s\r\n%s' % (token, obj_id)
+
+    def retobj(self, _1, _2, _3, _4, _5, token):
+        pieces = self._downloads[token]
+        piece = pieces.pop(0) if pieces else ''
+        return ('1' if pieces else '0') + piece
+
+    def initcode(self, code, token):
+        token = token or 'C%d' % next(self._ids)
+        self._uploads.setdefault(token, []).append(code)
+        return token
+
+    def checkobj(self, _1, _2, local_file, _4, _5, token):
+        return '1'
+
+    def saveobj(self, _1, _2, local_file, _4, _5, token, username):
+        code = bytearray(
+            int(b) for b in ''.join(self._uploads.pop(token)).split('|') if b
+        )
+        self.elements[toolbox.guess_type(local_file)[1]] = bytes(code)
+        return '1'
+
+
+class ToolboxTest(unittest.TestCase):
+    def test_guess_type(self):
+        self.assertEqual(
+            toolbox.guess_type('dir/MRPC121.PROC'), ('Procedure', 'MRPC121')
+        )
+        self.assertEqual(toolbox.guess_type('X.dat'), ('Data', 'X'))
+        self.assertEqual(toolbox.guess_type('X.ZZZ'), ('', 'X'))
+
+    def test_get_send(self):
+        pip = PIP('SCA$IBS')
+        pip._token = 'abc'
+        fake = _FakeMRPC121({'MRPC121': 'public void MRPC121()'})
+        tbx = toolbox.Toolbox(pip, 'tester')
+
+        with patch.object(pip, 'executeMRPC', side_effect=fake):
+            self.assertEqual(
+                tbx.get_element_by_name('MRPC121.PROC'),
+                'public void MRPC121()'
+            )
+            self.assertEqual(fake.calls.count('RETOBJ'), 6)
+
+            with self.assertRaises(Exception) as cm:
+                tbx.get_element_by_name('NOPE.PROC')
+            self.assertEqual(
+                cm.exception.args, ('TBX_ERROR', 'Invalid name - NOPE')
+            )
+
+            del fake.calls[:]
+            code = bytes(bytearray(range(256))) * 100
+            tbx.send_element('path/BIG.PROC', code)
+            self.assertEqual(fake.elements['BIG'], code)
+            # 25600 bytes, up to 4 characters each, in as few INITCODE
+            # calls as 32KB frames allow, plus the final one
+            self.assertEqual(fake.calls.count('INITCODE'), 4)
+
+            tbx.send_element('EMPTY.DAT', b'')
+            self.assertEqual(fake.elements['EMPTY'], b'')
+
+        with self.assertRaises(Exception) as cm:
+            tbx.compile_and_link('X.DAT')
+        self.assertEqual(cm.exception.args[0], 'VAL_ERROR')
+
+    def test_pool(self):
+        elements = {'A': 'code a', 'B': 'code b'}
+        fake = _FakeMRPC121(elements)
+
+        def _connect():
+            pip = PIP('SCA$IBS')
+            pip._token = 'abc'
+            pip.executeMRPC = fake
+            return pip
+
+        with patch('fispip.pool.PIP', side_effect=lambda *a: MagicMock()):
+            pool = PIPPool('wtv', 1337, 'user', 'pass', min_size=0,
+                           max_size=3)
+        self.addCleanup(pool.close)
+
+        with patch.object(pool, 'connect', side_effect=_connect):
+            results = dict(toolbox.get_elements(
+                pool, ['A.PROC', 'B.DAT', 'C.PROC']
+            ))
+            self.assertEqual(results['A.PROC'], 'code a')
+            self.assertEqual(results['B.DAT'], 'code b')
+            self.assertEqual(results['C.PROC'].args[0], 'TBX_ERROR')
+
+            results = dict(toolbox.send_elements(
+                pool, [('D.PROC', b'code d'), ('E.DAT', 'code e')],
+                username='tester'
+            ))
+            self.assertEqual(results, {'D.PROC': None, 'E.DAT': None})
+            self.assertEqual(elements['D'], b'code d')
+            self.assertEqual(elements['E'], b'code e')
+
+
+if __name__ == '__main__':
+    unittest.main()